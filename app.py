@@ -1,24 +1,15 @@
 import streamlit as st
 import streamlit_ext as ste
 import pandas as pd
+import numpy as np
 import folium
-from polyline import decode
-from geopy.distance import geodesic
-import re
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl import Workbook
-from openpyxl.utils import get_column_letter
-import requests
 from streamlit_folium import st_folium
-import io
 import plotly.express as px
 import matplotlib.pyplot as plt
-import geopandas as gpd
-from shapely.geometry import Point
 from folium.plugins import Search
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import streamlit.components.v1 as components
 import time
+import hashlib
 
 # --- Selenium webscraper imports ---
 from selenium import webdriver
@@ -31,31 +22,48 @@ from pathlib import Path
 import tempfile
 import os
 
+from excel_export import build_results_workbook
+from results_bundle import load_results_bundle, save_results_bundle
+from run_checkpoint import CHECKPOINT_DIR, RunCheckpoint, hash_analysis_inputs, prune_checkpoints
+from route_cache import RouteCache, make_route_key, make_route_keys
+from route_deck import build_route_deck, group_label
+from route_plan import plan_site_routes
+from route_geometry import (
+    DISPLAY_TOLERANCE_M, GEOMETRY_STORE_DIR, SCREEN_MIN_SHARE, RouteGeometryStore, StreamingPoiMatcher,
+    aggregate_segments, chain_segments, closest_approach, decode_coords, estimate_screened_share, match_matrix,
+    poi_labels, prune_geometry_stores, screen_routes, simplify_coords, stack_coords
+)
+from tts_parser import od_totals_by_period, parse_tts_export
+from zone_data import load_display_polygons, load_zone_centroids, load_zone_polygons
+from zone_index import ZoneIndex
+from routing import NO_ROUTE_STATUSES, backend_from_env, summarize_timings
+
 @st.cache_data(show_spinner="Loading zone data...")
 def load_zones_data(data_choice):
     """Load zones data based on selected year"""
-    if data_choice == "2006 Zones":
-        zones_df = pd.read_csv('2006Zones.csv')
-        zone_col = 'gta06'
-        region_col = 'region'
-    else:
-        zones_df = pd.read_csv('2022Zones.csv')
-        zone_col = 'TTS2022'
-        region_col = 'Reg_name'
-    return zones_df, zone_col, region_col
+    return load_zone_centroids(data_choice)
 
 @st.cache_data(show_spinner="Loading polygons data...")
 def load_geojson_data(data_choice):
-    """Load GeoJSON data based on selected year"""
-    if data_choice == "2006 Zones":
-        file_path = "2006Polygons.geojson"
-    else:
-        file_path = "2022Polygons.geojson"
-        
-    gdf = gpd.read_file(file_path)
-    if gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
-    return gdf
+    """Load zone polygons based on selected year (see zone_data.py)"""
+    return load_zone_polygons(data_choice)
+
+@st.cache_resource(show_spinner="Indexing zone polygons...")
+def get_zone_index(data_choice):
+    """Build the polygon index (see zone_index.py) for a zone system, once per process"""
+    _, zone_col, region_col = load_zones_data(data_choice)
+    return ZoneIndex(load_geojson_data(data_choice), zone_col, region_col,
+                     display_gdf=load_display_polygons(data_choice))
+
+@st.cache_resource
+def get_route_cache():
+    """Open the on-disk route cache shared by every session in this process"""
+    return RouteCache()
+
+@st.cache_resource
+def get_routing_backend():
+    """Create the routing backend (see routing.py) shared by every session in this process"""
+    return backend_from_env()
 
 
 # --- TTS Portal webscraper ------------------------------------------------
@@ -70,6 +78,8 @@ def run_webscraper(site_zones, time_periods, data_choice, custom_time=None, head
     """
     Runs the TTS portal query for each requested time period and returns
     the concatenated raw text content as a single string, or None on failure.
+    Each period's export keeps its own header and filters, which is how
+    parse_tts_export tells the periods apart again.
     """
     chrome_options = webdriver.ChromeOptions()
     chrome_options.add_argument("--start-maximized")
@@ -305,6 +315,11 @@ if 'processing_started' not in st.session_state:
 if 'results_df' not in st.session_state:
     st.session_state.results_df = None
 
+# Bumped whenever results_df is replaced (a new analysis, a retry of failed
+# routes, a loaded bundle), so everything built from it knows to rebuild
+if 'results_version' not in st.session_state:
+    st.session_state.results_version = 0
+
 # Initialize rows if not in session_state
 if "rows" not in st.session_state:
     st.session_state.rows = [{"id": 0, "name": "", "coords": "", "threshold": 50}]
@@ -319,6 +334,44 @@ if "site_zones_val" not in st.session_state:
 if "fetched_tts_content" not in st.session_state:
     st.session_state["fetched_tts_content"] = None
 
+# A results bundle loaded on the previous run (see "Load saved results")
+# restores its inputs here, before the widgets showing them are created, so
+# the results section finds matching inputs and shows the stored results
+if st.session_state.get("loaded_bundle") is not None:
+    bundle = st.session_state.pop("loaded_bundle")
+    inputs = bundle['metadata']
+    st.session_state["data_choice"] = inputs['data_choice']
+    st.session_state["site_coords"] = (f"{inputs['site_lat']}, {inputs['site_lon']}"
+                                       if inputs['site_lat'] is not None else "")
+    st.session_state["site_zones_val"] = list(inputs['site_zones'])
+    st.session_state.pois = []
+    st.session_state.rows = []
+    for poi in inputs['pois']:
+        st.session_state.rows.append({
+            "id": st.session_state.row_id_counter,
+            "name": poi['name'],
+            "coords": f"{poi['coordinates'][0]}, {poi['coordinates'][1]}",
+            "threshold": int(round(poi['threshold'] * 1000))
+        })
+        st.session_state.row_id_counter += 1
+        st.session_state.pois.append({
+            'id': f"POI_{len(st.session_state.pois) + 1}",
+            'name': poi['name'],
+            'coordinates': tuple(poi['coordinates']),
+            'threshold': poi['threshold']
+        })
+    st.session_state["fetched_tts_content"] = bundle['content']
+
+    loaded_zones_df = load_zones_data(inputs['data_choice'])[0]
+    loaded_zone_col = 'GTA06' if inputs['data_choice'] == "2006 Zones" else 'TTS2022'
+    st.session_state.zone_lookup = loaded_zones_df.set_index(loaded_zone_col)[['Latitude', 'Longitude']].to_dict('index')
+    st.session_state.route_run = bundle['run']
+    st.session_state.results_df = bundle['results_df']
+    st.session_state.results_key = inputs['results_key']
+    st.session_state.results_version += 1
+    st.session_state.pop('route_timings', None)
+    st.session_state.processing_started = True
+
 FOLIUM_TO_CSS = {
     'blue': '#4169E1',
     'red': '#DC143C',
@@ -332,13 +385,48 @@ FOLIUM_TO_CSS = {
     'darkgreen': '#006400',
 }
 
+# Route maps with more segments and zone markers than this default to the
+# WebGL renderer
+LARGE_ROUTE_MAP_FEATURES = 5000
+
+# Screen routes by length before fetching their geometry, on backends that
+# support it: "auto" (default) screens when the routes' straight-line
+# distances suggest it will rule out enough of them to pay for the extra
+# length requests, 1 always screens and 0 never does
+SCREEN_ROUTES = os.environ.get("TTS_SCREEN_ROUTES", "auto").lower()
+
+# Fetched routes are written to the route cache and the run's checkpoint
+# after this many results or seconds, whichever comes first
+CHECKPOINT_EVERY_ROUTES = 200
+CHECKPOINT_EVERY_SECONDS = 5.0
+
 POI_COLOURS = ['blue', 'red', 'green', 'purple', 'orange', 'darkred',
                'lightred', 'beige', 'darkblue', 'darkgreen']
 
-poi_colour_map = {
-    poi['name']: POI_COLOURS[i % len(POI_COLOURS)]
-    for i, poi in enumerate(st.session_state.pois)
-}
+def build_poi_pie(summary, title):
+    """Pie chart of traffic share per POI from a Series of totals indexed by POI label"""
+    percentages = (summary / summary.sum() * 100).round(1)
+    fig = px.pie(
+        values=percentages.values,
+        names=percentages.index,
+        custom_data=[summary.values],
+        title=title,
+        color=percentages.index,
+        color_discrete_map={name: FOLIUM_TO_CSS.get(poi_colour_map.get(name, 'gray'), '#808080')
+                            for name in percentages.index}
+    )
+    fig.update_traces(
+        textposition='inside',
+        hovertemplate="<b>%{label}</b><br>" +
+                      "Percentage: %{percent}<br>" +
+                      "Total Traffic: %{customdata[0]}<extra></extra>"
+    )
+    fig.update_layout(
+        showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=1),
+        height=400
+    )
+    return fig
 
 # Title and description
 st.title("TTS Route Analysis Tool")
@@ -353,11 +441,12 @@ data_choice = st.radio(
     "Select Data Year:",
     options=["2006 Zones", "2022 Zones"],
     horizontal=True,
-    index=None)
+    index=None,
+    key="data_choice")
 
 if data_choice:
     zones_df, zone_col, region_col = load_zones_data(data_choice)
-    gdf = load_geojson_data(data_choice)
+    zone_index = get_zone_index(data_choice)
 else:
     st.warning("Please select a data year")
 
@@ -380,8 +469,8 @@ with col1:
 with col2:
     coords_input = st.text_input(
         "Site Coordinates (Latitude, Longitude)",
-        value="",
-        help="Enter coordinates in format: latitude, longitude"
+        help="Enter coordinates in format: latitude, longitude",
+        key="site_coords"
     )
 
 if coords_input.strip():  # Only validate if coordinates are provided
@@ -398,16 +487,11 @@ else:
 
 ## Site Zone Matching
 
+suggested_zone = None
 if site_lon and data_choice:
-    point = Point(site_lon, site_lat)
-    matching_polygon = gdf[gdf.contains(point)]
+    suggested_zone = zone_index.zone_at(site_lat, site_lon)
 
-    if not matching_polygon.empty:
-        if data_choice == "2006 Zones":
-            suggested_zone = matching_polygon.iloc[0]['gta06']
-        else:
-            suggested_zone = matching_polygon.iloc[0]['TTS2022']
-        
+    if suggested_zone is not None:
         st.write(f"Recommended zone based on coordinates: {suggested_zone}")
         
         if st.button("➕ Add as Site Zone"):
@@ -521,6 +605,24 @@ for i, row in enumerate(st.session_state.rows):
         except ValueError:
             st.error(f"Invalid coordinates format in row {i + 1}")
 
+# Built from this run's POIs, so the charts and maps below never look up a
+# POI the map doesn't have yet
+poi_colour_map = {
+    poi['name']: POI_COLOURS[i % len(POI_COLOURS)]
+    for i, poi in enumerate(st.session_state.pois)
+}
+
+# Look up the zone of every POI in one batch query
+if data_choice and st.session_state.pois:
+    poi_zones = zone_index.zones_at(
+        [poi['coordinates'][0] for poi in st.session_state.pois],
+        [poi['coordinates'][1] for poi in st.session_state.pois]
+    )
+    st.caption("POI zones: " + ", ".join(
+        f"{poi['name']} → {zone if zone is not None else 'outside all zones'}"
+        for poi, zone in zip(st.session_state.pois, poi_zones)
+    ))
+
 # After the site coordinates input section, add the map visualization
 if valid_coords:
     try:          
@@ -584,21 +686,14 @@ if valid_coords:
 
             selectedzone_layer = folium.FeatureGroup(name="Selected Zones", show=True)
             for site_zone in site_zones:
-                if site_zone == suggested_zone:
-                    for _, row in matching_polygon.iterrows():
-                        folium.GeoJson(
-                            row.geometry,
-                            style_function=style_function,
-                            tooltip=f"{zone_col}: {row[zone_col]}, Region: {row[region_col]}"
-                        ).add_to(selectedzone_layer)
-                else:
-                    for _, row in gdf.iterrows():
-                        if row[zone_col] == site_zone:
-                            folium.GeoJson(
-                                row.geometry,
-                                style_function=highlight_style_function,
-                                tooltip=f"{zone_col}: {row[zone_col]}, Region: {row[region_col]}"
-                            ).add_to(selectedzone_layer)
+                zone_geometry = zone_index.geometry(site_zone, display=True)
+                if zone_geometry is None:
+                    continue
+                folium.GeoJson(
+                    zone_geometry,
+                    style_function=style_function if site_zone == suggested_zone else highlight_style_function,
+                    tooltip=f"{zone_col}: {site_zone}, Region: {zone_index.region(site_zone)}"
+                ).add_to(selectedzone_layer)
                 
 
 
@@ -686,6 +781,20 @@ with st.expander("🌐 Or fetch directly from the TTS Portal"):
             st.session_state["fetched_tts_content"] = None
             st.rerun()
 
+with st.expander("📂 Or load saved results"):
+    bundle_file = st.file_uploader(
+        "Results bundle (.zip) downloaded from an earlier analysis",
+        type=['zip'],
+        key="results_bundle_file"
+    )
+    if bundle_file is not None and st.button("Load Results", key="load_results_button"):
+        try:
+            st.session_state["loaded_bundle"] = load_results_bundle(bundle_file)
+        except (KeyError, ValueError, OSError) as e:
+            st.error(f"Could not read the results bundle: {e}")
+        else:
+            st.rerun()
+
 
 def get_tts_content():
     """
@@ -700,6 +809,37 @@ def get_tts_content():
     return None
 
 
+def hash_results(results_df):
+    """Hash of a results frame's contents, row for row"""
+    return hashlib.sha256(pd.util.hash_pandas_object(results_df, index=False).to_numpy().tobytes()).hexdigest()
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def cached_download(export_key, results_hash, _build):
+    """
+    Download bytes from _build(), cached by export_key (the analysis inputs
+    hash plus the export format) and the hash of the results it was built
+    from, so repeat downloads of the same results are free
+    """
+    return _build()
+
+
+def lazy_download(export_key, results_df, build):
+    """
+    Download callable for st.download_button. The results are hashed on
+    click, so anything that changes results_df, whatever the inputs hash
+    says, gets a freshly built download.
+    """
+    return lambda: cached_download(export_key, hash_results(results_df), build)
+
+
+def checkpoint_path_for(routing_key):
+    """Checkpoint file of the routing run with this key, or None when checkpoints are off"""
+    if not CHECKPOINT_DIR:
+        return None
+    return os.path.join(CHECKPOINT_DIR, f"{get_routing_backend().cache_profile}-{routing_key}.sqlite3")
+
+
 has_tts_content = get_tts_content() is not None
 
 ## Main Processing Section
@@ -717,8 +857,26 @@ try:
     # Validate site zones exist in zones.csv
     if all(zone in zones_df[zone_col].values for zone in site_zones) and valid_coords:
         if has_tts_content and len(st.session_state.pois) > 0:
+            # An earlier run of these inputs that was interrupted, or left
+            # failed routes, is resumed from its checkpoint
+            start_label = "Start Processing"
+            checkpoint_file = checkpoint_path_for(
+                hash_analysis_inputs(get_tts_content(), data_choice, site_zones, site_lat, site_lon)
+            )
+            if not st.session_state.processing_started and checkpoint_file and os.path.exists(checkpoint_file):
+                checkpoint = RunCheckpoint(checkpoint_file)
+                progress = checkpoint.progress()
+                checkpoint.close()
+                st.info(
+                    f"An earlier run of this analysis stopped with {progress['routes']:,} routes fetched"
+                    + (f" and {progress['failed']:,} failed" if progress['failed'] else "")
+                    + (f" ({progress['no_route']:,} have no route)" if progress['no_route'] else "")
+                    + ". Resuming only fetches the routes that are still missing."
+                )
+                start_label = "Resume Processing"
+
             # Add start button
-            start_button = st.button("Start Processing")
+            start_button = st.button(start_label)
             
             if start_button:
                 st.session_state.processing_started = True
@@ -728,94 +886,184 @@ try:
                 # Create a progress bar and status text
                 progress_bar = st.progress(0)
                 status_text = st.empty()
+                live_preview = st.empty()
                 
                 try:
-                    def get_route(origin_lat, origin_lon, dest_lat, dest_lon, retries=3):
-                        url = (f'http://router.project-osrm.org/route/v1/driving/'
-                            f'{origin_lon},{origin_lat};{dest_lon},{dest_lat}?overview=full')
-                        for attempt in range(retries):
-                            try:
-                                response = requests.get(url, timeout=10)
-                                if response.status_code == 200:
-                                    data = response.json()
-                                    if data['code'] == 'Ok':
-                                        return data['routes'][0]['geometry']
-                            except requests.RequestException:
-                                if attempt < retries - 1:
-                                    time.sleep(1)
-                        return None
-                    
-                    def fetch_routes_parallel(route_requests, max_workers=10, progress_callback=None, status_callback=None):
+                    def fetch_routes_parallel(route_requests, backend, max_workers=32, progress_callback=None, status_callback=None, cache=None, route_callback=None, checkpoint=None, no_route_callback=None):
                         results = {}
                         total = len(route_requests)
-                        completed = 0
-
-                        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                            futures = {
-                                executor.submit(
-                                    get_route,
-                                    r['origin_lat'], r['origin_lon'],
-                                    r['dest_lat'],   r['dest_lon']
-                                ): r['key']
-                                for r in route_requests
-                            }
-                            for future in as_completed(futures):
-                                key = futures[future]
-                                completed += 1
-                                try:
-                                    results[key] = future.result()
-                                except Exception:
-                                    results[key] = None
-
-                                if progress_callback:
-                                    # Fetching occupies 10% to 80% of the bar
-                                    progress_callback(10 + int(70 * completed / total))
-                                if status_callback:
-                                    failed = sum(1 for v in results.values() if v is None)
-                                    status_callback(
-                                        f"Fetching routes... {completed} of {total} complete"
-                                        + (f" ({failed} failed)" if failed > 0 else "")
-                                    )
+
+                        # Serve whatever we can from the on-disk cache before
+                        # touching the network
+                        cache_keys = {
+                            r['key']: make_route_key(
+                                r['origin_lat'], r['origin_lon'],
+                                r['dest_lat'],   r['dest_lon'],
+                                profile=backend.cache_profile
+                            )
+                            for r in route_requests
+                        }
+                        if cache is not None:
+                            cached = cache.get_many(cache_keys.values())
+                            for r in route_requests:
+                                geometry = cached.get(cache_keys[r['key']])
+                                if geometry:
+                                    results[r['key']] = geometry
+                        pending = [r for r in route_requests if r['key'] not in results]
+                        cache_hits = len(results)
+                        completed = cache_hits
+
+                        if status_callback and cache_hits:
+                            status_callback(f"Loaded {cache_hits} of {total} routes from cache — fetching {len(pending)}...")
+
+                        # Hand every route on as soon as we have it, so POI matching
+                        # overlaps with waiting on the network
+                        if route_callback:
+                            for key, geometry in list(results.items()):
+                                route_callback(key, geometry)
+
+                        failed = 0
+                        missing = 0
+                        unsaved = {}
+                        unsaved_failures = {}
+                        last_saved = time.time()
+
+                        def save_progress():
+                            # Routes are cached and checkpointed in batches as they
+                            # arrive, so an interrupted run keeps what it fetched
+                            nonlocal last_saved
+                            if cache is not None and unsaved:
+                                cache.set_many({cache_keys[key]: geometry for key, geometry in unsaved.items()})
+                            if checkpoint is not None and (unsaved or unsaved_failures):
+                                checkpoint.record_routes(unsaved, unsaved_failures)
+                            unsaved.clear()
+                            unsaved_failures.clear()
+                            last_saved = time.time()
+
+                        def on_result(key, geometry, timing, limiter):
+                            nonlocal completed, failed, missing
+                            completed += 1
+                            results[key] = geometry
+                            if geometry:
+                                unsaved[key] = geometry
+                            else:
+                                # The checkpoint keeps the status, so a resumed run
+                                # knows not to ask for a route that doesn't exist
+                                unsaved_failures[key] = timing.get('status')
+                                if timing.get('status') in NO_ROUTE_STATUSES:
+                                    missing += 1
+                                    if no_route_callback:
+                                        no_route_callback(key)
+                                else:
+                                    failed += 1
+                            if len(unsaved) + len(unsaved_failures) >= CHECKPOINT_EVERY_ROUTES or \
+                                    time.time() - last_saved >= CHECKPOINT_EVERY_SECONDS:
+                                save_progress()
+                            if route_callback:
+                                route_callback(key, geometry)
+
+                            if progress_callback:
+                                # Fetching occupies 10% to 80% of the bar
+                                progress_callback(10 + int(70 * completed / total))
+                            if status_callback:
+                                status_callback(
+                                    f"Fetching routes... {completed} of {total} complete"
+                                    + (f" ({cache_hits} cached)" if cache_hits > 0 else "")
+                                    + (f" ({failed} failed)" if failed > 0 else "")
+                                    + (f" ({missing} with no route)" if missing > 0 else "")
+                                    + f" — {limiter.current} concurrent requests"
+                                )
+
+                        try:
+                            _, timings = backend.fetch_routes(pending, max_concurrency=max_workers, on_result=on_result)
+                        finally:
+                            save_progress()
+                        st.session_state.route_timings = timings
 
                         return results
 
-                    def passes_through(route_geometry, poi_list, threshold=0.1):
-                        route_coords = decode(route_geometry)
-                        matched_pois = {}  # keyed by poi id — deduplicates automatically
-
-                        for route_point in route_coords:
-                            for poi in poi_list:
-                                poi_id = poi['id']
-                                if poi_id in matched_pois:
-                                    continue  # already matched this POI, skip all future checks for it
-
-                                distance = geodesic(route_point, poi['coordinates']).km
-                                if distance <= poi.get('threshold', threshold):
-                                    matched_pois[poi_id] = {
-                                        'id': poi_id,
-                                        'name': poi['name'],
-                                        'coordinates': poi['coordinates'],
-                                        'threshold': poi.get('threshold', threshold),
-                                        'actual_distance': distance
-                                    }
-
-                            # Early exit if all POIs already matched
-                            if len(matched_pois) == len(poi_list):
-                                break
-
-                        intersected = list(matched_pois.values())
-                        return {
-                            'passes': bool(intersected),
-                            'num_pois_intersected': len(intersected),
-                            'intersected_pois': intersected
-                        }
+                    def screen_route_requests(route_requests, backend, pois, cache=None, status_callback=None, checkpoint=None):
+                        # Cached routes cost nothing to load in full. The rest are
+                        # first asked for their length and snapped end points only,
+                        # and just those that could come near a POI are fetched with
+                        # full geometry. Returns (requests to fetch, screened out),
+                        # keeping the screened routes' lengths so later POI edits
+                        # can re-screen them.
+                        cache_keys = make_route_keys(
+                            route_requests['origin_lat'], route_requests['origin_lon'],
+                            route_requests['dest_lat'], route_requests['dest_lon'],
+                            profile=backend.cache_profile
+                        )
+                        cached = cache.get_many(cache_keys) if cache is not None else {}
+                        in_cache = np.array([bool(cached.get(key)) for key in cache_keys], dtype=bool)
+                        pending = route_requests[~in_cache]
+
+                        # Lengths checkpointed by an interrupted run aren't asked for again
+                        summaries = {}
+                        if checkpoint is not None:
+                            checkpointed = checkpoint.summaries()
+                            summaries = {key: checkpointed[key] for key in pending['key'] if key in checkpointed}
+                        unsaved = {}
+                        last_saved = time.time()
+
+                        def save_progress():
+                            nonlocal last_saved
+                            if checkpoint is not None and unsaved:
+                                checkpoint.record_summaries(unsaved)
+                            unsaved.clear()
+                            last_saved = time.time()
+
+                        def on_result(key, summary, timing, limiter):
+                            summaries[key] = summary
+                            unsaved[key] = summary
+                            if len(unsaved) >= CHECKPOINT_EVERY_ROUTES or \
+                                    time.time() - last_saved >= CHECKPOINT_EVERY_SECONDS:
+                                save_progress()
+                            if status_callback:
+                                status_callback(
+                                    f"Screening routes... {len(summaries)} of {len(pending)} lengths fetched"
+                                    f" — {limiter.current} concurrent requests"
+                                )
 
-                    def process_tts_file(content, zones_df, progress_callback=None, status_callback=None):
-                        table_pattern = re.compile(r"^\s*(\d+)\s+(\d+)\s+(\d+)\s*$", re.MULTILINE)
-                        matches = table_pattern.findall(content)
+                        try:
+                            backend.fetch_summaries(
+                                pending[~pending['key'].isin(list(summaries))].to_dict('records'), on_result=on_result
+                            )
+                        finally:
+                            save_progress()
+
+                        screened = pending.copy()
+                        summary = [summaries.get(key) for key in screened['key']]
+                        known = [s is not None and len(s['waypoints']) == 2 for s in summary]
+                        screened['length_km'] = [s['distance'] / 1000 if ok else np.nan for s, ok in zip(summary, known)]
+                        # Unknown routes keep their own end points and NaN length, so
+                        # they always pass the screen and get fetched in full
+                        for end, wp in (('origin', 0), ('dest', 1)):
+                            for axis, part in (('lat', 0), ('lon', 1)):
+                                screened[f'snapped_{end}_{axis}'] = [
+                                    s['waypoints'][wp][part] if ok else value
+                                    for s, ok, value in zip(summary, known, screened[f'{end}_{axis}'])
+                                ]
+
+                        candidates = screen_candidates(screened, pois)
+                        to_fetch = pd.concat([route_requests[in_cache], screened.loc[candidates, route_requests.columns]])
+                        return to_fetch, screened[~candidates].reset_index(drop=True)
+
+                    def screen_candidates(screened, pois):
+                        return screen_routes(
+                            screened[['snapped_origin_lat', 'snapped_origin_lon']].to_numpy(),
+                            screened[['snapped_dest_lat', 'snapped_dest_lon']].to_numpy(),
+                            screened['length_km'].to_numpy(),
+                            [poi['coordinates'] for poi in pois],
+                            [poi.get('threshold', 0.1) for poi in pois]
+                        )
+
+                    def route_tts_file(content, zones_df, progress_callback=None, status_callback=None, on_planned=None, on_route=None, store_path=None, pois=None, checkpoint_path=None):
                         zone_col = 'GTA06' if data_choice == "2006 Zones" else 'TTS2022'
-                        df_origins = pd.DataFrame(matches, columns=[f"{zone_col}_orig", f"{zone_col}_dest", "total"])
-                        df_origins = df_origins.astype({f"{zone_col}_orig": int, f"{zone_col}_dest": int, "total": int})
+                        # One row per unique OD pair, with the trips from each
+                        # fetched time period in its own column
+                        df_origins = od_totals_by_period(parse_tts_export(content))
+                        periods = list(df_origins.columns[3:])
 
                         zone_lookup = zones_df.set_index(zone_col)[['Latitude', 'Longitude']].to_dict('index')
 
@@ -825,187 +1073,392 @@ try:
                         if progress_callback:
                             progress_callback(0)
 
-                        route_requests = []
-                        planned_rows = []
-
-                        for current_site_zone in site_zones:
-                            if current_site_zone not in zone_lookup:
-                                continue
-                            site_zone_coords = zone_lookup[current_site_zone]
-                            szlat = site_zone_coords['Latitude']
-                            szlon = site_zone_coords['Longitude']
-
-                            for idx, row in df_origins.iterrows():
-                                origin_id = row[f'{zone_col}_orig']
-                                dest_id   = row[f'{zone_col}_dest']
-
-                                if origin_id != current_site_zone and dest_id != current_site_zone:
-                                    continue
-
-                                origin_coords = zone_lookup.get(origin_id)
-                                dest_coords   = zone_lookup.get(dest_id)
-
-                                if not origin_coords or not dest_coords:
-                                    planned_rows.append({
-                                        'origin_id': origin_id,
-                                        'dest_id': dest_id,
-                                        'route_type': 'invalid_zone',
-                                        'passes': False,
-                                        'num_pois_intersected': 0,
-                                        'intersected_pois': [],
-                                        'total': row['total'],
-                                        'site_zone': current_site_zone,
-                                        'key': None,
-                                        'geometry': None
-                                    })
-                                    continue
-
-                                if origin_id == current_site_zone and dest_id == current_site_zone:
-                                    key1 = f"{current_site_zone}|{idx}|origin_to_site"
-                                    key2 = f"{current_site_zone}|{idx}|site_to_destination"
-                                    route_requests.append({
-                                        'key': key1,
-                                        'origin_lat': szlat,
-                                        'origin_lon': szlon,
-                                        'dest_lat': site_lat,
-                                        'dest_lon': site_lon
-                                    })
-                                    route_requests.append({
-                                        'key': key2,
-                                        'origin_lat': site_lat,
-                                        'origin_lon': site_lon,
-                                        'dest_lat': szlat,
-                                        'dest_lon': szlon
-                                    })
-                                    planned_rows.append({
-                                        'origin_id': origin_id,
-                                        'dest_id': dest_id,
-                                        'route_type': 'origin_to_site',
-                                        'total': row['total'],
-                                        'site_zone': current_site_zone,
-                                        'key': key1,
-                                        'geometry': None
-                                    })
-                                    planned_rows.append({
-                                        'origin_id': origin_id,
-                                        'dest_id': dest_id,
-                                        'route_type': 'site_to_destination',
-                                        'total': row['total'],
-                                        'site_zone': current_site_zone,
-                                        'key': key2,
-                                        'geometry': None
-                                    })
-
-                                elif dest_id == current_site_zone:
-                                    key = f"{current_site_zone}|{idx}|origin_to_site"
-                                    route_requests.append({
-                                        'key': key,
-                                        'origin_lat': origin_coords['Latitude'],
-                                        'origin_lon': origin_coords['Longitude'],
-                                        'dest_lat': site_lat,
-                                        'dest_lon': site_lon
-                                    })
-                                    planned_rows.append({
-                                        'origin_id': origin_id,
-                                        'dest_id': dest_id,
-                                        'route_type': 'origin_to_site',
-                                        'total': row['total'],
-                                        'site_zone': current_site_zone,
-                                        'key': key,
-                                        'geometry': None
-                                    })
-
-                                else:
-                                    key = f"{current_site_zone}|{idx}|site_to_destination"
-                                    route_requests.append({
-                                        'key': key,
-                                        'origin_lat': site_lat,
-                                        'origin_lon': site_lon,
-                                        'dest_lat': dest_coords['Latitude'],
-                                        'dest_lon': dest_coords['Longitude']
-                                    })
-                                    planned_rows.append({
-                                        'origin_id': origin_id,
-                                        'dest_id': dest_id,
-                                        'route_type': 'site_to_destination',
-                                        'total': row['total'],
-                                        'site_zone': current_site_zone,
-                                        'key': key,
-                                        'geometry': None
-                                    })
+                        plan, route_requests = plan_site_routes(
+                            df_origins, zones_df, zone_col, site_zones, site_lat, site_lon
+                        )
 
                         if status_callback:
-                            status_callback(f"Found {len(route_requests)} routes to fetch — starting 10 workers...")
+                            status_callback(
+                                f"Found {len(route_requests)} unique routes to fetch for "
+                                f"{len(plan)} planned trips via {get_routing_backend().describe()}..."
+                            )
                         if progress_callback:
                             progress_callback(10)
+                        if on_planned:
+                            on_planned(plan)
 
                         # --- Phase 2: Fetch all routes in parallel ---
-                        geometries = fetch_routes_parallel(
-                            route_requests,
-                            max_workers=10,
+                        # A geometry store saved by an earlier run of the same inputs
+                        # (in this or another session) already has every route decoded,
+                        # or screened out with its length kept alongside
+                        store = None
+                        screened = None
+                        checkpoint = None
+                        saved = None
+                        # Routes the router says don't exist are kept apart from
+                        # failed fetches, since retrying them can't help
+                        no_route = set()
+                        screened_path = os.path.join(store_path, 'screened.parquet') if store_path else None
+                        no_route_path = os.path.join(store_path, 'no_route.parquet') if store_path else None
+                        if store_path and os.path.isdir(store_path):
+                            saved = RouteGeometryStore.load(store_path)
+                            saved_screened = pd.read_parquet(screened_path) if os.path.exists(screened_path) else None
+                            screened_keys = set(saved_screened['key']) if saved_screened is not None else set()
+                            if os.path.exists(no_route_path):
+                                no_route = set(pd.read_parquet(no_route_path)['key'])
+                            if all(saved.index(key) >= 0 or key in screened_keys or key in no_route
+                                   for key in route_requests['key']):
+                                store = saved
+                                screened = saved_screened
+                                if status_callback:
+                                    status_callback(f"Loaded {len(store)} decoded routes from the geometry store...")
+                                if on_route:
+                                    for i, key in enumerate(store.keys):
+                                        on_route(key, store.route(i))
+
+                        if store is None:
+                            # Each route is decoded the moment it arrives, while the
+                            # rest are still in flight, and only ever decoded once
+                            route_coords = {}
+
+                            def route_arrived(key, geometry):
+                                if not geometry:
+                                    return
+                                route_coords[key] = decode_coords(geometry)
+                                if on_route:
+                                    on_route(key, route_coords[key])
+
+                            # An earlier run of these inputs that was interrupted, or
+                            # had failures, left its fetched routes in a checkpoint;
+                            # only routes missing from it are fetched again
+                            checkpoint = RunCheckpoint(checkpoint_path) if checkpoint_path else None
+                            remaining = route_requests
+                            if saved is not None:
+                                # A store saved by an earlier run that was missing routes
+                                # still has the ones it did fetch
+                                stored = np.array([saved.index(key) for key in route_requests['key']])
+                                for key, i in zip(route_requests['key'], stored):
+                                    if i >= 0:
+                                        route_coords[key] = saved.route(i)
+                                        if on_route:
+                                            on_route(key, route_coords[key])
+                                remaining = route_requests[(stored < 0) & ~route_requests['key'].isin(list(no_route))]
+                                if status_callback:
+                                    status_callback(f"Loaded {len(route_requests) - len(remaining)} decoded routes "
+                                                    f"from the geometry store...")
+                            if checkpoint is not None:
+                                checkpointed = checkpoint.routes()
+                                resumed = remaining['key'].isin(list(checkpointed)).to_numpy()
+                                if resumed.any():
+                                    if status_callback:
+                                        status_callback(f"Resuming: {len(route_requests) - len(remaining) + int(resumed.sum())} "
+                                                        f"of {len(route_requests)} routes were already fetched...")
+                                    for key in remaining.loc[resumed, 'key']:
+                                        route_arrived(key, checkpointed[key])
+                                    remaining = remaining[~resumed]
+                                del checkpointed
+                                no_route.update(key for key, status in checkpoint.failures().items()
+                                                if status in NO_ROUTE_STATUSES)
+                                remaining = remaining[~remaining['key'].isin(list(no_route))]
+
+                            # Most routes never come near a POI, so where the backend
+                            # can answer lengths cheaply, those are screened out first
+                            backend = get_routing_backend()
+                            to_fetch = remaining
+                            screen = SCREEN_ROUTES not in ("0", "false", "no") and backend.summaries and pois
+                            if screen and SCREEN_ROUTES == "auto":
+                                screen = estimate_screened_share(
+                                    remaining[['origin_lat', 'origin_lon']].to_numpy(),
+                                    remaining[['dest_lat', 'dest_lon']].to_numpy(),
+                                    [poi['coordinates'] for poi in pois],
+                                    [poi.get('threshold', 0.1) for poi in pois]
+                                ) >= SCREEN_MIN_SHARE
+                            if screen:
+                                if status_callback:
+                                    status_callback(f"Screening {len(remaining)} routes against the POIs...")
+                                to_fetch, screened = screen_route_requests(
+                                    remaining, backend, pois, cache=get_route_cache(),
+                                    status_callback=status_callback, checkpoint=checkpoint
+                                )
+                                if status_callback:
+                                    status_callback(
+                                        f"{len(screened)} of {len(remaining)} routes can't reach a POI — "
+                                        f"fetching full geometry for {len(to_fetch)}..."
+                                    )
+
+                            fetch_routes_parallel(
+                                to_fetch.to_dict('records'),
+                                backend,
+                                progress_callback=progress_callback,
+                                status_callback=status_callback,
+                                cache=get_route_cache(),
+                                route_callback=route_arrived,
+                                checkpoint=checkpoint,
+                                no_route_callback=no_route.add
+                            )
+
+                            store = RouteGeometryStore.from_coords(list(route_coords), list(route_coords.values()))
+                            del route_coords
+
+                        st.session_state.zone_lookup = zone_lookup
+
+                        run = {
+                            'plan': plan,
+                            'periods': periods,
+                            # key and end points of every route the plan needs, so
+                            # failed routes can be retried
+                            'requests': route_requests.reset_index(drop=True),
+                            # decoded coordinates of every fetched route, shared by
+                            # the POI matching and the route map
+                            'store': store,
+                            # routes skipped by the length screen, with their lengths
+                            # and snapped end points (None when nothing was screened)
+                            'screened': screened,
+                            # closest-approach (distances, vertex indices) per POI coordinate
+                            'poi_columns': {},
+                            # keys of routes the router says don't exist
+                            'no_route': no_route,
+                            'store_path': store_path,
+                            'checkpoint_path': checkpoint_path
+                        }
+                        if store_path and store is not saved:
+                            save_run_store(run)
+                        if checkpoint is not None:
+                            finish_checkpoint(run, checkpoint)
+                        return run
+
+                    def save_run_store(run):
+                        # Saving keeps the run's routes first and in order, so its POI
+                        # columns stay aligned; routes that only a store saved by
+                        # another session had come after them and get their columns here
+                        num_routes = len(run['store'])
+                        store = run['store'].save(run['store_path'])
+                        if len(store) > num_routes:
+                            start = store.offsets[num_routes]
+                            for column_key, (distances, vertex_indices) in run['poi_columns'].items():
+                                new_distances, new_indices = closest_approach(
+                                    store.coords[start:], store.offsets[num_routes:] - start, column_key
+                                )
+                                run['poi_columns'][column_key] = (
+                                    np.concatenate([distances, new_distances.astype(np.float32)]),
+                                    np.concatenate([vertex_indices, new_indices.astype(np.int32)])
+                                )
+                        run['store'] = store
+                        if run.get('screened') is not None:
+                            run['screened'].to_parquet(os.path.join(run['store_path'], 'screened.parquet'), index=False)
+                        if run.get('no_route'):
+                            pd.DataFrame({'key': sorted(run['no_route'])}).to_parquet(
+                                os.path.join(run['store_path'], 'no_route.parquet'), index=False
+                            )
+                        prune_geometry_stores(os.path.dirname(run['store_path']))
+
+                    def unrouted_requests(run):
+                        # Planned routes that are neither stored, screened out nor
+                        # known not to exist: their fetch failed
+                        requests = run.get('requests')
+                        if requests is None:
+                            return pd.DataFrame(columns=['key', 'origin_lat', 'origin_lon', 'dest_lat', 'dest_lon'])
+                        screened_keys = set(run['screened']['key']) if run.get('screened') is not None else set()
+                        no_route = run.get('no_route') or set()
+                        missing = [run['store'].index(key) < 0 and key not in screened_keys and key not in no_route
+                                   for key in requests['key']]
+                        return requests[np.array(missing, dtype=bool)]
+
+                    def finish_checkpoint(run, checkpoint):
+                        # A run with every route no longer needs its checkpoint; one
+                        # with failures keeps it so they can be retried later
+                        if unrouted_requests(run).empty:
+                            checkpoint.remove()
+                        else:
+                            checkpoint.close()
+                        prune_checkpoints(os.path.dirname(checkpoint.path))
+
+                    def append_routes(run, requests, progress_callback=None, status_callback=None):
+                        # Fetch more routes for a finished run and add them to its
+                        # geometry store (and checkpoint, if it has one)
+                        route_coords = {}
+
+                        def route_arrived(key, geometry):
+                            if geometry:
+                                route_coords[key] = decode_coords(geometry)
+
+                        checkpoint = RunCheckpoint(run['checkpoint_path']) if run.get('checkpoint_path') else None
+                        fetch_routes_parallel(
+                            requests.to_dict('records'),
+                            get_routing_backend(),
                             progress_callback=progress_callback,
-                            status_callback=status_callback
+                            status_callback=status_callback,
+                            cache=get_route_cache(),
+                            route_callback=route_arrived,
+                            checkpoint=checkpoint,
+                            no_route_callback=run.setdefault('no_route', set()).add
                         )
 
+                        # New routes go after the existing ones, so the stored POI
+                        # columns only need the new routes' distances appending
+                        keys, coords_list = list(route_coords), list(route_coords.values())
+                        flat, offsets = stack_coords(coords_list)
+                        for column_key, (distances, vertex_indices) in run['poi_columns'].items():
+                            new_distances, new_indices = closest_approach(flat, offsets, column_key)
+                            run['poi_columns'][column_key] = (
+                                np.concatenate([distances, new_distances.astype(np.float32)]),
+                                np.concatenate([vertex_indices, new_indices.astype(np.int32)])
+                            )
+                        run['store'] = run['store'].extend(keys, coords_list)
+                        if run.get('store_path'):
+                            save_run_store(run)
+                        if checkpoint is not None:
+                            finish_checkpoint(run, checkpoint)
+
+                    def fetch_screened_candidates(run, pois, progress_callback=None, status_callback=None):
+                        # Routes were screened against the POIs of the first run;
+                        # a new, moved or widened POI can bring some of them into
+                        # reach, so those are fetched now and appended to the store
+                        screened = run.get('screened')
+                        if screened is None or screened.empty:
+                            return
+                        candidates = screen_candidates(screened, pois)
+                        if not candidates.any():
+                            return
+                        if status_callback:
+                            status_callback(f"Fetching {int(candidates.sum())} routes brought into reach by the POI changes...")
+                        run['screened'] = screened[~candidates].reset_index(drop=True)
+                        append_routes(run, screened[candidates], progress_callback, status_callback)
+
+                    def retry_failed_routes(run, pois, progress_callback=None, status_callback=None):
+                        # Fetch only the routes whose fetch failed, then re-match
+                        failed = unrouted_requests(run)
+                        if status_callback:
+                            status_callback(f"Retrying {len(failed)} failed routes...")
+                        append_routes(run, failed, progress_callback, status_callback)
+                        return match_route_pois(run, pois, progress_callback, status_callback)
+
+                    def match_route_pois(run, pois, progress_callback=None, status_callback=None):
                         # --- Phase 3: POI intersection checks ---
-                        results = []
-                        total = len(planned_rows)
+                        # Each POI is one column of closest-approach distances over
+                        # all routes. Columns are kept between reruns, so threshold
+                        # edits only re-compare, and a new or moved POI costs one column.
+                        if status_callback:
+                            status_callback("Checking POI intersections...")
+                        if progress_callback:
+                            progress_callback(80)
 
-                        for i, plan in enumerate(planned_rows):
-                            if progress_callback:
-                                progress_callback(80 + int(20 * i / total))
-                            if status_callback:
-                                status_callback(f"Checking POI intersections... {i+1} of {total}")
-
-                            if plan.get('route_type') == 'invalid_zone' or plan['key'] is None:
-                                results.append({
-                                    'origin_id': plan['origin_id'],
-                                    'dest_id': plan['dest_id'],
-                                    'route_type': 'invalid_zone',
-                                    'passes': False,
-                                    'num_pois_intersected': 0,
-                                    'intersected_pois': [],
-                                    'total': plan['total'],
-                                    'site_zone': plan['site_zone'],
-                                    'geometry': None
-                                })
-                                continue
-
-                            geometry = geometries.get(plan['key'])
-                            if geometry:
-                                poi_result = passes_through(geometry, st.session_state.pois)
-                                results.append({
-                                    'origin_id': plan['origin_id'],
-                                    'dest_id': plan['dest_id'],
-                                    'route_type': plan['route_type'],
-                                    'passes': poi_result['passes'],
-                                    'num_pois_intersected': poi_result['num_pois_intersected'],
-                                    'intersected_pois': poi_result['intersected_pois'],
-                                    'total': plan['total'],
-                                    'site_zone': plan['site_zone'],
-                                    'geometry': geometry
-                                })
-                            else:
-                                results.append({
-                                    'origin_id': plan['origin_id'],
-                                    'dest_id': plan['dest_id'],
-                                    'route_type': plan['route_type'],
-                                    'passes': False,
-                                    'num_pois_intersected': 0,
-                                    'intersected_pois': [],
-                                    'total': plan['total'],
-                                    'site_zone': plan['site_zone'],
-                                    'geometry': None
-                                })
+                        for poi in pois:
+                            column_key = tuple(poi['coordinates'])
+                            if column_key not in run['poi_columns']:
+                                distances, vertex_indices = closest_approach(
+                                    run['store'].coords, run['store'].offsets, poi['coordinates']
+                                )
+                                run['poi_columns'][column_key] = (distances.astype(np.float32),
+                                                                  vertex_indices.astype(np.int32))
+                        num_routes = len(run['store'])
+                        distances = np.empty((num_routes, len(pois)), dtype=np.float32)
+                        vertex_indices = np.empty((num_routes, len(pois)), dtype=np.int32)
+                        for j, poi in enumerate(pois):
+                            distances[:, j], vertex_indices[:, j] = run['poi_columns'][tuple(poi['coordinates'])]
+
+                        # Matching happens once per unique route; planned rows only
+                        # carry an index into the run's routes (and so its geometry
+                        # store), the first POI passed and a categorical POI label.
+                        # Per-route membership stays in the run as a boolean matrix.
+                        matched, first_poi = match_matrix(
+                            distances, vertex_indices, [poi.get('threshold', 0.1) for poi in pois]
+                        )
+                        labels = poi_labels(matched, [poi['name'] for poi in pois])
+                        run['matched'] = matched
+
+                        plan = run['plan']
+                        route_index = pd.Series(np.arange(num_routes, dtype=np.int32), index=run['store'].keys)
+                        route = plan['key'].map(route_index).fillna(-1).to_numpy(dtype=np.int32)
+                        routed = route >= 0
+                        invalid = (plan['route_type'] == 'invalid_zone').to_numpy()
+
+                        num_pois_intersected = np.zeros(len(plan), dtype=np.int16)
+                        num_pois_intersected[routed] = matched[route[routed]].sum(axis=1)
+                        row_first_poi = np.full(len(plan), -1, dtype=np.int16)
+                        row_first_poi[routed] = first_poi[route[routed]]
+                        row_labels = np.full(len(plan), '', dtype=object)
+                        row_labels[routed] = labels[route[routed]]
+                        row_labels[invalid] = 'Invalid zone - route not processed'
+                        # Kept apart from routes that were fetched and pass no POI
+                        not_routed = ~routed & plan['key'].isin(list(unrouted_requests(run)['key'])).to_numpy()
+                        row_labels[not_routed] = 'Not routed - route fetch failed'
+                        no_route = ~routed & plan['key'].isin(list(run.get('no_route') or set())).to_numpy()
+                        row_labels[no_route] = 'Not routed - no route exists'
+
+                        results_df = pd.DataFrame({
+                            'origin_id': plan['origin_id'].to_numpy(dtype=np.int32),
+                            'dest_id': plan['dest_id'].to_numpy(dtype=np.int32),
+                            'route_type': pd.Categorical(
+                                plan['route_type'],
+                                categories=['origin_to_site', 'site_to_destination', 'invalid_zone']
+                            ),
+                            'passes': num_pois_intersected > 0,
+                            'num_pois_intersected': num_pois_intersected,
+                            'first_poi': row_first_poi,
+                            'POI': pd.Categorical(row_labels),
+                            'total': plan['total'].to_numpy(dtype=np.int32),
+                            'site_zone': plan['site_zone'].to_numpy(dtype=np.int32),
+                            'route': route
+                        })
+                        # Per-period trips line up with the plan row for row
+                        for period in run['periods']:
+                            results_df[period] = plan[period].to_numpy(dtype=np.int32)
 
                         if status_callback:
                             status_callback("Processing complete!")
                         if progress_callback:
                             progress_callback(100)
 
-                        st.session_state.zone_lookup = zone_lookup
+                        return results_df
 
-                        return pd.DataFrame(results)
+                    def process_tts_file(content, zones_df, progress_callback=None, status_callback=None):
+                        # Routes only depend on the OD data and site, so POI edits
+                        # reuse the stored run and just redo the matching
+                        routing_key = hash_analysis_inputs(content, data_choice, site_zones, site_lat, site_lon)
+                        run = st.session_state.get('route_run')
+                        if run is None or run.get('key') != routing_key:
+                            # Match routes against the POIs as they stream in and
+                            # show running totals while the fetch is under way
+                            matcher = StreamingPoiMatcher(st.session_state.pois)
+                            last_preview = 0.0
+                            previews = 0
+
+                            def on_route(key, coords):
+                                nonlocal last_preview, previews
+                                matcher.add(key, coords)
+                                if time.time() - last_preview >= 1.0:
+                                    last_preview = time.time()
+                                    previews += 1
+                                    show_live_preview(matcher, previews)
+
+                            store_path = os.path.join(
+                                GEOMETRY_STORE_DIR, f"{get_routing_backend().cache_profile}-{routing_key}"
+                            ) if GEOMETRY_STORE_DIR else None
+                            run = route_tts_file(content, zones_df, progress_callback, status_callback,
+                                                 on_planned=matcher.plan, on_route=on_route, store_path=store_path,
+                                                 pois=st.session_state.pois,
+                                                 checkpoint_path=checkpoint_path_for(routing_key))
+                            run['key'] = routing_key
+                            # The streamed distances become the stored POI columns
+                            run['poi_columns'] = matcher.poi_columns(run['store'].keys)
+                            st.session_state.route_run = run
+                            live_preview.empty()
+                        fetch_screened_candidates(run, st.session_state.pois, progress_callback, status_callback)
+                        return match_route_pois(run, st.session_state.pois, progress_callback, status_callback)
+
+                    def show_live_preview(matcher, n):
+                        with live_preview.container():
+                            st.metric("Routes Passing POIs So Far", f"{matcher.routes_matched:,}")
+                            col1, col2 = st.columns(2)
+                            for col, route_type, title in ((col1, 'origin_to_site', "Origin to Site"),
+                                                           (col2, 'site_to_destination', "Site to Destination")):
+                                totals = matcher.totals[route_type]
+                                if totals:
+                                    with col:
+                                        st.plotly_chart(build_poi_pie(pd.Series(totals), f"{title} (so far)"),
+                                                        use_container_width=True,
+                                                        key=f"live_{route_type}_{n}")
 
                     def update_progress(progress):
                         progress_bar.progress(int(progress))
@@ -1013,23 +1466,29 @@ try:
                     def update_status(status):
                         status_text.text(status)
                     
-                    # Process the data — from upload or fetch (see get_tts_content)
+                    # Process the data — from upload or fetch (see get_tts_content).
+                    # Widget interactions rerun the whole script, so only redo the
+                    # analysis when one of its inputs has actually changed.
                     content = get_tts_content()
-                    st.session_state.results_df = process_tts_file(content, zones_df, update_progress, update_status)
+                    analysis_key = hash_analysis_inputs(
+                        content, data_choice, site_zones, site_lat, site_lon, st.session_state.pois
+                    )
+                    if st.session_state.results_df is None or \
+                        st.session_state.get('results_key') != analysis_key:
+                        st.session_state.results_df = process_tts_file(content, zones_df, update_progress, update_status)
+                        st.session_state.results_key = analysis_key
+                        st.session_state.results_version += 1
+                    else:
+                        update_progress(100)
                     
                     if st.session_state.results_df is not None and not st.session_state.results_df.empty:
                         status_text.text("Processing complete!")
                         
-                        # Process the dataframe to show POI names
-                        display_df = st.session_state.results_df.copy()
-                        display_df['POI'] = display_df.apply(
-                        lambda x: 'Invalid zone - route not processed' if x['route_type'] == 'invalid_zone' 
-                        else (', '.join(sorted(set([poi['name'] for poi in x['intersected_pois']]))) if x['intersected_pois'] else ''),
-                        axis=1
-                        )
-                        
-                        # Select columns to display
-                        display_df = display_df[['origin_id', 'dest_id', 'route_type', 'passes', 'POI', 'total']]
+                        # Select columns to display, with a trips column per time
+                        # period when several periods were loaded together
+                        periods = st.session_state.route_run['periods']
+                        period_columns = periods if len(periods) > 1 else []
+                        display_df = st.session_state.results_df[['origin_id', 'dest_id', 'route_type', 'passes', 'POI', 'total'] + period_columns]
                         
                         # Display summary statistics
                         col1, col2 = st.columns(2)
@@ -1037,12 +1496,52 @@ try:
                             st.metric("Total Routes", len(st.session_state.results_df))
                         with col2:
                             st.metric("Routes with POI Matches", st.session_state.results_df['passes'].sum())
+
+                        # Routes whose fetch failed are labelled as not routed rather
+                        # than counted as passing no POI, and can be retried on their own
+                        failed_routes = unrouted_requests(st.session_state.route_run)
+                        if not failed_routes.empty:
+                            st.warning(f"{len(failed_routes):,} routes could not be fetched; their trips are "
+                                       f"marked 'Not routed - route fetch failed'.")
+                            if st.button("Retry failed routes"):
+                                st.session_state.results_df = retry_failed_routes(
+                                    st.session_state.route_run, st.session_state.pois, update_progress, update_status
+                                )
+                                st.session_state.results_version += 1
+                                st.rerun()
+                        no_route = st.session_state.route_run.get('no_route')
+                        if no_route:
+                            st.info(f"{len(no_route):,} routes don't exist on the road network (the router found "
+                                    f"no route between their zones); their trips are marked "
+                                    f"'Not routed - no route exists'.")
+
+                        route_timings = st.session_state.get('route_timings')
+                        if route_timings:
+                            timing_summary = summarize_timings(route_timings)
+                            with st.expander("Route fetch timings"):
+                                tcol1, tcol2, tcol3, tcol4 = st.columns(4)
+                                tcol1.metric("Requests", timing_summary['requests'])
+                                tcol2.metric("Retried", timing_summary['retried'])
+                                if timing_summary['median'] is not None:
+                                    tcol3.metric("Median", f"{timing_summary['median']:.2f} s")
+                                    tcol4.metric("95th percentile", f"{timing_summary['p95']:.2f} s")
+                                if timing_summary['no_route']:
+                                    st.write("No route exists:", timing_summary['no_route'])
+                                if timing_summary['failed_statuses']:
+                                    st.write("Failed responses:", timing_summary['failed_statuses'])
+                                st.dataframe(
+                                    pd.DataFrame.from_dict(route_timings, orient='index')
+                                    # HTTP codes and NoRoute/exception names share the column
+                                    .astype({'status': str})
+                                    .rename_axis('route')
+                                    .sort_values('elapsed', ascending=False)
+                                )
                         
                         # Create POI summaries by route type
                         st.subheader("POI Traffic Distribution")
                         
                         # Filter for routes that pass through POIs
-                        poi_df = display_df[display_df['POI'] != '']
+                        poi_df = display_df[display_df['passes']]
                         
                         # Create two columns for the pie charts
                         col1, col2 = st.columns(2)
@@ -1054,308 +1553,204 @@ try:
                         # Create summary for origin_to_site
                         if not origin_to_site.empty:
                             with col1:
-                                origin_summary = origin_to_site.groupby('POI')['total'].sum()
-                                total_traffic = origin_summary.sum()
-                                # Calculate percentages
-                                origin_percentages = (origin_summary / total_traffic * 100).round(1)
-
-                                poi_names_in_order = origin_summary.index.tolist()
-                                
-                                
-                                # Create interactive pie chart
-                                fig1 = px.pie(
-                                    values=origin_percentages.values,
-                                    names=origin_percentages.index,
-                                    custom_data=[origin_summary.values],
-                                    title="Origin to Site",
-                                    color=origin_percentages.index,
-                                    color_discrete_map={name: FOLIUM_TO_CSS.get(poi_colour_map.get(name, 'gray'), '#808080') 
-                                                        for name in origin_percentages.index}
-                                )
-                                
-                                fig1.update_traces(
-                                    textposition='inside',
-                                    hovertemplate="<b>%{label}</b><br>" +
-                                                "Percentage: %{percent}<br>" +
-                                                "Total Traffic: %{customdata[0]}<extra></extra>"
-                                )
-                                fig1.update_layout(
-                                    showlegend=True,
-                                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=1),
-                                    height=400
-                                )
-                                st.plotly_chart(fig1, use_container_width=True)
+                                origin_summary = origin_to_site.groupby('POI', observed=True)['total'].sum()
+                                st.plotly_chart(build_poi_pie(origin_summary, "Origin to Site"), use_container_width=True)
                         
                         # Create summary for site_to_destination
                         if not site_to_destination.empty:
                             with col2:
-                                dest_summary = site_to_destination.groupby('POI')['total'].sum()
-                                total_traffic = dest_summary.sum()
-                                # Calculate percentages
-                                dest_percentages = (dest_summary / total_traffic * 100).round(1)
-
-                                poi_names_in_order = dest_summary.index.tolist()
-                                                                
-                                # Create interactive pie chart
-                                fig2 = px.pie(
-                                    values=dest_percentages.values,
-                                    names=dest_percentages.index,
-                                    custom_data=[dest_summary.values],
-                                    title="Site to Destination",
-                                    color=dest_percentages.index,
-                                    color_discrete_map={name: FOLIUM_TO_CSS.get(poi_colour_map.get(name, 'gray'), '#808080') 
-                                                        for name in dest_percentages.index}
-                                )
-                                
-                                fig2.update_traces(
-                                    textposition='inside',
-                                    hovertemplate="<b>%{label}</b><br>" +
-                                                "Percentage: %{percent}<br>" +
-                                                "Total Traffic: %{customdata[0]}<extra></extra>"
-                                )
-                                fig2.update_layout(
-                                    showlegend=True,
-                                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=1),
-                                    height=400
-                                )
-                                st.plotly_chart(fig2, use_container_width=True)
+                                dest_summary = site_to_destination.groupby('POI', observed=True)['total'].sum()
+                                st.plotly_chart(build_poi_pie(dest_summary, "Site to Destination"), use_container_width=True)
                         
                         # Display results in a table
                         st.subheader("Route Analysis Results")
                         st.dataframe(display_df)
                         
-                        # Generate Excel file for download
+                        # Generate Excel file for download. Session state is read up
+                        # front, since the build itself runs outside the script run.
+                        export_pois = st.session_state.pois
+
                         def generate_formatted_excel():
-                            output = io.BytesIO()
-                            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                                # Format Route Results sheet
-                                export_df = display_df[['origin_id', 'dest_id', 'route_type', 'POI', 'total']].copy()
-                                export_df.to_excel(writer, sheet_name='Route Results', index=False)
-
-                                # Create POI Summary DataFrame
-                                poi_summary_df = pd.DataFrame([{
-                                    'POI_ID': poi['id'],
-                                    'POI Name': poi['name'],
-                                    'Coordinates': f"{poi['coordinates'][0]}, {poi['coordinates'][1]}",
-                                    'Threshold (km)': poi['threshold']
-                                } for poi in st.session_state.pois])
-
-                                # Create Site Summary DataFrame
-                                site_summary_df = pd.DataFrame([{
-                                    f'Site {zone_col} Zone': zone,
-                                    'Zone Coordinates': f"{zones_df[zones_df[zone_col] == zone]['Latitude'].values[0]}, {zones_df[zones_df[zone_col] == zone]['Longitude'].values[0]}"
-                                } for zone in site_zones])
-
-                                site_location_summary_df = pd.DataFrame([{
-                                    'Site Coordinates': f"{site_lat}, {site_lon}"
-                                }])
-
-                                # Write sheets
-                                poi_summary_df.to_excel(writer, sheet_name='Location Details', startrow=0, startcol=0, index=False)
-                                site_summary_df.to_excel(writer, sheet_name='Location Details', startrow=0, startcol=poi_summary_df.shape[1] + 2, index=False)
-                                site_location_summary_df.to_excel(writer, sheet_name='Location Details', startrow=0, startcol=poi_summary_df.shape[1] + site_summary_df.shape[1] + 3, index=False)
-
-                                # Apply Excel formatting
-                                workbook = writer.book
-                                for sheet_name in ['Route Results', 'Location Details']:
-                                    sheet = writer.sheets[sheet_name]
-                                    if sheet_name == 'Location Details':
-                                        apply_header_formatting(sheet, exclude_columns=[5,6,9])
-                                    else:
-                                        apply_header_formatting(sheet)
-                                    autofit_columns(sheet)
-
-                                # Create and format POI Traffic Analysis sheet
-                                calc_sheet = create_poi_analysis_sheet(workbook, st.session_state.pois)
-                                format_poi_analysis_sheet(calc_sheet, len(st.session_state.pois))
-
-                                # Create Raw Text sheet
-                                create_raw_text_sheet(workbook, content)
-
-                            return output.getvalue()
-
-                        def apply_header_formatting(sheet, exclude_columns=None):
-                            header_font = Font(name='Arial', size=11, bold=True, color='FFFFFF')
-                            header_fill = PatternFill(start_color='005295', end_color='005295', fill_type='solid')
-                            border = Border(left=Side(style='thin'), right=Side(style='thin'), 
-                                        top=Side(style='thin'), bottom=Side(style='thin'))
-                            if exclude_columns is None:
-                                exclude_columns = []
-                            for cell in sheet[1]:
-                                if cell.column not in exclude_columns:
-                                    cell.font = header_font
-                                    cell.fill = header_fill
-                                    cell.border = border
-                                    cell.alignment = Alignment(horizontal='center')
-
-                        def autofit_columns(sheet):
-                            for column in sheet.columns:
-                                max_length = 0
-                                column = [cell for cell in column]
-                                for cell in column:
-                                    try:
-                                        max_length = max(max_length, len(str(cell.value)))
-                                    except:
-                                        pass
-                                adjusted_width = max_length + 2
-                                sheet.column_dimensions[get_column_letter(column[0].column)].width = adjusted_width
-
-                        def create_poi_analysis_sheet(workbook, pois):
-                            calc_sheet = workbook.create_sheet(title='POI Traffic Analysis')
-                            total_row = len(pois) + 3
-                            
-                            # Non-rounded sums
-
-                            calc_sheet['B2'] = 'From/To'
-                            calc_sheet.merge_cells('C2:D2')
-                            calc_sheet['C2'] = 'In'
-                            calc_sheet.merge_cells('E2:F2')
-                            calc_sheet['E2'] = 'Out'
-                            
-                            for idx, poi in enumerate(pois, start=3):
-                                calc_sheet[f'B{idx}'] = poi['name']
-                                calc_sheet[f'C{idx}'] = f'=SUMIFS(\'Route Results\'!E:E,\'Route Results\'!C:C,"origin_to_site",\'Route Results\'!D:D,"{poi["name"]}")'
-                                calc_sheet[f'E{idx}'] = f'=SUMIFS(\'Route Results\'!E:E,\'Route Results\'!C:C,"site_to_destination",\'Route Results\'!D:D,"{poi["name"]}")'
-                                calc_sheet[f'D{idx}'] = f'=IF(C{idx}>0,C{idx}/C{total_row},0)'
-                                calc_sheet[f'F{idx}'] = f'=IF(E{idx}>0,E{idx}/E{total_row},0)'
-
-                            calc_sheet[f'B{total_row}'] = "Total"
-                            calc_sheet[f'C{total_row}'] = f'=SUM(C3:C{total_row-1})'
-                            calc_sheet[f'D{total_row}'] = f'=SUM(D3:D{total_row-1})'
-                            calc_sheet[f'E{total_row}'] = f'=SUM(E3:E{total_row-1})'
-                            calc_sheet[f'F{total_row}'] = f'=SUM(F3:F{total_row-1})'
-
-                            # Rounded sums
-
-                            calc_sheet['H2'] = 'From/To'
-                            calc_sheet['I2'] = 'In'
-                            calc_sheet['J2'] = 'Out'
-
-                            for idx, poi in enumerate(pois, start=3):
-                                calc_sheet[f'H{idx}'] = poi['name']
-                                calc_sheet[f'I{idx}'] = f'=MROUND(D{idx},0.05)'
-                                calc_sheet[f'J{idx}'] = f'=MROUND(F{idx},0.05)'
-
-
-                            calc_sheet[f'H{total_row}'] = "Total"
-                            calc_sheet[f'I{total_row}'] = f'=SUM(I3:I{total_row-1})'
-                            calc_sheet[f'J{total_row}'] = f'=SUM(J3:J{total_row-1})'
-                            
-                            return calc_sheet
-
-                        def format_poi_analysis_sheet(sheet, num_pois):
-                            total_row = num_pois + 3
-                            
-                            # Styles
-                            header_font = Font(name='Arial', size=11, bold=True, color='FFFFFF')
-                            header_fill = PatternFill(start_color='005295', end_color='005295', fill_type='solid')
-                            cell_font = Font(name='Arial', size=11)
-                            total_fill = PatternFill(start_color='F2F2F2', end_color='F2F2F2', fill_type='solid')
-                            border_style = Border(left=Side(style='thin'), right=Side(style='thin'), 
-                                        top=Side(style='thin'), bottom=Side(style='thin'))
-
-                            # Format headers
-                            for col in ['B', 'C', 'D', 'E', 'F', 'H', 'I', 'J']:
-                                cell = sheet[f'{col}2']
-                                cell.font = header_font
-                                cell.fill = header_fill
-                                cell.alignment = Alignment(horizontal='center')
-                                cell.border = border_style
-
-                            # Format POI rows
-                            for row in range(3, total_row):
-                                sheet[f'B{row}'].font = header_font
-                                sheet[f'B{row}'].fill = header_fill
-                                sheet[f'H{row}'].font = header_font
-                                sheet[f'H{row}'].fill = header_fill
-                                for col in ['C', 'D', 'E', 'F', 'I', 'J']:
-                                    cell = sheet[f'{col}{row}']
-                                    cell.font = cell_font
-                                    cell.alignment = Alignment(horizontal='right')
-                                    cell.border = border_style
-                                    if col in ['D', 'F', 'I','J']:
-                                        cell.number_format = '0.00%'
-
-                            # Format the "Total" row
-                            sheet[f'B{total_row}'].font = header_font
-                            sheet[f'B{total_row}'].fill = header_fill
-                            sheet[f'H{total_row}'].font = header_font
-                            sheet[f'H{total_row}'].fill = header_fill
-
-                            for col in ['C', 'D', 'E', 'F', 'I', 'J']:
-                                total_cell = sheet[f'{col}{total_row}']
-                                total_cell.font = Font(name='Arial', size=11, bold=True)
-                                total_cell.fill = total_fill
-                                total_cell.alignment = Alignment(horizontal='right')
-                                total_cell.border = border_style
-                                if col in ['D', 'F', 'I', 'J']:  # Ensure percentage format for Total row in columns D and F
-                                    total_cell.number_format = '0.00%'
-
-                            # Apply "all borders" to the entire table
-                            for row in range(2, total_row + 1):
-                                for col in ['B', 'C', 'D', 'E', 'F', 'H', 'I', 'J']:
-                                    cell = sheet[f'{col}{row}']
-                                    cell.border = border_style
-
-                            # Autofit the width of column B
-                            column_letters = ['B','H']
-                            max_length = 0
-
-                            # Iterate through all rows in column B to find the longest content
-                            for row in sheet.iter_rows(min_col=2, max_col=2, min_row=2, max_row=total_row):
-                                for cell in row:
-                                    if cell.value:  # Ensure the cell has a value
-                                        max_length = max(max_length, len(str(cell.value)))
-
-                            # Adjust the column width (adding a little extra for padding)
-                            for column_letter in column_letters:
-                                sheet.column_dimensions[column_letter].width = max_length + 2
-
-                        def create_raw_text_sheet(workbook, content):
-                            raw_sheet = workbook.create_sheet(title='Raw Text')
-                            row_idx = 1
-                            split_mode = False
-                            raw_sheet.sheet_view.show_grid_lines = False
-                            
-                            for line in content.split('\n'):
-                                stripped_line = line.strip()
-                                if stripped_line.startswith("gta06_orig") or stripped_line.startswith("tts22_orig"):
-                                    split_mode = True
-                                    
-                                if split_mode and stripped_line:
-                                    parts = stripped_line.split()
-                                    for col_idx, value in enumerate(parts, start=1):
-                                        raw_sheet.cell(row=row_idx, column=col_idx, value=value)
-                                else:
-                                    raw_sheet.cell(row=row_idx, column=1, value=stripped_line)
-                                
-                                row_idx += 1
-                            
-                        
-                        excel_data = generate_formatted_excel()
-                        ste.download_button(
+                            export_df = display_df[['origin_id', 'dest_id', 'route_type', 'POI', 'total'] + period_columns]
+
+                            # Create POI Summary DataFrame
+                            poi_summary_df = pd.DataFrame([{
+                                'POI_ID': poi['id'],
+                                'POI Name': poi['name'],
+                                'Coordinates': f"{poi['coordinates'][0]}, {poi['coordinates'][1]}",
+                                'Threshold (km)': poi['threshold']
+                            } for poi in export_pois])
+
+                            # Create Site Summary DataFrame
+                            site_summary_df = pd.DataFrame([{
+                                f'Site {zone_col} Zone': zone,
+                                'Zone Coordinates': f"{zones_df[zones_df[zone_col] == zone]['Latitude'].values[0]}, {zones_df[zones_df[zone_col] == zone]['Longitude'].values[0]}"
+                            } for zone in site_zones])
+
+                            site_location_summary_df = pd.DataFrame([{
+                                'Site Coordinates': f"{site_lat}, {site_lon}"
+                            }])
+
+                            location_tables = [
+                                (poi_summary_df, 0),
+                                (site_summary_df, poi_summary_df.shape[1] + 2),
+                                (site_location_summary_df, poi_summary_df.shape[1] + site_summary_df.shape[1] + 3),
+                            ]
+                            return build_results_workbook(export_df, location_tables, export_pois, content,
+                                                          formulas=live_formulas)
+
+                        # The workbook is only built when the button is clicked, on
+                        # Streamlit's download thread rather than in this rerun
+                        live_formulas = st.checkbox(
+                            "Use live formulas in the POI Traffic Analysis sheet",
+                            help="By default the sheet holds computed values, so it opens without "
+                                 "recalculating. Formulas recalculate if the Route Results sheet is edited."
+                        )
+                        export_key = (st.session_state.results_key, st.session_state.results_version, 'xlsx', live_formulas)
+                        st.download_button(
                             label="Download Results as Excel",
-                            data=excel_data,
+                            data=lazy_download(export_key, st.session_state.results_df, generate_formatted_excel),
                             file_name="tts_analysis_results.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            on_click='ignore')
+
+                        # The full results with route geometries and POI distances,
+                        # as Parquet tables that "Load saved results" can restore
+                        export_results_df = st.session_state.results_df
+                        export_run = st.session_state.route_run
+                        export_inputs = {
+                            'data_choice': data_choice,
+                            'site_zones': [int(zone) for zone in site_zones],
+                            'site_lat': site_lat,
+                            'site_lon': site_lon,
+                            'pois': export_pois,
+                            'results_key': st.session_state.results_key,
+                            'routing': get_routing_backend().describe(),
+                        }
+                        bundle_key = (st.session_state.results_key, st.session_state.results_version, 'bundle')
+                        st.download_button(
+                            label="Download Results Bundle (Parquet)",
+                            data=lazy_download(
+                                bundle_key,
+                                export_results_df,
+                                lambda: save_results_bundle(export_results_df, export_run, export_inputs, content)
+                            ),
+                            file_name="tts_analysis_results.zip",
+                            mime="application/zip",
+                            on_click='ignore')
 
                         if st.session_state.results_df is not None and not st.session_state.results_df.empty:
-                            # Add a toggle button above the map
                             zone_lookup = st.session_state.get('zone_lookup', {})
-                                # Only rebuild if results have changed
-                            if 'route_map_html' not in st.session_state or \
-                                st.session_state.get('route_map_results_id') != id(st.session_state.results_df):
-                                    
-                                    with st.spinner("Generating map..."):
 
-                                        # Calculate max traffic for scaling route thickness
-                                        max_traffic = st.session_state.results_df[
-                                            st.session_state.results_df['passes']
-                                        ]['total'].max() or 1
+                            def get_route_weight(total, max_traffic, min_weight=1, max_weight=8):
+                                """Scale route thickness between min and max weight based on traffic volume"""
+                                return min_weight + (max_weight - min_weight) * (total / max_traffic)
+
+                            def build_route_network(results_df):
+                                # Matching routes as one volume network: route vertices are
+                                # snapped onto shared road segments and each segment is kept
+                                # once per POI and direction (group = POI index * 2, +1 for
+                                # site to destination) with the summed trips on it
+                                mapped = results_df[results_df['passes'] & (results_df['route'] >= 0)]
+                                poi_index = mapped['first_poi'].to_numpy(dtype=np.int64)
+                                outbound = (mapped['route_type'] == 'site_to_destination').to_numpy()
+                                groups = poi_index * 2 + outbound
+                                totals = mapped['total'].to_numpy()
+
+                                segments, segment_groups, volumes = aggregate_segments(
+                                    st.session_state.route_run['store'], mapped['route'].to_numpy(), totals, groups
+                                )
+                                max_volume = volumes.max() if len(volumes) else 1
+
+                                traffic_in, traffic_out = {}, {}
+                                for j, poi in enumerate(st.session_state.pois):
+                                    traffic_in[poi['name']] = traffic_in.get(poi['name'], 0) + int(totals[(poi_index == j) & ~outbound].sum())
+                                    traffic_out[poi['name']] = traffic_out.get(poi['name'], 0) + int(totals[(poi_index == j) & outbound].sum())
+
+                                # Origin zones for trips to the site, destination zones for trips from it
+                                zone_points = pd.DataFrame({
+                                    'zone': np.where(outbound, mapped['dest_id'], mapped['origin_id']),
+                                    'group': groups,
+                                    'total': totals
+                                }).groupby(['zone', 'group'], as_index=False)['total'].sum()
+                                zone_coords = pd.DataFrame.from_dict(zone_lookup, orient='index')
+                                zone_points = zone_points.join(zone_coords, on='zone', how='inner').rename(
+                                    columns={'Latitude': 'lat', 'Longitude': 'lon'}
+                                )
+
+                                # Segments drawn with the same colour and width are joined
+                                # into polylines and simplified for display; matching has
+                                # already used the full-resolution routes
+                                widths = np.rint(get_route_weight(volumes, max_volume)).astype(np.int64)
+                                batches = []
+                                for group, width in sorted(set(zip(segment_groups.tolist(), widths.tolist()))):
+                                    in_batch = (segment_groups == group) & (widths == width)
+                                    batches.append({
+                                        'group': group,
+                                        'width': width,
+                                        'min_volume': volumes[in_batch].min(),
+                                        'max_volume': volumes[in_batch].max(),
+                                        'lines': [simplify_coords(line, DISPLAY_TOLERANCE_M)
+                                                  for line in chain_segments(segments[in_batch])]
+                                    })
 
-                                        def get_route_weight(total, max_traffic, min_weight=1, max_weight=8):
-                                            """Scale route thickness between min and max weight based on traffic volume"""
-                                            return min_weight + (max_weight - min_weight) * (total / max_traffic)
+                                return {
+                                    'batches': batches,
+                                    'num_segments': len(segments),
+                                    'traffic_in': traffic_in,
+                                    'traffic_out': traffic_out,
+                                    'zone_points': zone_points
+                                }
+
+                            # Shared by both renderers; only rebuilt when the results change
+                            if st.session_state.get('route_network_version') != st.session_state.results_version:
+                                st.session_state.route_network = build_route_network(st.session_state.results_df)
+                                st.session_state.route_network_version = st.session_state.results_version
+                            network = st.session_state.route_network
+
+                            # Leaflet struggles with thousands of lines and markers, so
+                            # large result sets default to the WebGL renderer
+                            large_map = network['num_segments'] + len(network['zone_points']) > LARGE_ROUTE_MAP_FEATURES
+                            route_renderer = st.radio(
+                                "Route map renderer",
+                                ["Folium", "WebGL (deck.gl)"],
+                                index=1 if large_map else 0,
+                                horizontal=True,
+                                help="WebGL draws large regional networks smoothly; Folium gives a standalone map with a layer control"
+                            )
+
+                            if route_renderer == "WebGL (deck.gl)":
+                                groups = sorted({batch['group'] for batch in network['batches']} | set(network['zone_points']['group'].tolist()))
+                                visible = st.multiselect(
+                                    "Route layers",
+                                    groups,
+                                    default=groups,
+                                    format_func=lambda group: group_label(group, st.session_state.pois)
+                                )
+                                route_deck = build_route_deck(
+                                    (site_lat, site_lon),
+                                    st.session_state.pois,
+                                    [FOLIUM_TO_CSS.get(poi_colour_map.get(poi['name'], 'gray'), '#808080')
+                                     for poi in st.session_state.pois],
+                                    network['batches'], network['zone_points'], visible
+                                )
+                                # The standalone HTML is only rendered when downloaded
+                                st.download_button(
+                                    label="Download Route Map",
+                                    data=lambda: route_deck.to_html(as_string=True),
+                                    file_name="Route_map.html",
+                                    mime="text/html",
+                                    on_click='ignore'
+                                )
+                                st.subheader("Route Map")
+                                st.pydeck_chart(route_deck, height=600)
+
+                            else:
+                                # Only rebuild if results have changed
+                                if 'route_map_html' not in st.session_state or \
+                                    st.session_state.get('route_map_version') != st.session_state.results_version:
+
+                                    with st.spinner("Generating map..."):
 
                                         route_map = folium.Map(location=[site_lat, site_lon], zoom_start=10, tiles="CartoDB Voyager")
 
@@ -1392,50 +1787,22 @@ try:
                                         poi_traffic_in  = {poi['name']: 0 for poi in st.session_state.pois}
                                         poi_traffic_out = {poi['name']: 0 for poi in st.session_state.pois}
 
-                                        # Add routes from stored geometry
-                                        for _, row in st.session_state.results_df.iterrows():
-                                            if not row['passes'] or row['geometry'] is None:
-                                                continue
-
-                                            coords = decode(row['geometry'])
-                                            weight = get_route_weight(row['total'], max_traffic)
-
-                                            # Get the first matched POI name to determine colour and group
-                                            poi_name = row['intersected_pois'][0]['name'] if row['intersected_pois'] else None
-                                            if not poi_name:
-                                                continue
-
-                                            colour = poi_colour_map.get(poi_name, 'gray')
-
-                                            if row['route_type'] == 'origin_to_site':
-                                                poi_traffic_in[poi_name] = poi_traffic_in.get(poi_name, 0) + row['total']
-                                                folium.PolyLine(
-                                                    coords,
-                                                    weight=weight,
-                                                    color=colour,
-                                                    opacity=0.7,
-                                                    popup=folium.Popup(
-                                                        f"<b>Origin Zone:</b> {row['origin_id']}<br>"
-                                                        f"<b>POI:</b> {poi_name}<br>"
-                                                        f"<b>Traffic:</b> {row['total']}",
-                                                        max_width=200
-                                                    )
-                                                ).add_to(origin_route_groups[poi_name])
-
-                                            elif row['route_type'] == 'site_to_destination':
-                                                poi_traffic_out[poi_name] = poi_traffic_out.get(poi_name, 0) + row['total']
-                                                folium.PolyLine(
-                                                    coords,
-                                                    weight=weight,
-                                                    color=colour,
-                                                    opacity=0.7,
-                                                    popup=folium.Popup(
-                                                        f"<b>Destination Zone:</b> {row['dest_id']}<br>"
-                                                        f"<b>POI:</b> {poi_name}<br>"
-                                                        f"<b>Traffic:</b> {row['total']}",
-                                                        max_width=200
-                                                    )
-                                                ).add_to(dest_route_groups[poi_name])
+                                        # Draw the segment volume network, one multi-line per POI,
+                                        # direction and line weight
+                                        poi_traffic_in.update(network['traffic_in'])
+                                        poi_traffic_out.update(network['traffic_out'])
+
+                                        for batch in network['batches']:
+                                            group = batch['group']
+                                            poi_name = st.session_state.pois[group // 2]['name']
+                                            folium.PolyLine(
+                                                [line.tolist() for line in batch['lines']],
+                                                weight=batch['width'],
+                                                color=poi_colour_map.get(poi_name, 'gray'),
+                                                opacity=0.7,
+                                                tooltip=(f"{group_label(group, st.session_state.pois)}: "
+                                                         f"{batch['min_volume']:,.0f}–{batch['max_volume']:,.0f} trips")
+                                            ).add_to((dest_route_groups if group % 2 else origin_route_groups)[poi_name])
 
                                         # Add POI markers and threshold circles
                                         for poi in st.session_state.pois:
@@ -1467,44 +1834,27 @@ try:
 
                                         # Add zone node markers — into the SAME per-POI/direction
                                         # group as the route lines, so one toggle controls both.
-                                        for _, row in st.session_state.results_df.iterrows():
-                                            if not row['passes']:
-                                                continue
-
-                                            poi_name = row['intersected_pois'][0]['name'] if row['intersected_pois'] else None
-                                            if not poi_name or poi_name not in origin_route_groups:
-                                                continue
-                                            colour = poi_colour_map.get(poi_name, 'gray')
-
-                                            if row['route_type'] == 'origin_to_site':
-                                                zone_id = row['origin_id']
-                                                zone_row = zone_lookup.get(zone_id)
-                                                if zone_row:
-                                                    folium.Marker(
-                                                        location=[zone_row['Latitude'], zone_row['Longitude']],
-                                                        popup=folium.Popup(
-                                                            f"<b>Origin Zone:</b> {zone_id}<br>"
-                                                            f"<b>POI:</b> {poi_name}<br>"
-                                                            f"<b>Total Trips:</b> {row['total']}",
-                                                            max_width=200
-                                                        ),
-                                                        icon=folium.Icon(color=colour, icon='car', prefix='fa')
-                                                    ).add_to(origin_route_groups[poi_name])
-
-                                            else:
-                                                zone_id = row['dest_id']
-                                                zone_row = zone_lookup.get(zone_id)
-                                                if zone_row:
-                                                    folium.Marker(
-                                                        location=[zone_row['Latitude'], zone_row['Longitude']],
-                                                        popup=folium.Popup(
-                                                            f"<b>Destination Zone:</b> {zone_id}<br>"
-                                                            f"<b>POI:</b> {poi_name}<br>"
-                                                            f"<b>Total Trips:</b> {row['total']}",
-                                                            max_width=200
-                                                        ),
-                                                        icon=folium.Icon(color=colour, icon='car-side', prefix='fa')
-                                                    ).add_to(dest_route_groups[poi_name])
+                                        # Each zone is one marker per group with its summed trips,
+                                        # as the deck.gl renderer draws them.
+                                        zone_points = network['zone_points']
+                                        for zone_id, group, total, lat, lon in zip(
+                                            zone_points['zone'].tolist(), zone_points['group'].tolist(),
+                                            zone_points['total'].tolist(), zone_points['lat'].tolist(),
+                                            zone_points['lon'].tolist()
+                                        ):
+                                            poi_name = st.session_state.pois[group // 2]['name']
+                                            outbound = group % 2
+                                            folium.Marker(
+                                                location=[lat, lon],
+                                                popup=folium.Popup(
+                                                    f"<b>{'Destination' if outbound else 'Origin'} Zone:</b> {zone_id}<br>"
+                                                    f"<b>POI:</b> {poi_name}<br>"
+                                                    f"<b>Total Trips:</b> {total}",
+                                                    max_width=200
+                                                ),
+                                                icon=folium.Icon(color=poi_colour_map.get(poi_name, 'gray'),
+                                                                 icon='car-side' if outbound else 'car', prefix='fa')
+                                            ).add_to((dest_route_groups if outbound else origin_route_groups)[poi_name])
 
                                         # Build legend HTML
                                         legend_html = """
@@ -1564,18 +1914,18 @@ try:
 
                                         # Cache the rendered HTML
                                         st.session_state.route_map_html = route_map.get_root().render()
-                                        st.session_state.route_map_results_id = id(st.session_state.results_df)
-
-                            # Download button uses cached HTML
-                            ste.download_button(
-                                label="Download Route Map",
-                                data=st.session_state.route_map_html,
-                                file_name="Route_map.html",
-                                mime="text/html"
-                                )
+                                        st.session_state.route_map_version = st.session_state.results_version
+
+                                # Download button uses cached HTML
+                                ste.download_button(
+                                    label="Download Route Map",
+                                    data=st.session_state.route_map_html,
+                                    file_name="Route_map.html",
+                                    mime="text/html"
+                                    )
 
-                            st.subheader("Route Map")
-                            components.html(st.session_state.route_map_html, height=600)
+                                st.subheader("Route Map")
+                                components.html(st.session_state.route_map_html, height=600)
 
                 except Exception as e:
                     status_text.text(f"Error during processing: {str(e)}")
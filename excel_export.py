@@ -0,0 +1,309 @@
+import io
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+from tts_parser import iter_lines
+
+# --- Excel export ------------------------------------------------------------
+#
+# The results workbook is written with openpyxl's write-only mode, which
+# streams each sheet's rows out as they are appended instead of keeping a cell
+# object per value, so memory stays flat however many route rows there are.
+# The catch is that rows must be written top to bottom with their styles
+# attached, and column widths and sheet view settings set before the first
+# row. Widths are therefore worked out from the DataFrames up front (one
+# vectorized pass per column) rather than by re-reading every written cell.
+
+HEADER_FONT = Font(name='Arial', size=11, bold=True, color='FFFFFF')
+HEADER_FILL = PatternFill(start_color='005295', end_color='005295', fill_type='solid')
+CELL_FONT = Font(name='Arial', size=11)
+TOTAL_FONT = Font(name='Arial', size=11, bold=True)
+TOTAL_FILL = PatternFill(start_color='F2F2F2', end_color='F2F2F2', fill_type='solid')
+THIN_BORDER = Border(left=Side(style='thin'), right=Side(style='thin'),
+                     top=Side(style='thin'), bottom=Side(style='thin'))
+CENTER = Alignment(horizontal='center')
+RIGHT = Alignment(horizontal='right')
+
+# Rows converted to Python values at a time when streaming a DataFrame
+CHUNK_ROWS = 10000
+
+# Zone Summary columns for routes without a POI, and for routes labelled
+# "Not routed - <reason>" in the results
+NO_POI = 'No POI'
+NOT_ROUTED = 'Not routed'
+
+# Lines from this header on are split into one cell per column in the Raw Text sheet
+RAW_TABLE_HEADERS = ("gta06_orig", "tts22_orig")
+
+
+def styled_cell(sheet, value, font=None, fill=None, border=None, alignment=None, number_format=None):
+    """A write-only cell with the given styles"""
+    cell = WriteOnlyCell(sheet, value=value)
+    if font is not None:
+        cell.font = font
+    if fill is not None:
+        cell.fill = fill
+    if border is not None:
+        cell.border = border
+    if alignment is not None:
+        cell.alignment = alignment
+    if number_format is not None:
+        cell.number_format = number_format
+    return cell
+
+
+def header_cell(sheet, value):
+    return styled_cell(sheet, value, font=HEADER_FONT, fill=HEADER_FILL, border=THIN_BORDER, alignment=CENTER)
+
+
+def text_length(values):
+    """Length of the longest value of a Series once written as text (0 if empty)"""
+    if len(values) == 0:
+        return 0
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Only the categories actually used need measuring
+        used = np.unique(values.cat.codes[values.cat.codes >= 0])
+        lengths = values.cat.categories.astype(str).str.len().to_numpy()[used]
+        return int(lengths.max()) if len(lengths) else 0
+    if pd.api.types.is_integer_dtype(values.dtype):
+        # The widest integer is the largest or (with its sign) the smallest
+        return max(len(str(values.max())), len(str(values.min())))
+    values = values.dropna()
+    return int(values.astype(str).str.len().max()) if len(values) else 0
+
+
+def column_widths(df, padding=2):
+    """Autofit widths for each column of df: longest header or value plus padding"""
+    return [max(len(str(column)), text_length(df[column])) + padding for column in df.columns]
+
+
+def iter_rows(df):
+    """Rows of df as tuples of plain Python values, None for missing, a chunk at a time"""
+    for start in range(0, len(df), CHUNK_ROWS):
+        chunk = df.iloc[start:start + CHUNK_ROWS].astype(object)
+        yield from chunk.where(chunk.notna(), None).itertuples(index=False, name=None)
+
+
+def write_table_sheet(workbook, title, df):
+    """A sheet holding df with a formatted header row and autofit columns"""
+    sheet = workbook.create_sheet(title=title)
+    for col_idx, width in enumerate(column_widths(df), start=1):
+        sheet.column_dimensions[get_column_letter(col_idx)].width = width
+    sheet.append([header_cell(sheet, column) for column in df.columns])
+    for row in iter_rows(df):
+        sheet.append(row)
+    return sheet
+
+
+def write_side_by_side_sheet(workbook, title, tables):
+    """
+    A sheet holding several small tables next to each other, each a
+    (DataFrame, startcol) pair with startcol 0-based as in DataFrame.to_excel.
+    The columns between tables are left blank.
+    """
+    sheet = workbook.create_sheet(title=title)
+    for df, startcol in tables:
+        for col_idx, width in enumerate(column_widths(df), start=startcol + 1):
+            sheet.column_dimensions[get_column_letter(col_idx)].width = width
+
+    num_columns = max(startcol + df.shape[1] for df, startcol in tables)
+    header = [None] * num_columns
+    for df, startcol in tables:
+        for offset, column in enumerate(df.columns):
+            header[startcol + offset] = header_cell(sheet, column)
+    sheet.append(header)
+
+    columns = [list(iter_rows(df)) for df, _ in tables]
+    for row_idx in range(max(len(df) for df, _ in tables)):
+        row = [None] * num_columns
+        for (df, startcol), rows in zip(tables, columns):
+            if row_idx < len(rows):
+                row[startcol:startcol + df.shape[1]] = rows[row_idx]
+        sheet.append(row)
+    return sheet
+
+
+def mround(values, multiple=0.05):
+    """Excel's MROUND for non-negative values: nearest multiple, halves rounded up"""
+    multiples = np.floor(np.round(np.asarray(values, dtype=np.float64) / multiple, 9) + 0.5)
+    return np.round(multiples * multiple, 10)
+
+
+def poi_traffic_summary(route_results, pois):
+    """
+    Trips in (origin_to_site) and out (site_to_destination) per POI, one row
+    per POI in order. As with the sheet's SUMIFS formulas, a route counts
+    towards a POI when its POI label is exactly that POI's name. Shares are
+    of the direction's total over all POIs, also given rounded to 5%.
+    """
+    names = [poi['name'] for poi in pois]
+    trips = (
+        route_results[route_results['POI'].isin(names)]
+        .groupby([route_results['POI'].astype(str), route_results['route_type'].astype(str)])['total'].sum()
+        .unstack()
+        .reindex(index=names, columns=['origin_to_site', 'site_to_destination'])
+        .fillna(0)
+    )
+    summary = pd.DataFrame(index=names)
+    for direction, route_type in (('in', 'origin_to_site'), ('out', 'site_to_destination')):
+        summary[f'{direction}_trips'] = trips[route_type].to_numpy(dtype=np.int64)
+        direction_total = summary[f'{direction}_trips'].sum()
+        summary[f'{direction}_share'] = summary[f'{direction}_trips'] / direction_total if direction_total > 0 else 0.0
+        summary[f'{direction}_rounded'] = mround(summary[f'{direction}_share'])
+    return summary
+
+
+def zone_poi_summary(route_results):
+    """
+    Pivot of trips by origin zone (inbound routes) or destination zone
+    (outbound routes) against POI label, with each zone's total trips.
+    Routes without a POI and routes that were never routed (whatever the
+    reason) get one trailing column each after the POIs.
+    """
+    routed = route_results[route_results['route_type'] != 'invalid_zone']
+    inbound = (routed['route_type'] == 'origin_to_site').to_numpy()
+    labels = routed['POI'].astype(str)
+    labels = labels.where(~labels.str.startswith(NOT_ROUTED), NOT_ROUTED).replace('', NO_POI)
+    zones = pd.DataFrame({
+        'route_type': routed['route_type'].astype(str).to_numpy(),
+        'zone': np.where(inbound, routed['origin_id'], routed['dest_id']),
+        'POI': labels.to_numpy(),
+        'total': routed['total'].to_numpy(dtype=np.int64),
+    })
+    pivot = zones.pivot_table(index=['route_type', 'zone'], columns='POI', values='total',
+                              aggfunc='sum', fill_value=0)
+    trailing = [label for label in (NO_POI, NOT_ROUTED) if label in pivot.columns]
+    pivot = pivot[sorted(label for label in pivot.columns if label not in trailing) + trailing].astype(np.int64)
+    pivot['Total'] = pivot.sum(axis=1)
+    pivot.columns.name = None
+    return pivot.reset_index()
+
+
+def write_poi_analysis_sheet(workbook, pois, route_results, formulas=False, results_sheet='Route Results'):
+    """
+    The POI Traffic Analysis sheet: per POI inbound and outbound trips from
+    the results (columns C route_type, D POI, E total of the results sheet),
+    their shares of the total, and the shares rounded to 5%. Values are
+    computed here so the sheet opens with them and needs no recalculation;
+    with formulas=True the cells hold the equivalent formulas instead, with
+    SUMIFS over just the results rows rather than whole columns.
+    """
+    sheet = workbook.create_sheet(title='POI Traffic Analysis')
+    total_row = len(pois) + 3
+    last = total_row - 1
+    summary = poi_traffic_summary(route_results, pois)
+
+    name_width = max([len('From/To'), len('Total')] + [len(str(poi['name'])) for poi in pois]) + 2
+    for column_letter in ('B', 'H'):
+        sheet.column_dimensions[column_letter].width = name_width
+
+    def value_cell(value, percent=False):
+        return styled_cell(sheet, value, font=CELL_FONT, border=THIN_BORDER, alignment=RIGHT,
+                           number_format='0.00%' if percent else None)
+
+    def total_cell(value, percent=False):
+        return styled_cell(sheet, value, font=TOTAL_FONT, fill=TOTAL_FILL, border=THIN_BORDER,
+                           alignment=RIGHT, number_format='0.00%' if percent else None)
+
+    def name_cell(value):
+        return styled_cell(sheet, value, font=HEADER_FONT, fill=HEADER_FILL, border=THIN_BORDER)
+
+    last_result_row = max(len(route_results) + 1, 2)
+
+    def sumifs(route_type, poi_name):
+        def column(letter):
+            return f"'{results_sheet}'!${letter}$2:${letter}${last_result_row}"
+        return f'=SUMIFS({column("E")},{column("C")},"{route_type}",{column("D")},"{poi_name}")'
+
+    # Non-rounded sums in B:F, rounded shares in H:J
+    sheet.append([])
+    sheet.append([
+        None, header_cell(sheet, 'From/To'), header_cell(sheet, 'In'), header_cell(sheet, None),
+        header_cell(sheet, 'Out'), header_cell(sheet, None), None,
+        header_cell(sheet, 'From/To'), header_cell(sheet, 'In'), header_cell(sheet, 'Out'),
+    ])
+    sheet.merged_cells.add('C2:D2')
+    sheet.merged_cells.add('E2:F2')
+
+    for idx, (poi, values) in enumerate(zip(pois, summary.to_dict('records')), start=3):
+        if formulas:
+            cells = [sumifs('origin_to_site', poi['name']), f'=IF(C{idx}>0,C{idx}/C{total_row},0)',
+                     sumifs('site_to_destination', poi['name']), f'=IF(E{idx}>0,E{idx}/E{total_row},0)',
+                     f'=MROUND(D{idx},0.05)', f'=MROUND(F{idx},0.05)']
+        else:
+            cells = [values['in_trips'], values['in_share'], values['out_trips'], values['out_share'],
+                     values['in_rounded'], values['out_rounded']]
+        sheet.append([
+            None,
+            name_cell(poi['name']),
+            value_cell(cells[0]),
+            value_cell(cells[1], percent=True),
+            value_cell(cells[2]),
+            value_cell(cells[3], percent=True),
+            None,
+            name_cell(poi['name']),
+            value_cell(cells[4], percent=True),
+            value_cell(cells[5], percent=True),
+        ])
+
+    if formulas:
+        totals = [f'=SUM({col}3:{col}{last})' for col in ('C', 'D', 'E', 'F', 'I', 'J')]
+    else:
+        totals = [int(summary[column].sum()) if column.endswith('_trips') else float(summary[column].sum())
+                  for column in ('in_trips', 'in_share', 'out_trips', 'out_share', 'in_rounded', 'out_rounded')]
+    sheet.append([
+        None,
+        name_cell("Total"),
+        total_cell(totals[0]),
+        total_cell(totals[1], percent=True),
+        total_cell(totals[2]),
+        total_cell(totals[3], percent=True),
+        None,
+        name_cell("Total"),
+        total_cell(totals[4], percent=True),
+        total_cell(totals[5], percent=True),
+    ])
+    return sheet
+
+
+def write_raw_text_sheet(workbook, content):
+    """
+    The TTS export as pasted: header lines one per row in column A, and from
+    the OD table header on, each line split into one cell per column
+    """
+    sheet = workbook.create_sheet(title='Raw Text')
+    sheet.sheet_view.showGridLines = False
+    split_mode = False
+    for line in iter_lines(content):
+        stripped_line = line.strip()
+        if stripped_line.startswith(RAW_TABLE_HEADERS):
+            split_mode = True
+        if split_mode and stripped_line:
+            sheet.append(stripped_line.split())
+        else:
+            sheet.append([stripped_line or None])
+    return sheet
+
+
+def build_results_workbook(route_results, location_tables, pois, content, formulas=False):
+    """
+    Write the analysis workbook and return it as .xlsx bytes: Route Results
+    (route_results), Location Details (location_tables, as for
+    write_side_by_side_sheet), POI Traffic Analysis (formulas as for
+    write_poi_analysis_sheet), Zone Summary and the Raw Text export.
+    """
+    workbook = Workbook(write_only=True)
+    write_table_sheet(workbook, 'Route Results', route_results)
+    write_side_by_side_sheet(workbook, 'Location Details', location_tables)
+    write_poi_analysis_sheet(workbook, pois, route_results, formulas=formulas)
+    write_table_sheet(workbook, 'Zone Summary', zone_poi_summary(route_results))
+    write_raw_text_sheet(workbook, content)
+
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
@@ -1,7 +1,4 @@
 import streamlit as st
-import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
@@ -13,31 +10,20 @@ from pathlib import Path
 import tempfile
 import os
 
+from zone_data import load_zone_centroids, load_zone_polygons
+from zone_index import ZoneIndex
+
 # Cache functions for loading zone data
 @st.cache_data(show_spinner="Loading zone data...")
 def load_zones_data(data_choice):
     """Load zones data based on selected year"""
-    if data_choice == "2006 Zones":
-        zones_df = pd.read_csv('2006Zones.csv')
-        zone_col = 'gta06'
-        region_col = 'region'
-    else:
-        zones_df = pd.read_csv('2022Zones.csv')
-        zone_col = 'TTS2022'
-        region_col = 'Reg_name'
-    return zones_df, zone_col, region_col
-
-@st.cache_data(show_spinner="Loading polygons data...")
-def load_geojson_data(data_choice):
-    """Load GeoJSON data based on selected year"""
-    if data_choice == "2006 Zones":
-        file_path = "2006Polygons.geojson"
-    else:
-        file_path = "2022Polygons.geojson"
-    gdf = gpd.read_file(file_path)
-    if gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
-    return gdf
+    return load_zone_centroids(data_choice)
+
+@st.cache_resource(show_spinner="Indexing zone polygons...")
+def get_zone_index(data_choice):
+    """Polygon index for site zone lookups, shared by every session"""
+    _, zone_col, region_col = load_zones_data(data_choice)
+    return ZoneIndex(load_zone_polygons(data_choice), zone_col, region_col)
 
 
 def run_webscraper(site_zones, time_periods, data_choice, custom_time=None, headless=True):
@@ -279,7 +265,7 @@ data_choice = st.pills("Select Data Year:", Zone_Year, selection_mode="single")
 
 if data_choice:
     zones_df, zone_col, region_col = load_zones_data(data_choice)
-    gdf = load_geojson_data(data_choice)
+    zone_index = get_zone_index(data_choice)
 
     col1, col2 = st.columns(2)
     
@@ -297,14 +283,9 @@ if data_choice:
         )
     if coords_input and data_choice:  # Add data_choice check
         site_lat, site_lon = map(float, coords_input.replace(" ", "").split(","))
-        point = Point(site_lon,site_lat)
-        matching_polygon = gdf[gdf.contains(point)]
-
-        if not matching_polygon.empty:
-            if data_choice == "2006 Zones":
-                suggested_zone = matching_polygon.iloc[0]['gta06']
-            else:
-                suggested_zone = matching_polygon.iloc[0]['TTS2022'] 
+        suggested_zone = zone_index.zone_at(site_lat, site_lon)
+
+        if suggested_zone is not None:
             st.write(f"Recommended zone based on coordinates: {suggested_zone}")
 
     # Time period selection
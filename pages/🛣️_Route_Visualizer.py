@@ -2,9 +2,11 @@ import streamlit as st
 import folium
 from folium import plugins
 import requests
-import pandas as pd
 from streamlit_folium import st_folium
 
+from routing import NoRouteFound, backend_from_env
+from zone_data import load_zone_centroids
+
 st.set_page_config(page_title="Route Visualizer", page_icon="🗺️", layout="wide", initial_sidebar_state="auto")
 
 st.sidebar.title("🛣️ Route Visualizer")
@@ -20,15 +22,7 @@ if "route_coords" not in st.session_state:
 
 @st.cache_data(show_spinner="Loading zone data...")
 def load_zones_data(data_choice):
-    if data_choice == "2006 Zones":
-        zones_df = pd.read_csv('2006Zones.csv')
-        zone_col = 'gta06'
-        region_col = 'region'
-    else:
-        zones_df = pd.read_csv('2022Zones.csv')
-        zone_col = 'TTS2022'
-        region_col = 'Reg_name'
-    return zones_df, zone_col, region_col
+    return load_zone_centroids(data_choice)
 
 def parse_coordinates(coord_string):
     try:
@@ -37,24 +31,17 @@ def parse_coordinates(coord_string):
     except:
         return None
 
+@st.cache_resource
+def get_routing_backend():
+    return backend_from_env()
+
 def get_route(start_coords, end_coords):
-    url = (
-        f"http://router.project-osrm.org/route/v1/driving/"
-        f"{start_coords[1]},{start_coords[0]};{end_coords[1]},{end_coords[0]}"
-        f"?overview=full&geometries=geojson"
-    )
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        route_json = response.json()
-        if route_json.get("routes"):
-            route = route_json["routes"][0]
-            return {
-                "geometry": route["geometry"]["coordinates"],
-                "distance": route["distance"],
-                "duration": route["duration"],
-            }
-        st.error("OSRM returned no routes for these coordinates.")
+        return get_routing_backend().route_details(
+            start_coords[0], start_coords[1], end_coords[0], end_coords[1]
+        )
+    except NoRouteFound:
+        st.error("The routing server returned no routes for these coordinates.")
         return None
     except requests.exceptions.Timeout:
         st.error("Route request timed out. Try again or check your coordinates.")
@@ -0,0 +1,160 @@
+import io
+import json
+import zipfile
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from route_geometry import RouteGeometryStore
+
+# --- Results bundles ---------------------------------------------------------
+#
+# A bundle is a zip of Parquet tables holding everything needed to look at an
+# analysis again without re-fetching a single route:
+#
+#   metadata.json     bundle version, creation time and the analysis inputs
+#                     (zone system, site zones and coordinates, POIs), periods
+#                     and the routing/results keys
+#   input.txt         the TTS export the analysis was run on
+#   results.parquet   results_df, one row per planned trip; 'route' indexes
+#                     the rows of routes.parquet
+#   plan.parquet      the route plan, so POI edits can be re-matched
+#   requests.parquet  key and end points of every planned route, so routes
+#                     that failed to fetch can be retried
+#   routes.parquet    one row per fetched route: key, coords as a list of
+#                     [lat, lon] pairs, and per POI (by POI id) the closest-
+#                     approach distance in km, vertex index and whether it matched
+#   screened.parquet  routes skipped by the length screen, when there are any
+#   no_route.parquet  keys of routes the router says don't exist, when there
+#                     are any
+#
+# The tables are plain typed Parquet, so notebooks can read them straight out
+# of the zip with pandas or pyarrow.
+
+BUNDLE_VERSION = 1
+
+
+def _parquet_bytes(table):
+    buffer = io.BytesIO()
+    if isinstance(table, pd.DataFrame):
+        table.to_parquet(buffer, index=False)
+    else:
+        pq.write_table(table, buffer)
+    return buffer.getvalue()
+
+
+def routes_table(store, pois, poi_columns, matched=None):
+    """Arrow table of a geometry store's routes with their POI distances"""
+    points = pa.FixedSizeListArray.from_arrays(
+        pa.array(np.ascontiguousarray(store.coords, dtype=np.float64).reshape(-1)), 2
+    )
+    columns = {
+        'key': pa.array(store.keys, type=pa.string()),
+        'coords': pa.LargeListArray.from_arrays(pa.array(np.asarray(store.offsets, dtype=np.int64)), points),
+    }
+    for j, poi in enumerate(pois):
+        distances, vertex_indices = poi_columns[tuple(poi['coordinates'])]
+        columns[f"{poi['id']}_distance_km"] = pa.array(np.asarray(distances, dtype=np.float32))
+        columns[f"{poi['id']}_vertex"] = pa.array(np.asarray(vertex_indices, dtype=np.int32))
+        if matched is not None:
+            columns[f"{poi['id']}_matched"] = pa.array(np.asarray(matched[:, j], dtype=bool))
+    return pa.table(columns)
+
+
+def save_results_bundle(results_df, run, inputs, content):
+    """
+    Write a results bundle and return it as zip bytes. inputs holds the
+    analysis inputs (data_choice, site_zones, site_lat, site_lon, pois) plus
+    any run metadata worth keeping, such as 'results_key' and 'routing'.
+    """
+    metadata = {
+        'version': BUNDLE_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'periods': list(run['periods']),
+        'routing_key': run.get('key'),
+        **inputs,
+    }
+    tables = {
+        'results.parquet': _parquet_bytes(results_df),
+        'plan.parquet': _parquet_bytes(run['plan']),
+        'routes.parquet': _parquet_bytes(
+            routes_table(run['store'], inputs['pois'], run['poi_columns'], run.get('matched'))
+        ),
+    }
+    if run.get('requests') is not None:
+        tables['requests.parquet'] = _parquet_bytes(run['requests'])
+    if run.get('screened') is not None and not run['screened'].empty:
+        tables['screened.parquet'] = _parquet_bytes(run['screened'])
+    if run.get('no_route'):
+        tables['no_route.parquet'] = _parquet_bytes(pd.DataFrame({'key': sorted(run['no_route'])}))
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr('metadata.json', json.dumps(metadata, indent=2, default=str))
+        bundle.writestr('input.txt', content)
+        # Parquet is already compressed
+        for name, data in tables.items():
+            bundle.writestr(name, data, compress_type=zipfile.ZIP_STORED)
+    return output.getvalue()
+
+
+def load_results_bundle(source):
+    """
+    Read a results bundle (a path, bytes or file object). Returns a dict with
+    'metadata', 'content', 'results_df' and 'run', the run holding the plan,
+    periods, route requests, geometry store, screened and non-existent routes,
+    POI columns and match matrix as the app keeps them.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with zipfile.ZipFile(source) as bundle:
+        metadata = json.loads(bundle.read('metadata.json'))
+        if metadata.get('version', 0) > BUNDLE_VERSION:
+            raise ValueError(f"Results bundle version {metadata['version']} is newer than this app supports")
+        content = bundle.read('input.txt').decode()
+        results_df = pd.read_parquet(io.BytesIO(bundle.read('results.parquet')))
+        plan = pd.read_parquet(io.BytesIO(bundle.read('plan.parquet')))
+        routes = pq.read_table(io.BytesIO(bundle.read('routes.parquet')))
+        requests = (pd.read_parquet(io.BytesIO(bundle.read('requests.parquet')))
+                    if 'requests.parquet' in bundle.namelist() else None)
+        screened = (pd.read_parquet(io.BytesIO(bundle.read('screened.parquet')))
+                    if 'screened.parquet' in bundle.namelist() else None)
+        no_route = (set(pd.read_parquet(io.BytesIO(bundle.read('no_route.parquet')))['key'])
+                    if 'no_route.parquet' in bundle.namelist() else set())
+
+    coords_column = routes.column('coords').combine_chunks()
+    offsets = coords_column.offsets.to_numpy()
+    coords = coords_column.values.flatten().to_numpy().reshape(-1, 2)
+    # A sliced list array's offsets don't start at zero
+    store = RouteGeometryStore(routes.column('key').to_pylist(), coords[offsets[0]:], offsets - offsets[0])
+
+    pois = metadata['pois']
+    poi_columns = {}
+    matched = np.zeros((len(store), len(pois)), dtype=bool)
+    for j, poi in enumerate(pois):
+        poi_columns[tuple(poi['coordinates'])] = (
+            routes.column(f"{poi['id']}_distance_km").to_numpy(),
+            routes.column(f"{poi['id']}_vertex").to_numpy(),
+        )
+        if f"{poi['id']}_matched" in routes.column_names:
+            matched[:, j] = routes.column(f"{poi['id']}_matched").to_numpy()
+
+    return {
+        'metadata': metadata,
+        'content': content,
+        'results_df': results_df,
+        'run': {
+            'plan': plan,
+            'periods': metadata['periods'],
+            'requests': requests,
+            'store': store,
+            'screened': screened,
+            'no_route': no_route,
+            'poi_columns': poi_columns,
+            'matched': matched,
+            'key': metadata.get('routing_key'),
+        },
+    }
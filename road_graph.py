@@ -0,0 +1,362 @@
+import argparse
+import heapq
+import json
+import math
+import re
+
+import numpy as np
+import shapely
+from polyline import encode
+
+# --- Offline road-network router -------------------------------------------
+#
+# A prepared road graph (e.g. the GTHA roads from an OSM extract) is held in
+# compact CSR arrays: node coordinates, an index pointer into the edge list,
+# edge targets, travel times and lengths. Routes are answered in-process with
+# A* search, so no routing server or network round trip is involved. Many
+# routes sharing one end point (every origin zone to the site, or the site to
+# every destination) are solved together from a single shortest-path tree
+# rooted at that point.
+#
+# Graphs are built once from a GeoJSON file of road LineStrings carrying OSM
+# tags (highway, oneway, maxspeed). A PBF extract can be converted first with
+# e.g. `osmium export gtha.osm.pbf -o gtha_roads.geojson`, then:
+#
+#   python road_graph.py gtha_roads.geojson gtha_graph.npz
+
+EARTH_RADIUS_M = 6371008.8
+
+# Free-flow speeds used when a road has no usable maxspeed tag
+HIGHWAY_SPEEDS_KMH = {
+    'motorway': 100, 'motorway_link': 60,
+    'trunk': 80, 'trunk_link': 50,
+    'primary': 60, 'primary_link': 40,
+    'secondary': 50, 'secondary_link': 40,
+    'tertiary': 40, 'tertiary_link': 30,
+    'unclassified': 40, 'residential': 30,
+    'living_street': 10, 'service': 15,
+}
+
+ONEWAY_FORWARD = {'yes', 'true', '1'}
+ONEWAY_REVERSE = {'-1', 'reverse'}
+
+# Node coordinates are merged at ~1 cm so touching road segments connect
+NODE_PRECISION = 7
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Vectorized great-circle distance in metres"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def parse_speed_kmh(maxspeed):
+    """Parse an OSM maxspeed tag ("50", "40 mph") into km/h, or None"""
+    if maxspeed is None:
+        return None
+    match = re.match(r"\s*(\d+(?:\.\d+)?)\s*(mph)?", str(maxspeed))
+    if not match:
+        return None
+    speed = float(match.group(1))
+    return speed * 1.609344 if match.group(2) else speed
+
+
+class RoadGraph:
+    """Directed road network in CSR form with nearest-node snapping and A* routing"""
+
+    def __init__(self, node_lat, node_lon, indptr, indices, weights, lengths):
+        self.node_lat = np.asarray(node_lat, dtype=np.float64)
+        self.node_lon = np.asarray(node_lon, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)   # seconds
+        self.lengths = np.asarray(lengths, dtype=np.float32)   # metres
+
+        # Fastest edge speed bounds the A* heuristic so it stays admissible
+        with np.errstate(divide='ignore', invalid='ignore'):
+            speeds = np.where(self.weights > 0, self.lengths / self.weights, 0)
+        self.max_speed_mps = float(speeds.max()) if len(speeds) else 1.0
+
+        self._snap_tree = None
+        self._reverse_csr = None
+        self._lon_scale = math.cos(math.radians(float(self.node_lat.mean()))) if len(self.node_lat) else 1.0
+
+    @property
+    def num_nodes(self):
+        return len(self.node_lat)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['node_lat'], data['node_lon'], data['indptr'],
+                       data['indices'], data['weights'], data['lengths'])
+
+    def save(self, path):
+        np.savez(path, node_lat=self.node_lat, node_lon=self.node_lon, indptr=self.indptr,
+                 indices=self.indices, weights=self.weights, lengths=self.lengths)
+
+    def nearest_nodes(self, lats, lons):
+        """Snap each lat/lon to the id of the nearest graph node"""
+        if self._snap_tree is None:
+            # Scale longitudes so planar nearest-neighbour matches ground distance
+            self._snap_tree = shapely.STRtree(
+                shapely.points(self.node_lon * self._lon_scale, self.node_lat)
+            )
+        query = shapely.points(np.asarray(lons, dtype=np.float64) * self._lon_scale,
+                               np.asarray(lats, dtype=np.float64))
+        query = np.atleast_1d(query)
+        input_idx, tree_idx = self._snap_tree.query_nearest(query, all_matches=False)
+        nearest = np.empty(len(query), dtype=np.int64)
+        nearest[input_idx] = tree_idx
+        return nearest
+
+    def shortest_path(self, source, target):
+        """A* search on travel time. Returns the list of node ids, or None if unreachable."""
+        if source == target:
+            return [source]
+
+        node_lat, node_lon = self.node_lat, self.node_lon
+        target_lat = math.radians(node_lat[target])
+        target_lon = math.radians(node_lon[target])
+        cos_target = math.cos(target_lat)
+        inv_speed = 1.0 / self.max_speed_mps
+
+        def heuristic(node):
+            lat = math.radians(node_lat[node])
+            a = (math.sin((target_lat - lat) / 2) ** 2
+                 + math.cos(lat) * cos_target * math.sin((target_lon - math.radians(node_lon[node])) / 2) ** 2)
+            return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(1.0, a))) * inv_speed
+
+        best = {source: 0.0}
+        previous = {}
+        closed = set()
+        heap = [(heuristic(source), 0.0, source)]
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                path = [node]
+                while node in previous:
+                    node = previous[node]
+                    path.append(node)
+                return path[::-1]
+            if node in closed:
+                continue
+            closed.add(node)
+
+            start, end = indptr[node], indptr[node + 1]
+            for neighbour, weight in zip(indices[start:end].tolist(), weights[start:end].tolist()):
+                new_cost = cost + weight
+                if new_cost < best.get(neighbour, math.inf):
+                    best[neighbour] = new_cost
+                    previous[neighbour] = node
+                    heapq.heappush(heap, (new_cost + heuristic(neighbour), new_cost, neighbour))
+
+        return None
+
+    def reverse_csr(self):
+        """(indptr, indices, weights) of the transposed graph, i.e. incoming edges"""
+        if self._reverse_csr is None:
+            sources = np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(self.indptr))
+            order = np.argsort(self.indices, kind='stable')
+            indptr = np.zeros(self.num_nodes + 1, dtype=np.int64)
+            np.add.at(indptr, self.indices.astype(np.int64) + 1, 1)
+            np.cumsum(indptr, out=indptr)
+            self._reverse_csr = (indptr, sources[order], self.weights[order])
+        return self._reverse_csr
+
+    def shortest_path_tree(self, root, reverse=False, targets=None):
+        """
+        Dijkstra from root on travel time. Follows outgoing edges, or incoming
+        edges when reverse is set (giving paths *to* root). Stops once every
+        node in targets is settled. Returns {node: parent}, with root mapped
+        to itself.
+        """
+        if reverse:
+            indptr, indices, weights = self.reverse_csr()
+        else:
+            indptr, indices, weights = self.indptr, self.indices, self.weights
+
+        remaining = set(targets) if targets is not None else None
+        best = {root: 0.0}
+        parent = {root: root}
+        settled = set()
+        heap = [(0.0, root)]
+
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            if remaining is not None:
+                remaining.discard(node)
+                if not remaining:
+                    break
+
+            start, end = indptr[node], indptr[node + 1]
+            for neighbour, weight in zip(indices[start:end].tolist(), weights[start:end].tolist()):
+                new_cost = cost + weight
+                if new_cost < best.get(neighbour, math.inf):
+                    best[neighbour] = new_cost
+                    parent[neighbour] = node
+                    heapq.heappush(heap, (new_cost, neighbour))
+
+        return parent
+
+    def routes_from_root(self, root_lat, root_lon, points, reverse=False):
+        """
+        Route from one root coordinate to many points (or, with reverse, from
+        every point to the root) using a single shortest-path tree. Returns a
+        list of route dicts, as from route(), with None for unreachable points.
+        """
+        lats = [root_lat] + [p[0] for p in points]
+        lons = [root_lon] + [p[1] for p in points]
+        snapped = self.nearest_nodes(lats, lons).tolist()
+        root, nodes = snapped[0], snapped[1:]
+        parent = self.shortest_path_tree(root, reverse=reverse, targets=nodes)
+
+        routes = []
+        for node in nodes:
+            if node not in parent:
+                routes.append(None)
+                continue
+            # Parent pointers lead back to the root: that's already travel
+            # order for paths into the root, and backwards for paths out of it
+            path = [node]
+            while path[-1] != root:
+                path.append(parent[path[-1]])
+            if not reverse:
+                path.reverse()
+            coords = self.path_coords(path)
+            routes.append({
+                'path': path,
+                'coords': coords,
+                'geometry': encode([tuple(c) for c in coords.tolist()]),
+            })
+        return routes
+
+    def path_coords(self, path):
+        """(n, 2) lat/lon array of the nodes along a path"""
+        path = np.asarray(path, dtype=np.int64)
+        return np.column_stack([self.node_lat[path], self.node_lon[path]])
+
+    def path_cost(self, path):
+        """Total (length in metres, travel time in seconds) of a node path"""
+        length = duration = 0.0
+        for u, v in zip(path[:-1], path[1:]):
+            start, end = self.indptr[u], self.indptr[u + 1]
+            targets = self.indices[start:end]
+            # Parallel edges: the search used the fastest one
+            candidates = np.flatnonzero(targets == v) + start
+            edge = candidates[np.argmin(self.weights[candidates])]
+            length += float(self.lengths[edge])
+            duration += float(self.weights[edge])
+        return length, duration
+
+    def route(self, origin_lat, origin_lon, dest_lat, dest_lon):
+        """
+        Route between two coordinates. Returns a dict with the node path, its
+        (n, 2) lat/lon coordinates and the encoded polyline, or None.
+        """
+        source, target = self.nearest_nodes([origin_lat, dest_lat], [origin_lon, dest_lon])
+        path = self.shortest_path(int(source), int(target))
+        if path is None:
+            return None
+        coords = self.path_coords(path)
+        return {
+            'path': path,
+            'coords': coords,
+            'geometry': encode([tuple(c) for c in coords.tolist()]),
+        }
+
+
+def build_graph_from_geojson(path, speeds=HIGHWAY_SPEEDS_KMH):
+    """Build a RoadGraph from a GeoJSON FeatureCollection of OSM road LineStrings"""
+    with open(path) as f:
+        features = json.load(f)['features']
+
+    node_ids = {}
+    node_lat = []
+    node_lon = []
+    edge_from = []
+    edge_to = []
+    edge_speed = []
+
+    def node_id(lon, lat):
+        key = (round(lat, NODE_PRECISION), round(lon, NODE_PRECISION))
+        if key not in node_ids:
+            node_ids[key] = len(node_lat)
+            node_lat.append(key[0])
+            node_lon.append(key[1])
+        return node_ids[key]
+
+    for feature in features:
+        props = feature.get('properties') or {}
+        highway = props.get('highway')
+        if highway not in speeds:
+            continue
+        speed_kmh = parse_speed_kmh(props.get('maxspeed')) or speeds[highway]
+        oneway = str(props.get('oneway', '')).lower()
+        implied_oneway = highway == 'motorway' or props.get('junction') == 'roundabout'
+        if oneway in ONEWAY_REVERSE:
+            forward, backward = False, True
+        elif oneway in ONEWAY_FORWARD or (implied_oneway and oneway != 'no'):
+            forward, backward = True, False
+        else:
+            forward, backward = True, True
+
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'LineString':
+            lines = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiLineString':
+            lines = geometry['coordinates']
+        else:
+            continue
+
+        for line in lines:
+            ids = [node_id(pt[0], pt[1]) for pt in line]
+            for u, v in zip(ids[:-1], ids[1:]):
+                if u == v:
+                    continue
+                if forward:
+                    edge_from.append(u)
+                    edge_to.append(v)
+                    edge_speed.append(speed_kmh)
+                if backward:
+                    edge_from.append(v)
+                    edge_to.append(u)
+                    edge_speed.append(speed_kmh)
+
+    node_lat = np.array(node_lat, dtype=np.float64)
+    node_lon = np.array(node_lon, dtype=np.float64)
+    edge_from = np.array(edge_from, dtype=np.int64)
+    edge_to = np.array(edge_to, dtype=np.int32)
+    lengths = haversine_m(node_lat[edge_from], node_lon[edge_from],
+                          node_lat[edge_to], node_lon[edge_to])
+    weights = lengths / (np.array(edge_speed, dtype=np.float64) / 3.6)
+
+    # Sort edges by source node to get CSR layout
+    order = np.argsort(edge_from, kind='stable')
+    indptr = np.zeros(len(node_lat) + 1, dtype=np.int64)
+    np.add.at(indptr, edge_from + 1, 1)
+    np.cumsum(indptr, out=indptr)
+
+    return RoadGraph(node_lat, node_lon, indptr, edge_to[order], weights[order], lengths[order])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a routing graph from a GeoJSON road extract")
+    parser.add_argument("geojson", help="GeoJSON FeatureCollection of OSM road LineStrings")
+    parser.add_argument("output", help="Path of the .npz graph file to write")
+    args = parser.parse_args()
+
+    graph = build_graph_from_geojson(args.geojson)
+    graph.save(args.output)
+    print(f"Wrote {args.output}: {graph.num_nodes} nodes, {graph.num_edges} edges")
@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# --- Persistent route geometry cache ---------------------------------------
+#
+# Routes between the same zone centroid and site coordinate come back
+# identical from OSRM, so repeat studies around the same sites don't need to
+# hit the server again. Geometries are stored in a small SQLite file keyed by
+# routing profile and rounded origin/destination coordinates, expire after a
+# TTL, and the least recently used entries are evicted once the cache grows
+# past its size limit.
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "TTS_ROUTE_CACHE_PATH",
+    str(Path(__file__).resolve().parent / ".route_cache" / "routes.sqlite3")
+)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024   # 256 MB of encoded polylines
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60  # road networks change; refetch monthly
+COORD_PRECISION = 5                      # ~1 m, well below zone centroid accuracy
+
+
+def make_route_key(origin_lat, origin_lon, dest_lat, dest_lon, profile="driving",
+                   precision=COORD_PRECISION):
+    """Build the cache key for a route from its rounded end points and profile"""
+    return (f"{profile}|{origin_lat:.{precision}f},{origin_lon:.{precision}f}"
+            f"|{dest_lat:.{precision}f},{dest_lon:.{precision}f}")
+
+
+def make_route_keys(origin_lat, origin_lon, dest_lat, dest_lon, profile="driving",
+                    precision=COORD_PRECISION):
+    """Vectorized make_route_key over equal-length arrays of end points"""
+    fmt = f"%.{precision}f"
+    parts = [np.char.mod(fmt, np.asarray(values, dtype=np.float64))
+             for values in (origin_lat, origin_lon, dest_lat, dest_lon)]
+    keys = np.char.add(f"{profile}|", parts[0])
+    for sep, part in zip((",", "|", ","), parts[1:]):
+        keys = np.char.add(np.char.add(keys, sep), part)
+    return keys.astype(object)
+
+
+class RouteCache:
+    """
+    SQLite-backed store of encoded route geometries with TTL expiry and
+    size-based LRU eviction. Safe to share between Streamlit sessions.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES,
+                 ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS routes ("
+                " key TEXT PRIMARY KEY,"
+                " geometry TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS routes_accessed ON routes (accessed)")
+
+    def get(self, key):
+        """Return the cached geometry for key, or None if missing or expired"""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """Return a {key: geometry} dict for every key that has a fresh entry"""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+
+        now = time.time()
+        oldest_allowed = now - self.ttl_seconds
+        found = {}
+        expired = []
+
+        with self._lock, self._conn:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, geometry, created FROM routes WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for key, geometry, created in rows:
+                    if created < oldest_allowed:
+                        expired.append((key,))
+                    else:
+                        found[key] = geometry
+
+            if expired:
+                self._conn.executemany("DELETE FROM routes WHERE key = ?", expired)
+            if found:
+                self._conn.executemany(
+                    "UPDATE routes SET accessed = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+
+        return found
+
+    def set(self, key, geometry):
+        """Store a single geometry"""
+        self.set_many({key: geometry})
+
+    def set_many(self, items):
+        """Store several {key: geometry} entries in one transaction, then evict"""
+        now = time.time()
+        rows = [
+            (key, geometry, len(geometry), now, now)
+            for key, geometry in items.items()
+            if geometry
+        ]
+        if not rows:
+            return
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO routes (key, geometry, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+
+    def _evict(self):
+        # Caller holds the lock and an open transaction
+        self._conn.execute(
+            "DELETE FROM routes WHERE created < ?", (time.time() - self.ttl_seconds,)
+        )
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM routes").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Drop least recently used entries until we're back under the limit
+        excess = total - self.max_bytes
+        freed = 0
+        stale_keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM routes ORDER BY accessed"):
+            stale_keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM routes WHERE key = ?", stale_keys)
+
+    def clear(self):
+        """Remove every cached route"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM routes")
+
+    def stats(self):
+        """Return the number of cached routes and their total size in bytes"""
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM routes"
+            ).fetchone()
+        return {'routes': count, 'bytes': size}
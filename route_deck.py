@@ -0,0 +1,128 @@
+import pandas as pd
+import pydeck as pdk
+
+# --- WebGL route map -----------------------------------------------------------
+#
+# Leaflet draws every line and marker as its own SVG/DOM element, which stops
+# being usable once a regional analysis has thousands of them. This builds the
+# same route map with deck.gl (through pydeck): the segment volume network from
+# route_geometry.aggregate_segments becomes one PathLayer per POI/direction
+# group and the zone markers one ScatterplotLayer per group, all drawn on the
+# GPU. pydeck hands the layer data to the browser as JSON (paths as lists of
+# [lon, lat] pairs), so what keeps the payload small is the chaining and
+# simplification of the network before it gets here, not the transport.
+#
+# Groups are numbered as in the route map: poi_index * 2 for origin -> site and
+# poi_index * 2 + 1 for site -> destination.
+
+
+def group_label(group, pois):
+    """Layer name for a POI/direction group, matching the Folium layer names"""
+    name = pois[group // 2]['name']
+    return f"Site → Dest via {name}" if group % 2 else f"Origin → Site via {name}"
+
+
+def hex_to_rgba(colour, alpha=255):
+    """'#RRGGBB' to an [r, g, b, a] list as deck.gl expects"""
+    colour = colour.lstrip('#')
+    return [int(colour[i:i + 2], 16) for i in (0, 2, 4)] + [alpha]
+
+
+def build_route_deck(site, pois, poi_colours, batches, zone_points, visible_groups, zoom=10):
+    """
+    Build a pydeck Deck of the route volume network.
+
+    site is (lat, lon); poi_colours holds a '#RRGGBB' colour per POI;
+    batches are the route map's line batches (group, width in pixels,
+    min/max volume and lat/lon polylines); zone_points is a DataFrame of lat,
+    lon, group, zone and total for the origin/destination zone markers. Only
+    groups in visible_groups are drawn.
+    """
+    layers = []
+    for group in sorted(visible_groups):
+        colour = hex_to_rgba(poi_colours[group // 2], 180)
+        label = group_label(group, pois)
+
+        paths, widths, info = [], [], []
+        for batch in batches:
+            if batch['group'] != group:
+                continue
+            # deck.gl wants [lon, lat] positions
+            paths.extend(line[:, ::-1].tolist() for line in batch['lines'])
+            widths.extend([batch['width']] * len(batch['lines']))
+            info.extend([f"{batch['min_volume']:,.0f}–{batch['max_volume']:,.0f} trips"] * len(batch['lines']))
+        if paths:
+            layers.append(pdk.Layer(
+                "PathLayer",
+                id=f"routes-{group}",
+                data=pd.DataFrame({
+                    'path': paths,
+                    'width': widths,
+                    'label': label,
+                    'info': info,
+                }),
+                get_path='path',
+                get_width='width',
+                width_units='pixels',
+                get_color=colour,
+                cap_rounded=True,
+                pickable=True,
+            ))
+
+        zones = zone_points[zone_points['group'] == group]
+        if not zones.empty:
+            layers.append(pdk.Layer(
+                "ScatterplotLayer",
+                id=f"zones-{group}",
+                data=pd.DataFrame({
+                    'lon': zones['lon'].to_numpy(),
+                    'lat': zones['lat'].to_numpy(),
+                    'label': label,
+                    'info': [f"Zone {zone}: {total:,} trips"
+                             for zone, total in zip(zones['zone'], zones['total'])],
+                }),
+                get_position=['lon', 'lat'],
+                get_radius=5,
+                radius_units='pixels',
+                get_fill_color=hex_to_rgba(poi_colours[group // 2]),
+                get_line_color=[255, 255, 255, 255],
+                stroked=True,
+                line_width_min_pixels=1,
+                pickable=True,
+            ))
+
+    poi_data = pd.DataFrame({
+        'lon': [poi['coordinates'][1] for poi in pois],
+        'lat': [poi['coordinates'][0] for poi in pois],
+        'radius': [poi['threshold'] * 1000 for poi in pois],
+        'colour': [hex_to_rgba(colour, 60) for colour in poi_colours],
+        'label': [poi['name'] for poi in pois],
+        'info': [f"Threshold: {poi['threshold']} km" for poi in pois],
+    })
+    layers.append(pdk.Layer(
+        "ScatterplotLayer",
+        id="poi-thresholds",
+        data=poi_data,
+        get_position=['lon', 'lat'],
+        get_radius='radius',
+        get_fill_color='colour',
+        pickable=True,
+    ))
+    layers.append(pdk.Layer(
+        "ScatterplotLayer",
+        id="site",
+        data=pd.DataFrame({'lon': [site[1]], 'lat': [site[0]], 'label': ["Site Location"], 'info': [""]}),
+        get_position=['lon', 'lat'],
+        get_radius=9,
+        radius_units='pixels',
+        get_fill_color=[0, 0, 0, 255],
+        pickable=True,
+    ))
+
+    return pdk.Deck(
+        layers=layers,
+        initial_view_state=pdk.ViewState(latitude=site[0], longitude=site[1], zoom=zoom),
+        map_provider="carto",
+        map_style=pdk.map_styles.CARTO_ROAD,
+        tooltip={"html": "<b>{label}</b><br>{info}"},
+    )
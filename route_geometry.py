@@ -0,0 +1,549 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from polyline import decode
+from geopy.distance import geodesic
+
+# --- Route / POI intersection engine ---------------------------------------
+#
+# Decodes each route once into a NumPy array and measures the distance from
+# every vertex to a POI in a single broadcast operation, instead of one geopy
+# call per vertex per POI. Each route is reduced to its closest approach to
+# each POI, so threshold changes only need a re-comparison against stored
+# distances, and a new or moved POI only needs one new column of distances.
+#
+# Haversine is accurate to ~0.5% against the WGS-84 ellipsoid, which is a
+# fraction of a metre at POI threshold scales; the "geodesic" method
+# re-checks the few vertices near each minimum with geopy's ellipsoidal
+# distance for exact results.
+
+EARTH_RADIUS_KM = 6371.0088  # mean Earth radius, as used by geopy.great_circle
+DISTANCE_METHODS = ("haversine", "geodesic")
+DEFAULT_DISTANCE_METHOD = "haversine"
+
+# Haversine can under- or over-estimate the ellipsoidal distance by up to
+# ~0.5%, so vertices this far past the minimum still get the exact check.
+_GEODESIC_MARGIN = 1.01
+
+# Saved geometry stores (see RouteGeometryStore.save) go here when set;
+# otherwise decoded routes only live in the session
+GEOMETRY_STORE_DIR = os.environ.get("TTS_GEOMETRY_STORE_DIR")
+GEOMETRY_STORES_KEPT = 20
+
+# Douglas-Peucker tolerance for drawn route geometry. POI matching always
+# uses the full-resolution routes; 0 draws every vertex.
+DISPLAY_TOLERANCE_M = float(os.environ.get("TTS_DISPLAY_TOLERANCE_M", "5"))
+
+
+def decode_coords(route_geometry):
+    """Decode an encoded polyline into an (n, 2) float array of lat/lon pairs"""
+    return np.asarray(decode(route_geometry), dtype=np.float64).reshape(-1, 2)
+
+
+def haversine_km(coords, points):
+    """
+    Great-circle distances in km between every row of coords (n, 2) and every
+    row of points (m, 2), both in degrees lat/lon. Returns an (n, m) array.
+    """
+    coords = np.radians(np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+    points = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+
+    lat1 = coords[:, 0][:, None]
+    lon1 = coords[:, 1][:, None]
+    lat2 = points[:, 0][None, :]
+    lon2 = points[:, 1][None, :]
+
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def stack_coords(coords_list):
+    """
+    Concatenate per-route (n, 2) coordinate arrays into one flat array plus an
+    offsets array, so route i's vertices are flat[offsets[i]:offsets[i + 1]].
+    """
+    lengths = np.fromiter((len(c) for c in coords_list), dtype=np.int64, count=len(coords_list))
+    offsets = np.zeros(len(coords_list) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    if offsets[-1]:
+        flat = np.concatenate([np.asarray(c, dtype=np.float64).reshape(-1, 2) for c in coords_list])
+    else:
+        flat = np.empty((0, 2), dtype=np.float64)
+    return flat, offsets
+
+
+def closest_approach(flat, offsets, poi_coordinates, method=DEFAULT_DISTANCE_METHOD):
+    """
+    Minimum distance (km) from each route to one POI, and the index of the
+    route vertex where it occurs. Routes are given as flat coordinates plus
+    offsets (see stack_coords). Routes with no vertices get inf and -1.
+    """
+    if method not in DISTANCE_METHODS:
+        raise ValueError(f"Unknown distance method: {method}")
+
+    num_routes = len(offsets) - 1
+    distances = np.full(num_routes, np.inf)
+    indices = np.full(num_routes, -1, dtype=np.int64)
+    lengths = np.diff(offsets)
+    nonempty = np.flatnonzero(lengths > 0)
+    if len(nonempty) == 0:
+        return distances, indices
+
+    dist = haversine_km(flat, [poi_coordinates])[:, 0]
+
+    # Per-route minimum, then the first vertex that attains it
+    starts = offsets[nonempty]
+    mins = np.minimum.reduceat(dist, starts)
+    route_of_vertex = np.repeat(np.arange(num_routes), lengths)
+    route_mins = np.full(num_routes, np.inf)
+    route_mins[nonempty] = mins
+    is_min = dist == route_mins[route_of_vertex]
+    first_min = np.flatnonzero(is_min)
+    first_min = first_min[np.searchsorted(first_min, starts)]
+
+    distances[nonempty] = mins
+    indices[nonempty] = first_min - starts
+
+    if method == "geodesic":
+        # Only vertices close to each route's haversine minimum can be the
+        # ellipsoidal minimum
+        candidates = np.flatnonzero(dist <= route_mins[route_of_vertex] * _GEODESIC_MARGIN)
+        best = {}
+        for vertex in candidates:
+            route = route_of_vertex[vertex]
+            exact = geodesic(tuple(flat[vertex]), tuple(poi_coordinates)).km
+            if route not in best or exact < best[route][0]:
+                best[route] = (exact, vertex - offsets[route])
+        for route, (exact, vertex) in best.items():
+            distances[route] = exact
+            indices[route] = vertex
+
+    return distances, indices
+
+
+def route_poi_distances(coords, poi_list, method=DEFAULT_DISTANCE_METHOD):
+    """Closest-approach distances and vertex indices from one route to each POI"""
+    flat, offsets = stack_coords([coords])
+    distances = np.empty(len(poi_list))
+    indices = np.empty(len(poi_list), dtype=np.int64)
+    for j, poi in enumerate(poi_list):
+        d, i = closest_approach(flat, offsets, poi['coordinates'], method=method)
+        distances[j], indices[j] = d[0], i[0]
+    return distances, indices
+
+
+def match_pois(distances, indices, poi_list, threshold=0.1):
+    """
+    Build a passes_through-style result for one route from its closest-approach
+    distances and vertex indices to each POI in poi_list. POIs are listed in
+    the order the route passes them.
+    """
+    intersected = []
+    for j in np.argsort(indices, kind='stable'):
+        poi = poi_list[j]
+        poi_threshold = poi.get('threshold', threshold)
+        if indices[j] >= 0 and distances[j] <= poi_threshold:
+            intersected.append({
+                'id': poi['id'],
+                'name': poi['name'],
+                'coordinates': poi['coordinates'],
+                'threshold': poi_threshold,
+                'actual_distance': float(distances[j])
+            })
+    return {
+        'passes': bool(intersected),
+        'num_pois_intersected': len(intersected),
+        'intersected_pois': intersected
+    }
+
+
+def match_matrix(distances, indices, thresholds):
+    """
+    Vectorized match_pois over many routes. distances and indices are
+    (routes, pois) closest-approach arrays; returns a boolean (routes, pois)
+    match matrix and, per route, the index of the first POI it passes
+    (-1 for none).
+    """
+    matched = (indices >= 0) & (distances <= np.asarray(thresholds, dtype=distances.dtype))
+    first_poi = np.full(len(matched), -1, dtype=np.int16)
+    if matched.shape[1]:
+        # Ties on the same vertex go to the earlier POI, as in match_pois
+        along_route = np.where(matched, indices, np.iinfo(indices.dtype).max)
+        first_poi[:] = np.where(matched.any(axis=1), along_route.argmin(axis=1), -1)
+    return matched, first_poi
+
+
+def poi_labels(matched, names):
+    """Comma-joined, sorted POI names per route of a match matrix ('' for none)"""
+    labels = np.full(len(matched), '', dtype=object)
+    if len(matched) == 0 or matched.shape[1] == 0:
+        return labels
+    # Label each distinct combination of POIs once
+    patterns, inverse = np.unique(matched, axis=0, return_inverse=True)
+    pattern_labels = np.array([
+        ', '.join(sorted(set(names[j] for j in np.flatnonzero(pattern))))
+        for pattern in patterns
+    ], dtype=object)
+    return pattern_labels[inverse.reshape(-1)]
+
+
+def passes_through(route_geometry, poi_list, threshold=0.1, method=DEFAULT_DISTANCE_METHOD, coords=None):
+    """
+    Check which POIs a route passes within threshold of. actual_distance is
+    the route's closest approach to each POI.
+    """
+    if coords is None:
+        coords = decode_coords(route_geometry)
+    distances, indices = route_poi_distances(coords, poi_list, method=method)
+    return match_pois(distances, indices, poi_list, threshold=threshold)
+
+
+# Slack on the screen's reach, so neither the router's own distance formula
+# nor geodesic-vs-haversine differences can screen out a matching route
+_SCREEN_MARGIN = 1.01
+
+
+def screen_routes(origins, dests, lengths_km, poi_coordinates, thresholds):
+    """
+    Which routes could come within threshold of any POI, judged from their
+    snapped end points and length alone. Every vertex of a route of length L
+    from O to D lies in the ellipse |OV| + |VD| <= L, so a vertex within t of
+    POI P needs |OP| + |PD| <= L + 2t; routes failing that for every POI can
+    be skipped without fetching their geometry. origins and dests are (n, 2)
+    lat/lon arrays; a NaN length (unknown) always counts as a candidate.
+    """
+    lengths_km = np.asarray(lengths_km, dtype=np.float64)
+    candidates = np.isnan(lengths_km)
+    if len(poi_coordinates) == 0:
+        return candidates
+    to_poi = haversine_km(origins, poi_coordinates) + haversine_km(dests, poi_coordinates)
+    reach = (lengths_km[:, None] + 2 * np.asarray(thresholds, dtype=np.float64)[None, :]) * _SCREEN_MARGIN
+    return candidates | (to_poi <= reach).any(axis=1)
+
+
+# A length-only request is far cheaper than a full-geometry one, but it is
+# still one more request per uncached route, so screening only pays off when
+# it rules out a good share of them. The share is estimated up front from
+# straight-line distances stretched by a typical road detour factor.
+SCREEN_MIN_SHARE = 0.5
+_DETOUR_FACTOR = 1.3
+
+
+def estimate_screened_share(origins, dests, poi_coordinates, thresholds, detour=_DETOUR_FACTOR):
+    """
+    Share of routes screen_routes can be expected to rule out, estimating
+    each route's length as detour times its straight-line length. Needs no
+    requests; origins and dests are (n, 2) lat/lon arrays.
+    """
+    origins = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+    dests = np.radians(np.asarray(dests, dtype=np.float64).reshape(-1, 2))
+    if len(origins) == 0:
+        return 0.0
+    a = (np.sin((dests[:, 0] - origins[:, 0]) / 2) ** 2
+         + np.cos(origins[:, 0]) * np.cos(dests[:, 0]) * np.sin((dests[:, 1] - origins[:, 1]) / 2) ** 2)
+    straight_km = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    candidates = screen_routes(np.degrees(origins), np.degrees(dests), straight_km * detour,
+                               poi_coordinates, thresholds)
+    return float(1 - candidates.mean())
+
+
+class RouteGeometryStore:
+    """
+    Decoded route coordinates for a run, held CSR-style: one contiguous
+    (n, 2) float64 array plus an offsets index, so route i's vertices are
+    coords[offsets[i]:offsets[i + 1]]. Routes are decoded once into the store
+    and everything downstream (POI distances, the route map, exports) reads
+    views of it. A store can be saved to a directory and loaded back
+    memory-mapped, which lets reruns and other sessions share it zero-copy.
+    """
+
+    def __init__(self, keys, coords, offsets):
+        self.keys = list(keys)
+        self.coords = coords
+        self.offsets = offsets
+        self._index = None
+
+    @classmethod
+    def from_coords(cls, keys, coords_list):
+        """Build a store from per-route (n, 2) arrays in the same order as keys"""
+        coords, offsets = stack_coords(coords_list)
+        return cls(keys, coords, offsets)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def index(self, key):
+        """Position of a route key in the store, or -1 if it isn't stored"""
+        if self._index is None:
+            self._index = {key: i for i, key in enumerate(self.keys)}
+        return self._index.get(key, -1)
+
+    def route(self, i):
+        """Coordinates of route i as a view into the store"""
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+    def extend(self, keys, coords_list):
+        """A new in-memory store with these routes appended after the existing ones"""
+        coords, offsets = stack_coords(coords_list)
+        return RouteGeometryStore(
+            self.keys + list(keys),
+            np.concatenate([self.coords, coords]),
+            np.concatenate([self.offsets, offsets[1:] + self.offsets[-1]])
+        )
+
+    def save(self, path):
+        """
+        Write the store to directory path and return it reloaded memory-mapped.
+        A store already saved there is reused when it starts with this store's
+        routes; otherwise it is replaced by this store with any routes only the
+        saved one had appended, so the returned store always starts with this
+        store's routes in order. The directory is written next to its final
+        name and renamed into place, so concurrent sessions never see a
+        half-written store.
+        """
+        path = Path(path)
+        store = self
+        if path.exists():
+            saved = RouteGeometryStore.load(path)
+            if saved.keys[:len(self.keys)] == self.keys:
+                return saved
+            extra = [i for i, key in enumerate(saved.keys) if self.index(key) < 0]
+            if extra:
+                store = self.extend([saved.keys[i] for i in extra], [saved.route(i) for i in extra])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=path.parent, prefix=f".{path.name}."))
+        np.save(tmp / "coords.npy", np.ascontiguousarray(store.coords, dtype=np.float64))
+        np.save(tmp / "offsets.npy", np.asarray(store.offsets, dtype=np.int64))
+        np.save(tmp / "keys.npy", np.array(store.keys, dtype=str))
+        # A stale store is moved aside first (sessions with it memory-mapped
+        # keep reading the unlinked files)
+        stale = tmp.with_name(tmp.name + ".stale")
+        try:
+            os.rename(path, stale)
+        except OSError:
+            pass
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Another session saved the same store first
+            shutil.rmtree(tmp, ignore_errors=True)
+        shutil.rmtree(stale, ignore_errors=True)
+        return RouteGeometryStore.load(path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a saved store, memory-mapping the coordinate array by default"""
+        path = Path(path)
+        mode = 'r' if mmap else None
+        os.utime(path)  # marks the store as recently used for prune_geometry_stores
+        return cls(
+            np.load(path / "keys.npy").tolist(),
+            np.load(path / "coords.npy", mmap_mode=mode),
+            np.load(path / "offsets.npy")
+        )
+
+
+def prune_geometry_stores(directory, keep=GEOMETRY_STORES_KEPT):
+    """Delete all but the keep most recently used stores under directory"""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return
+    stores = sorted(
+        (p for p in directory.iterdir() if p.is_dir() and not p.name.startswith('.')),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True
+    )
+    for stale in stores[keep:]:
+        shutil.rmtree(stale, ignore_errors=True)
+
+
+def aggregate_segments(store, routes, weights, groups, precision=5):
+    """
+    Sum route volumes over shared road segments.
+
+    routes are indices into a RouteGeometryStore (repeats allowed), with a
+    volume and an integer group (e.g. POI and direction) per entry. Route
+    vertices are snapped to a 10^-precision degree grid (1e-5 is ~1 m, the
+    precision of OSRM polylines), so routes along the same road produce the
+    same segments; each segment is counted once per group regardless of its
+    direction of travel. Returns (segments, groups, volumes): an (k, 2, 2)
+    array of lat/lon segment end points and the group and summed volume of each.
+    """
+    routes = np.asarray(routes, dtype=np.int64)
+    groups = np.asarray(groups, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+    if len(routes) == 0:
+        return np.empty((0, 2, 2)), np.empty(0, dtype=np.int64), np.empty(0)
+
+    # Collapse repeated route/group pairs before expanding to segments
+    pairs, inverse = np.unique(np.stack([routes, groups]), axis=1, return_inverse=True)
+    pair_weights = np.bincount(inverse.reshape(-1), weights=weights)
+    starts = store.offsets[pairs[0]]
+    num_segments = np.maximum(store.offsets[pairs[0] + 1] - starts - 1, 0)
+    total = int(num_segments.sum())
+    if total == 0:
+        return np.empty((0, 2, 2)), np.empty(0, dtype=np.int64), np.empty(0)
+
+    # Index of the first vertex of every segment of every route
+    first_segment = np.cumsum(num_segments) - num_segments
+    vertex = np.repeat(starts - first_segment, num_segments) + np.arange(total)
+
+    scale = 10 ** precision
+    a = np.rint(np.asarray(store.coords[vertex]) * scale).astype(np.int64)
+    b = np.rint(np.asarray(store.coords[vertex + 1]) * scale).astype(np.int64)
+    # Same segment either way round
+    swap = (a[:, 0] > b[:, 0]) | ((a[:, 0] == b[:, 0]) & (a[:, 1] > b[:, 1]))
+    lo = np.where(swap[:, None], b, a)
+    hi = np.where(swap[:, None], a, b)
+    keep = (lo != hi).any(axis=1)
+
+    keys = np.column_stack([np.repeat(pairs[1], num_segments), lo, hi])[keep]
+    segment_weights = np.repeat(pair_weights, num_segments)[keep]
+    unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    volumes = np.bincount(inverse.reshape(-1), weights=segment_weights)
+    return unique_keys[:, 1:].reshape(-1, 2, 2) / scale, unique_keys[:, 0], volumes
+
+
+def simplify_coords(coords, tolerance_m):
+    """
+    Douglas-Peucker simplification of an (n, 2) lat/lon polyline, keeping
+    every vertex that is more than tolerance_m metres from the simplified
+    line. End points are always kept; tolerance_m <= 0 returns coords as is.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    if tolerance_m <= 0 or len(coords) < 3:
+        return coords
+
+    # Local equirectangular projection in metres; exact enough over a route
+    metres_per_degree = EARTH_RADIUS_KM * 1000 * np.pi / 180
+    lat0 = np.radians(coords[:, 0].mean())
+    xy = np.column_stack([coords[:, 1] * np.cos(lat0), coords[:, 0]]) * metres_per_degree
+
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = xy[first], xy[last]
+        points = xy[first + 1:last]
+        direction = end - start
+        length_sq = direction @ direction
+        if length_sq == 0:
+            distances = np.hypot(*(points - start).T)
+        else:
+            # Distance to the segment, not the infinite line through it
+            t = np.clip((points - start) @ direction / length_sq, 0.0, 1.0)
+            distances = np.hypot(*(points - (start + t[:, None] * direction)).T)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return coords[keep]
+
+
+def chain_segments(segments):
+    """
+    Join 2-point segments (a (k, 2, 2) array) that meet end to end into
+    polylines, breaking at junctions and dead ends. Returns a list of
+    (n, 2) coordinate arrays covering every segment exactly once.
+    """
+    if len(segments) == 0:
+        return []
+    nodes, ends = np.unique(segments.reshape(-1, 2), axis=0, return_inverse=True)
+    ends = ends.reshape(-1, 2)
+    degree = np.bincount(ends.ravel(), minlength=len(nodes))
+    incident = [[] for _ in range(len(nodes))]
+    for segment, (a, b) in enumerate(ends.tolist()):
+        incident[a].append(segment)
+        incident[b].append(segment)
+
+    used = np.zeros(len(segments), dtype=bool)
+    chains = []
+
+    def walk(node, segment):
+        path = [node]
+        while True:
+            used[segment] = True
+            a, b = ends[segment]
+            node = b if a == node else a
+            path.append(node)
+            if degree[node] != 2:
+                break
+            following = [s for s in incident[node] if not used[s]]
+            if not following:
+                break
+            segment = following[0]
+        chains.append(nodes[path])
+
+    # Chains run between junctions/dead ends; whatever is left is a loop
+    for node in np.flatnonzero(degree != 2).tolist():
+        for segment in incident[node]:
+            if not used[segment]:
+                walk(node, segment)
+    for segment in np.flatnonzero(~used).tolist():
+        if not used[segment]:
+            walk(int(ends[segment][0]), segment)
+    return chains
+
+
+class StreamingPoiMatcher:
+    """
+    Matches routes against POIs as they arrive from the router and keeps
+    running traffic totals per POI label and direction, so results can be
+    previewed before the whole fetch has finished. The closest-approach
+    distances it measures are handed on as POI columns once the run is done.
+    """
+
+    def __init__(self, pois, method=DEFAULT_DISTANCE_METHOD):
+        self.pois = pois
+        self.method = method
+        self.trips_by_key = {}
+        self.distances = {}
+        self.totals = {'origin_to_site': {}, 'site_to_destination': {}}
+        self.routes_matched = 0
+
+    def plan(self, plan):
+        """
+        Register the route plan (a DataFrame with key, route_type and total
+        columns) so arriving routes can be tallied
+        """
+        routed = plan[plan['key'].notna()]
+        trips = routed.groupby(['key', 'route_type'])['total'].sum()
+        for (key, route_type), total in trips.items():
+            self.trips_by_key.setdefault(key, []).append((route_type, int(total)))
+
+    def add(self, key, coords):
+        """Match one arrived route and add its rows' trips to the running totals"""
+        distances, indices = route_poi_distances(coords, self.pois, method=self.method)
+        self.distances[key] = (distances, indices)
+
+        result = match_pois(distances, indices, self.pois)
+        if not result['passes']:
+            return
+        self.routes_matched += 1
+        label = ', '.join(sorted(set(poi['name'] for poi in result['intersected_pois'])))
+        for route_type, total in self.trips_by_key.get(key, []):
+            direction = self.totals.get(route_type)
+            if direction is not None:
+                direction[label] = direction.get(label, 0) + total
+
+    def poi_columns(self, route_keys):
+        """Closest-approach columns per POI coordinate, aligned with route_keys"""
+        columns = {}
+        for j, poi in enumerate(self.pois):
+            distances = np.full(len(route_keys), np.inf, dtype=np.float32)
+            indices = np.full(len(route_keys), -1, dtype=np.int32)
+            for i, key in enumerate(route_keys):
+                if key in self.distances:
+                    distances[i] = self.distances[key][0][j]
+                    indices[i] = self.distances[key][1][j]
+            columns[tuple(poi['coordinates'])] = (distances, indices)
+        return columns
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+from route_cache import make_route_keys
+
+# --- Route planning ----------------------------------------------------------
+#
+# Every OD row touching a selected site zone becomes one or two planned trips:
+# an origin-to-site leg when it ends there and a site-to-destination leg when
+# it starts there (intra-zone rows are both), routed between the other zone's
+# centroid and the site itself. Planning is a handful of joins over the whole
+# OD table rather than a row loop per site zone, so a regional export with
+# tens of thousands of OD rows plans in a fraction of a second. Rows with a
+# zone missing from the centroid table become a single invalid_zone trip with
+# no route.
+
+
+def plan_site_routes(od, zones_df, zone_col, site_zones, site_lat, site_lon):
+    """
+    Plan the trips of od (see tts_parser.od_totals_by_period: orig, dest,
+    total and one column per period) through the given site zones. Returns
+    (plan, route_requests): the plan has one row per trip with origin_id,
+    dest_id, route_type, total, site_zone, its route key (None for
+    invalid_zone) and the period columns, ordered by site zone, OD row, then
+    leg; route_requests has one row per distinct route key with its end
+    points.
+    """
+    periods = list(od.columns[3:])
+    zone_coords = zones_df[[zone_col, 'Latitude', 'Longitude']].drop_duplicates(zone_col)
+    sites = pd.DataFrame({
+        'site_zone': pd.Series(site_zones, dtype='int64'),
+        'site_order': np.arange(len(site_zones))
+    })
+    sites = sites[sites['site_zone'].isin(zone_coords[zone_col])]
+
+    od = od.rename(columns={'orig': 'origin_id', 'dest': 'dest_id'}).assign(row=np.arange(len(od)))
+    touching = pd.concat([
+        od.merge(sites, left_on='origin_id', right_on='site_zone'),
+        od.merge(sites, left_on='dest_id', right_on='site_zone')
+    ]).drop_duplicates(['site_order', 'row'])
+    touching = touching.merge(
+        zone_coords.rename(columns={zone_col: 'origin_id', 'Latitude': 'o_lat', 'Longitude': 'o_lon'}),
+        on='origin_id', how='left'
+    ).merge(
+        zone_coords.rename(columns={zone_col: 'dest_id', 'Latitude': 'd_lat', 'Longitude': 'd_lon'}),
+        on='dest_id', how='left'
+    )
+
+    invalid = touching['o_lat'].isna() | touching['d_lat'].isna()
+    inbound = ~invalid & (touching['dest_id'] == touching['site_zone'])
+    outbound = ~invalid & (touching['origin_id'] == touching['site_zone'])
+
+    # Columns are taken from each leg's own rows; assigning the full
+    # columns to an empty leg would give it every row, as NaNs
+    plan = pd.concat([
+        touching[inbound].assign(
+            route_type='origin_to_site', leg=0,
+            origin_lat=lambda legs: legs['o_lat'], origin_lon=lambda legs: legs['o_lon'],
+            dest_lat=site_lat, dest_lon=site_lon
+        ),
+        touching[outbound].assign(
+            route_type='site_to_destination', leg=1,
+            origin_lat=site_lat, origin_lon=site_lon,
+            dest_lat=lambda legs: legs['d_lat'], dest_lon=lambda legs: legs['d_lon']
+        ),
+        touching[invalid].assign(route_type='invalid_zone', leg=0)
+    ])
+    # Same order the trips appear in: by site zone, OD row, then leg
+    plan = plan.sort_values(['site_order', 'row', 'leg'], kind='stable').reset_index(drop=True)
+
+    # Route requests are keyed by their rounded coordinate pair, so the same
+    # zone→site trip planned for several site zones, duplicate OD rows, and
+    # repeated intra-zone legs are all fetched once and fanned back out to
+    # every planned row.
+    plan['key'] = make_route_keys(
+        plan['origin_lat'], plan['origin_lon'], plan['dest_lat'], plan['dest_lon']
+    )
+    plan.loc[plan['route_type'] == 'invalid_zone', 'key'] = None
+    route_requests = plan.loc[
+        plan['key'].notna(), ['key', 'origin_lat', 'origin_lon', 'dest_lat', 'dest_lon']
+    ].drop_duplicates('key')
+    plan = plan[['origin_id', 'dest_id', 'route_type', 'total', 'site_zone', 'key'] + periods]
+    return plan, route_requests
@@ -0,0 +1,602 @@
+import itertools
+import multiprocessing
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from road_graph import RoadGraph
+
+# --- Routing backends ------------------------------------------------------
+#
+# Every page asks a routing backend for routes instead of calling a
+# hard-coded server, so the tool can be pointed at our own osrm-backend
+# container (or anything else speaking the OSRM /route/v1 API) through
+# environment variables:
+#
+#   TTS_ROUTING_BACKEND  backend name from BACKENDS (default "osrm")
+#   TTS_ROUTING_URLS     comma-separated base URL(s); requests are spread
+#                        across them and fail over to the next on errors
+#   TTS_ROUTING_PROFILE  routing profile (default "driving")
+#   TTS_ROUTING_TIMEOUT  per-request timeout in seconds (default 10)
+#   TTS_ROUTING_GRAPH    .npz road graph for the offline "local" backend
+#                        (built with road_graph.py)
+#   TTS_ROUTING_WORKERS  worker processes for the local backend
+#   TTS_ROUTING_ONE_TO_MANY  set to 0 to stop the local backend solving
+#                        routes that share an end point with one shortest-
+#                        path tree
+#
+# Backends with summaries=True can also answer a route's length and snapped
+# end points without its geometry (request_summary/fetch_summaries), which
+# the app uses to screen out routes that can't reach any POI before paying
+# for full geometry.
+#
+# A route's timing status is 200 when it was found, one of NO_ROUTE_STATUSES
+# when the router says no route exists, and otherwise whatever made the
+# fetch fail (an HTTP status or exception name).
+#
+# The OSRM backend keeps one shared requests.Session so connections to the
+# routing server stay alive between requests instead of opening a new
+# TCP/HTTP connection per route. The number of requests in flight adapts to
+# how the server is coping (additive increase while responses come back
+# fine, multiplicative decrease on 429/5xx/timeouts), and failed requests
+# are retried with exponential backoff and full jitter.
+
+OSRM_BASE_URL = "http://router.project-osrm.org"
+DEFAULT_PROFILE = "driving"
+DEFAULT_TIMEOUT = 10
+
+# Status codes that mean "slow down / try again" rather than "bad request"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Statuses of answers saying no route exists between the points (OSRM's
+# response codes; the local backend uses NoRoute too). Unlike failures,
+# retrying these can never succeed.
+NO_ROUTE_STATUSES = {'NoRoute', 'NoSegment'}
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on the number of requests in flight. Successful responses grow
+    the limit by roughly one per window of requests; throttling, server errors
+    or latency well above the observed baseline halve it.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=32, latency_factor=3.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self.baseline_latency = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, congested=False):
+        with self._cond:
+            self.in_flight -= 1
+
+            if latency is not None and not congested:
+                # Slow-moving baseline so one slow route doesn't reset it
+                if self.baseline_latency is None:
+                    self.baseline_latency = latency
+                else:
+                    self.baseline_latency = 0.9 * self.baseline_latency + 0.1 * latency
+                if latency > self.latency_factor * self.baseline_latency:
+                    congested = True
+
+            if congested:
+                # Only back off once per latency window, otherwise a burst of
+                # errors from the same overload collapses the limit to 1
+                now = time.monotonic()
+                window = self.baseline_latency or 1.0
+                if now - self._last_decrease > window:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+            self._cond.notify_all()
+
+    @property
+    def current(self):
+        return int(self.limit)
+
+
+def backoff_delay(attempt, base=0.5, cap=10.0):
+    """Exponential backoff with full jitter for the given (0-based) retry attempt"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class NoRouteFound(Exception):
+    """Raised when the backend answers but has no route between the points"""
+
+
+class RoutingBackend:
+    """
+    Base class for routing backends. Subclasses implement request_route and
+    route_details; get_route and the parallel fetch_routes build on those.
+    """
+
+    name = None
+    pool_size = 32
+    # Whether request_summary is cheaper than request_route
+    summaries = False
+
+    def __init__(self, profile=DEFAULT_PROFILE, timeout=DEFAULT_TIMEOUT):
+        self.profile = profile
+        self.timeout = timeout
+
+    @classmethod
+    def options_from_env(cls, environ):
+        """Backend constructor options read from TTS_ROUTING_* variables"""
+        return {
+            'profile': environ.get("TTS_ROUTING_PROFILE", DEFAULT_PROFILE),
+            'timeout': float(environ.get("TTS_ROUTING_TIMEOUT", DEFAULT_TIMEOUT)),
+        }
+
+    @property
+    def cache_profile(self):
+        """Profile label used in route cache keys for this backend's results"""
+        return self.profile
+
+    def describe(self):
+        return f"{self.name} ({self.profile})"
+
+    def request_route(self, origin_lat, origin_lon, dest_lat, dest_lon, limiter=None):
+        """
+        Fetch one route's encoded polyline geometry. Returns (geometry, timing)
+        where geometry is None if no route could be found, and timing records
+        the attempts made, the last status and the total elapsed time.
+        """
+        raise NotImplementedError
+
+    def request_summary(self, origin_lat, origin_lon, dest_lat, dest_lon, limiter=None):
+        """
+        Fetch one route without its geometry. Returns (summary, timing) where
+        summary is {'distance': m, 'waypoints': [[lat, lon], [lat, lon]]} (the
+        end points as snapped to the road) or None if no route could be found.
+        """
+        raise NotImplementedError
+
+    def route_details(self, origin_lat, origin_lon, dest_lat, dest_lon):
+        """
+        Return {'geometry': [[lon, lat], ...], 'distance': m, 'duration': s}
+        for one route. Raises NoRouteFound or the backend's own errors.
+        """
+        raise NotImplementedError
+
+    def get_route(self, origin_lat, origin_lon, dest_lat, dest_lon):
+        """Fetch one route's encoded polyline geometry, or None on failure"""
+        return self.request_route(origin_lat, origin_lon, dest_lat, dest_lon)[0]
+
+    def fetch_routes(self, route_requests, max_concurrency=None, initial_concurrency=8,
+                     on_result=None):
+        """
+        Fetch every route in route_requests (dicts with key and origin/dest
+        lat/lon) under adaptive concurrency. Calls on_result(key, geometry,
+        timing, limiter) from the calling thread as each route completes and
+        returns ({key: geometry}, {key: timing}).
+        """
+        return self._fetch_parallel(self.request_route, route_requests, max_concurrency,
+                                    initial_concurrency, on_result)
+
+    def fetch_summaries(self, route_requests, max_concurrency=None, initial_concurrency=8,
+                        on_result=None):
+        """As fetch_routes, but with request_summary results instead of geometry"""
+        return self._fetch_parallel(self.request_summary, route_requests, max_concurrency,
+                                    initial_concurrency, on_result)
+
+    def _fetch_parallel(self, request, route_requests, max_concurrency, initial_concurrency, on_result):
+        max_concurrency = min(max_concurrency or self.pool_size, self.pool_size)
+        limiter = AdaptiveConcurrency(
+            initial=min(initial_concurrency, max_concurrency),
+            maximum=max_concurrency
+        )
+        results = {}
+        timings = {}
+
+        if not route_requests:
+            return results, timings
+
+        # Workers sleep through backoff without holding a slot, so the pool
+        # is sized to the ceiling and the limiter decides what runs.
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures = {
+                executor.submit(
+                    request,
+                    r['origin_lat'], r['origin_lon'],
+                    r['dest_lat'],   r['dest_lon'],
+                    limiter
+                ): r['key']
+                for r in route_requests
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    geometry, timing = future.result()
+                except Exception as e:
+                    geometry, timing = None, {'attempts': 0, 'status': type(e).__name__,
+                                              'latency': None, 'elapsed': None}
+                results[key] = geometry
+                timings[key] = timing
+                if on_result:
+                    on_result(key, geometry, timing, limiter)
+
+        return results, timings
+
+
+class OSRMBackend(RoutingBackend):
+    """Pooled-session client for one or more OSRM-compatible /route/v1 endpoints"""
+
+    name = "osrm"
+    summaries = True
+
+    def __init__(self, base_urls=(OSRM_BASE_URL,), profile=DEFAULT_PROFILE,
+                 timeout=DEFAULT_TIMEOUT, retries=3, pool_size=32):
+        super().__init__(profile=profile, timeout=timeout)
+        if isinstance(base_urls, str):
+            base_urls = [base_urls]
+        self.base_urls = [url.rstrip('/') for url in base_urls]
+        self.retries = retries
+        self.pool_size = pool_size
+        self._next_url = itertools.cycle(self.base_urls)
+        self._url_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.base_urls), pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def options_from_env(cls, environ):
+        options = super().options_from_env(environ)
+        urls = [url.strip() for url in environ.get("TTS_ROUTING_URLS", "").split(',') if url.strip()]
+        if urls:
+            options['base_urls'] = urls
+        return options
+
+    def describe(self):
+        return f"{self.name} ({self.profile}) at {', '.join(self.base_urls)}"
+
+    def _base_url(self):
+        with self._url_lock:
+            return next(self._next_url)
+
+    def route_url(self, origin_lat, origin_lon, dest_lat, dest_lon, base_url=None):
+        return (f'{base_url or self.base_urls[0]}/route/v1/{self.profile}/'
+                f'{origin_lon},{origin_lat};{dest_lon},{dest_lat}')
+
+    def request_route(self, origin_lat, origin_lon, dest_lat, dest_lon, limiter=None):
+        route, timing = self._request(origin_lat, origin_lon, dest_lat, dest_lon, {'overview': 'full'}, limiter)
+        return (route['geometry'] if route else None), timing
+
+    def request_summary(self, origin_lat, origin_lon, dest_lat, dest_lon, limiter=None):
+        route, timing = self._request(origin_lat, origin_lon, dest_lat, dest_lon, {'overview': 'false'}, limiter)
+        if route is None:
+            return None, timing
+        return {
+            'distance': route['distance'],
+            'waypoints': [[lat, lon] for lon, lat in route['waypoints']],
+        }, timing
+
+    def _request(self, origin_lat, origin_lon, dest_lat, dest_lon, params, limiter=None):
+        """
+        One /route request with retries and failover. Returns (route, timing)
+        where route is the first route of the response, with the response's
+        snapped waypoint [lon, lat] locations added, or None.
+        """
+        timing = {'attempts': 0, 'status': None, 'latency': None, 'elapsed': None}
+        started = time.perf_counter()
+        route = None
+
+        for attempt in range(self.retries):
+            timing['attempts'] = attempt + 1
+            retry_after = None
+            congested = False
+
+            # Each attempt moves on to the next server, so a dead endpoint
+            # fails over instead of eating every retry
+            url = self.route_url(origin_lat, origin_lon, dest_lat, dest_lon, self._base_url())
+
+            if limiter:
+                limiter.acquire()
+            request_started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                timing['status'] = response.status_code
+                if response.status_code == 200:
+                    data = response.json()
+                    if data.get('code') == 'Ok' and data.get('routes'):
+                        route = dict(data['routes'][0])
+                        route['waypoints'] = [w['location'] for w in data.get('waypoints', [])]
+                    else:
+                        # NoRoute and friends won't change on retry
+                        code = data.get('code')
+                        timing['status'] = code if code and code != 'Ok' else 'NoRoute'
+                    break
+                if response.status_code not in RETRYABLE_STATUS:
+                    # Some OSRM versions answer NoRoute/NoSegment with a 400
+                    try:
+                        code = response.json().get('code')
+                    except ValueError:
+                        code = None
+                    if code in NO_ROUTE_STATUSES:
+                        timing['status'] = code
+                    break
+                congested = True
+                retry_after = response.headers.get('Retry-After')
+            except requests.RequestException as e:
+                timing['status'] = type(e).__name__
+                congested = True
+            finally:
+                timing['latency'] = time.perf_counter() - request_started
+                if limiter:
+                    limiter.release(timing['latency'], congested=congested)
+
+            if attempt < self.retries - 1:
+                delay = backoff_delay(attempt)
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                time.sleep(delay)
+
+        timing['elapsed'] = time.perf_counter() - started
+        return route, timing
+
+    def route_details(self, origin_lat, origin_lon, dest_lat, dest_lon):
+        url = self.route_url(origin_lat, origin_lon, dest_lat, dest_lon, self._base_url())
+        response = self.session.get(
+            url, params={'overview': 'full', 'geometries': 'geojson'}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        route_json = response.json()
+        if not route_json.get("routes"):
+            raise NoRouteFound(route_json.get("message") or route_json.get("code"))
+        route = route_json["routes"][0]
+        return {
+            "geometry": route["geometry"]["coordinates"],
+            "distance": route["distance"],
+            "duration": route["duration"],
+        }
+
+
+# The local backend answers routes in worker processes so throughput scales
+# with CPU cores; each worker loads its own copy of the graph once. Requests
+# sharing an end point (all origins → site, site → all destinations) are
+# solved together from one shortest-path tree instead of one search each.
+MIN_TREE_GROUP = 4
+
+_worker_graph = None
+
+
+def _init_route_worker(graph_path):
+    global _worker_graph
+    _worker_graph = RoadGraph.load(graph_path)
+
+
+def _run_in_worker(task, *args):
+    return task(_worker_graph, *args)
+
+
+def _single_route(graph, origin_lat, origin_lon, dest_lat, dest_lon):
+    started = time.perf_counter()
+    route = graph.route(origin_lat, origin_lon, dest_lat, dest_lon)
+    return [route['geometry'] if route else None], time.perf_counter() - started
+
+
+def _tree_routes(graph, root_lat, root_lon, points, reverse):
+    started = time.perf_counter()
+    routes = graph.routes_from_root(root_lat, root_lon, points, reverse=reverse)
+    return [route['geometry'] if route else None for route in routes], time.perf_counter() - started
+
+
+def plan_route_trees(route_requests, min_group=MIN_TREE_GROUP):
+    """
+    Split route requests into groups that share an end point, each solvable
+    with one shortest-path tree, and the leftover point-to-point requests.
+    Returns ([(root_lat, root_lon, reverse, requests), ...], leftovers) where
+    reverse means the group's routes all end at the root.
+    """
+    groups = []
+    remaining = list(route_requests)
+
+    while remaining:
+        ends = Counter()
+        for r in remaining:
+            ends[(r['dest_lat'], r['dest_lon'], True)] += 1
+            ends[(r['origin_lat'], r['origin_lon'], False)] += 1
+        (lat, lon, reverse), count = ends.most_common(1)[0]
+        if count < min_group:
+            break
+
+        end = ('dest_lat', 'dest_lon') if reverse else ('origin_lat', 'origin_lon')
+        members = [r for r in remaining if (r[end[0]], r[end[1]]) == (lat, lon)]
+        remaining = [r for r in remaining if (r[end[0]], r[end[1]]) != (lat, lon)]
+        groups.append((lat, lon, reverse, members))
+
+    return groups, remaining
+
+
+class LocalGraphBackend(RoutingBackend):
+    """Offline in-process router over a prepared road graph (see road_graph.py)"""
+
+    name = "local"
+
+    def __init__(self, graph_path, profile=DEFAULT_PROFILE, timeout=DEFAULT_TIMEOUT, workers=None,
+                 one_to_many=True):
+        super().__init__(profile=profile, timeout=timeout)
+        self.graph_path = graph_path
+        self.graph = RoadGraph.load(graph_path)
+        self.workers = workers or os.cpu_count() or 1
+        self.one_to_many = one_to_many
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @classmethod
+    def options_from_env(cls, environ):
+        options = super().options_from_env(environ)
+        options['graph_path'] = environ.get("TTS_ROUTING_GRAPH")
+        if environ.get("TTS_ROUTING_WORKERS"):
+            options['workers'] = int(environ["TTS_ROUTING_WORKERS"])
+        options['one_to_many'] = environ.get("TTS_ROUTING_ONE_TO_MANY", "1").lower() not in ("0", "false", "no")
+        return options
+
+    @property
+    def cache_profile(self):
+        # Keep offline results apart from OSRM's in the shared route cache
+        return f"{self.name}-{self.profile}"
+
+    def describe(self):
+        return (f"{self.name} ({self.profile}) graph {self.graph_path} — "
+                f"{self.graph.num_nodes} nodes, {self.workers} workers"
+                + (", one-to-many" if self.one_to_many else ""))
+
+    def request_route(self, origin_lat, origin_lon, dest_lat, dest_lon, limiter=None):
+        geometries, elapsed = _single_route(self.graph, origin_lat, origin_lon, dest_lat, dest_lon)
+        timing = {'attempts': 1, 'status': 200 if geometries[0] else 'NoRoute',
+                  'latency': elapsed, 'elapsed': elapsed}
+        return geometries[0], timing
+
+    def route_details(self, origin_lat, origin_lon, dest_lat, dest_lon):
+        route = self.graph.route(origin_lat, origin_lon, dest_lat, dest_lon)
+        if route is None:
+            raise NoRouteFound("No path between the snapped road nodes")
+        distance, duration = self.graph.path_cost(route['path'])
+        return {
+            "geometry": route['coords'][:, ::-1].tolist(),
+            "distance": distance,
+            "duration": duration,
+        }
+
+    def _process_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_route_worker,
+                    initargs=(self.graph_path,)
+                )
+            return self._pool
+
+    def fetch_routes(self, route_requests, max_concurrency=None, initial_concurrency=8,
+                     on_result=None):
+        if self.one_to_many:
+            groups, singles = plan_route_trees(route_requests)
+        else:
+            groups, singles = [], list(route_requests)
+
+        # Each task is (function, args, keys it answers, in order)
+        tasks = []
+        for root_lat, root_lon, reverse, members in groups:
+            if reverse:
+                points = [(r['origin_lat'], r['origin_lon']) for r in members]
+            else:
+                points = [(r['dest_lat'], r['dest_lon']) for r in members]
+            tasks.append((_tree_routes, (root_lat, root_lon, points, reverse), [r['key'] for r in members]))
+        for r in singles:
+            tasks.append((_single_route, (r['origin_lat'], r['origin_lon'], r['dest_lat'], r['dest_lon']), [r['key']]))
+
+        use_pool = self.workers > 1 and len(tasks) > 1
+        # No server to protect here, the limiter only reports the parallelism
+        parallelism = self.workers if use_pool else 1
+        limiter = AdaptiveConcurrency(initial=parallelism, maximum=parallelism)
+        results = {}
+        timings = {}
+
+        def record(keys, outcome):
+            try:
+                geometries, elapsed = outcome()
+                status = None
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    # A worker died; start a fresh pool on the next run
+                    with self._pool_lock:
+                        self._pool = None
+                geometries, elapsed, status = [None] * len(keys), None, type(e).__name__
+            for key, geometry in zip(keys, geometries):
+                results[key] = geometry
+                timings[key] = {
+                    'attempts': 1 if elapsed is not None else 0,
+                    'status': status or (200 if geometry else 'NoRoute'),
+                    'latency': elapsed,
+                    'elapsed': elapsed,
+                }
+                if on_result:
+                    on_result(key, geometry, timings[key], limiter)
+
+        if not use_pool:
+            for task, args, keys in tasks:
+                record(keys, lambda: task(self.graph, *args))
+            return results, timings
+
+        executor = self._process_pool()
+        futures = {
+            executor.submit(_run_in_worker, task, *args): keys
+            for task, args, keys in tasks
+        }
+        for future in as_completed(futures):
+            record(futures[future], future.result)
+
+        return results, timings
+
+
+BACKENDS = {
+    OSRMBackend.name: OSRMBackend,
+    LocalGraphBackend.name: LocalGraphBackend,
+}
+
+
+def create_backend(name="osrm", **options):
+    """Instantiate a routing backend by name with backend-specific options"""
+    try:
+        backend_cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown routing backend: {name} (choose from {', '.join(BACKENDS)})")
+    return backend_cls(**options)
+
+
+def backend_from_env(environ=None):
+    """Build the routing backend described by the TTS_ROUTING_* environment variables"""
+    environ = os.environ if environ is None else environ
+    name = environ.get("TTS_ROUTING_BACKEND", "osrm")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown routing backend: {name} (choose from {', '.join(BACKENDS)})")
+    return create_backend(name, **BACKENDS[name].options_from_env(environ))
+
+
+def summarize_timings(timings):
+    """Summarize per-request timings into counts and latency percentiles (seconds)"""
+    latencies = sorted(t['elapsed'] for t in timings.values() if t.get('elapsed') is not None)
+    summary = {
+        'requests': len(timings),
+        'retried': sum(1 for t in timings.values() if t.get('attempts', 0) > 1),
+        'no_route': 0,
+        'failed_statuses': {},
+        'median': None,
+        'p95': None,
+        'max': None,
+    }
+    for t in timings.values():
+        status = t.get('status')
+        if status in NO_ROUTE_STATUSES:
+            summary['no_route'] += 1
+        elif status != 200:
+            summary['failed_statuses'][status] = summary['failed_statuses'].get(status, 0) + 1
+    if latencies:
+        summary['median'] = latencies[len(latencies) // 2]
+        summary['p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        summary['max'] = latencies[-1]
+    return summary
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from routing import NO_ROUTE_STATUSES
+
+# --- Run checkpoints ---------------------------------------------------------
+#
+# A regional run can spend a long time fetching routes, and a dropped
+# Streamlit connection or a router that starts failing half way used to throw
+# all of it away. Each run (one set of routing inputs) gets a small SQLite
+# checkpoint that the fetch writes to in batches as routes arrive: the
+# geometries fetched, the routes that failed with their last status, and the
+# length-screen summaries. Starting the same run again resumes from it and
+# only asks the router for routes that are missing or failed. A checkpoint is
+# removed once its run has every route; one with failures left is kept so
+# they can be retried later. Unlike the shared route cache, checkpoints are
+# never evicted by size, only pruned to the most recently used.
+#
+#   TTS_CHECKPOINT_DIR  where checkpoints live (default .route_cache/runs);
+#                       set it empty to turn checkpoints off
+
+CHECKPOINT_DIR = os.environ.get(
+    "TTS_CHECKPOINT_DIR",
+    str(Path(__file__).resolve().parent / ".route_cache" / "runs")
+) or None
+CHECKPOINTS_KEPT = 20
+
+
+def hash_analysis_inputs(content, data_choice, site_zones, site_lat, site_lon, pois=None):
+    """
+    Returns a content hash of everything process_tts_file depends on, so
+    reruns can reuse the stored results until one of the inputs changes.
+    Leave out pois to get the key for the routes alone, which names the
+    run's checkpoint and geometry store.
+    """
+    payload = json.dumps({
+        'content': hashlib.sha256(content.encode()).hexdigest(),
+        'data_choice': data_choice,
+        'site_zones': [int(zone) for zone in site_zones],
+        'site': [site_lat, site_lon],
+        'pois': pois,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class RunCheckpoint:
+    """Incrementally written record of one run's route fetches"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS routes (key TEXT PRIMARY KEY, geometry TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS failures ("
+                " key TEXT PRIMARY KEY,"
+                " status TEXT,"
+                " failed REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                " key TEXT PRIMARY KEY,"
+                " distance REAL NOT NULL,"
+                " origin_lat REAL NOT NULL, origin_lon REAL NOT NULL,"
+                " dest_lat REAL NOT NULL, dest_lon REAL NOT NULL)"
+            )
+        # Marks the checkpoint as recently used for prune_checkpoints
+        os.utime(self.path)
+
+    def record_routes(self, geometries, failures=None):
+        """
+        Store fetched {key: geometry} routes and {key: status} failures in one
+        transaction. A route that comes back fine clears its earlier failure.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO routes (key, geometry) VALUES (?, ?)",
+                [(key, geometry) for key, geometry in geometries.items() if geometry]
+            )
+            self._conn.executemany("DELETE FROM failures WHERE key = ?", [(key,) for key in geometries])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO failures (key, status, failed) VALUES (?, ?, ?)",
+                [(key, str(status), now) for key, status in (failures or {}).items()]
+            )
+
+    def record_summaries(self, summaries):
+        """Store {key: summary} length-screen results (see RoutingBackend.request_summary)"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?)",
+                [(key, s['distance'], *s['waypoints'][0], *s['waypoints'][1])
+                 for key, s in summaries.items() if s is not None and len(s['waypoints']) == 2]
+            )
+
+    def routes(self):
+        """Every checkpointed {key: geometry}"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, geometry FROM routes"))
+
+    def failures(self):
+        """
+        {key: last status} of routes whose latest fetch failed, including
+        those the router said don't exist (a status in NO_ROUTE_STATUSES)
+        """
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, status FROM failures"))
+
+    def summaries(self):
+        """Every checkpointed {key: summary}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM summaries").fetchall()
+        return {key: {'distance': distance, 'waypoints': [[o_lat, o_lon], [d_lat, d_lon]]}
+                for key, distance, o_lat, o_lon, d_lat, d_lon in rows}
+
+    def progress(self):
+        """Number of routes fetched, failed and found not to exist so far"""
+        with self._lock:
+            routes = self._conn.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+            statuses = [status for (status,) in self._conn.execute("SELECT status FROM failures")]
+        no_route = sum(status in NO_ROUTE_STATUSES for status in statuses)
+        return {'routes': routes, 'failed': len(statuses) - no_route, 'no_route': no_route}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def remove(self):
+        """Close the checkpoint and delete its files"""
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.path + suffix)
+            except FileNotFoundError:
+                pass
+
+
+def prune_checkpoints(directory, keep=CHECKPOINTS_KEPT):
+    """Delete all but the keep most recently used checkpoints under directory"""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return
+    checkpoints = sorted(directory.glob("*.sqlite3"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for stale in checkpoints[keep:]:
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(str(stale) + suffix)
+            except FileNotFoundError:
+                pass
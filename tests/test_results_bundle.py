@@ -0,0 +1,111 @@
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from streamlit.testing.v1 import AppTest
+
+import zone_data
+from results_bundle import load_results_bundle, save_results_bundle
+from route_geometry import RouteGeometryStore
+from run_checkpoint import hash_analysis_inputs
+from tts_parser import od_totals_by_period, parse_tts_export
+
+ROOT = Path(__file__).resolve().parent.parent
+DATA_CHOICE = "2022 Zones"
+SITE_ZONE = 1001
+ORIGIN_ZONES = [1002, 1003, 1004]
+
+
+def use_box_zones(monkeypatch, tmp_path):
+    """Zone data with a small box around each 2022 centroid, standing in for the polygon GeoJSON"""
+    zones = pd.read_csv(ROOT / '2022Zones.csv')
+    zones.to_csv(tmp_path / '2022Zones.csv', index=False)
+    gpd.GeoDataFrame(
+        {'TTS2022': zones['TTS2022'], 'Reg_name': "Toronto"},
+        geometry=shapely.box(zones['Longitude'] - 0.002, zones['Latitude'] - 0.002,
+                             zones['Longitude'] + 0.002, zones['Latitude'] + 0.002),
+        crs=4326
+    ).to_parquet(tmp_path / '2022Polygons.parquet')
+    monkeypatch.setattr(zone_data, 'DATA_DIR', tmp_path)
+
+
+def sample_bundle():
+    """
+    A bundle of three origin -> site routes, one passing the POI, with the
+    AM sample's first trip totals (the export is only hashed, not re-parsed)
+    """
+    content = (ROOT / 'samplefiles' / 'AM.txt').read_text()
+    zones = pd.read_csv(ROOT / '2022Zones.csv').set_index('TTS2022')
+    site_lat, site_lon = zones.loc[SITE_ZONE, ['Latitude', 'Longitude']].tolist()
+
+    od = od_totals_by_period(parse_tts_export(content)).head(len(ORIGIN_ZONES))
+    periods = list(od.columns[3:])
+    keys = [f"route-{i}" for i in range(len(od))]
+    plan = pd.DataFrame({
+        'origin_id': ORIGIN_ZONES,
+        'dest_id': SITE_ZONE,
+        'route_type': 'origin_to_site',
+        'total': od['total'].to_numpy(),
+        'site_zone': SITE_ZONE,
+        'key': keys,
+        **{period: od[period].to_numpy() for period in periods},
+    })
+    lines = [np.linspace(zones.loc[origin, ['Latitude', 'Longitude']].to_numpy(dtype=float),
+                         [site_lat, site_lon], 10)
+             for origin in ORIGIN_ZONES]
+    store = RouteGeometryStore.from_coords(keys, lines)
+
+    poi_coordinates = tuple(lines[0][5])
+    pois = [{'id': 'POI_1', 'name': 'P1', 'coordinates': poi_coordinates, 'threshold': 0.2}]
+    passes = np.array([True, False, False])
+    results_df = pd.DataFrame({
+        'origin_id': plan['origin_id'].to_numpy(dtype=np.int32),
+        'dest_id': plan['dest_id'].to_numpy(dtype=np.int32),
+        'route_type': pd.Categorical(plan['route_type'],
+                                     categories=['origin_to_site', 'site_to_destination', 'invalid_zone']),
+        'passes': passes,
+        'num_pois_intersected': passes.astype(np.int16),
+        'first_poi': np.where(passes, 0, -1).astype(np.int16),
+        'POI': pd.Categorical(np.where(passes, 'P1', '')),
+        'total': plan['total'].to_numpy(dtype=np.int32),
+        'site_zone': plan['site_zone'].to_numpy(dtype=np.int32),
+        'route': np.arange(len(plan), dtype=np.int32),
+        **{period: plan[period].to_numpy(dtype=np.int32) for period in periods},
+    })
+    run = {
+        'plan': plan,
+        'periods': periods,
+        'requests': None,
+        'store': store,
+        'screened': None,
+        'poi_columns': {poi_coordinates: (np.array([0.0, 5.0, 5.0], dtype=np.float32),
+                                          np.array([5, 0, 0], dtype=np.int32))},
+        'matched': passes[:, None],
+        'key': hash_analysis_inputs(content, DATA_CHOICE, [SITE_ZONE], site_lat, site_lon),
+    }
+    inputs = {
+        'data_choice': DATA_CHOICE,
+        'site_zones': [SITE_ZONE],
+        'site_lat': site_lat,
+        'site_lon': site_lon,
+        'pois': pois,
+        'results_key': hash_analysis_inputs(content, DATA_CHOICE, [SITE_ZONE], site_lat, site_lon, pois),
+    }
+    return save_results_bundle(results_df, run, inputs, content)
+
+
+def test_bundle_loads_into_a_fresh_session(monkeypatch, tmp_path):
+    use_box_zones(monkeypatch, tmp_path)
+    at = AppTest.from_file(str(ROOT / 'app.py'), default_timeout=60)
+    at.session_state['loaded_bundle'] = load_results_bundle(sample_bundle())
+    at.run()
+
+    # The app reports its own exceptions with st.error
+    assert not at.exception and not at.error
+    assert [poi['name'] for poi in at.session_state.pois] == ['P1']
+    # The stored results are shown as they are, without routing anything
+    assert 'route_timings' not in at.session_state
+    assert at.session_state.results_df['passes'].tolist() == [True, False, False]
+    assert [metric.value for metric in at.metric][:2] == ['3', '1']
@@ -0,0 +1,190 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import polyline
+import pytest
+from geopy.distance import geodesic
+
+from route_geometry import (
+    RouteGeometryStore, closest_approach, decode_coords, match_matrix, passes_through, stack_coords
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+ZONES = pd.read_csv(ROOT / '2022Zones.csv').set_index('TTS2022')
+
+
+def zone_route(zones, steps=8):
+    """An encoded route through the given 2022 zone centroids, with a vertex every few hundred metres"""
+    stops = ZONES.loc[zones, ['Latitude', 'Longitude']].to_numpy()
+    coords = np.vstack([np.linspace(a, b, steps, endpoint=False) for a, b in zip(stops[:-1], stops[1:])]
+                       + [stops[-1:]])
+    return polyline.encode([tuple(c) for c in coords], 5)
+
+
+ROUTES = [
+    zone_route([1001, 1002, 1003, 1004, 1005]),
+    zone_route([1010, 1008, 1006, 1001]),
+    zone_route([1020, 1015, 1012, 1009]),
+]
+# The first route passes B (by zone 1001) before A (by zone 1004), the second
+# ends at B and the third passes neither
+POIS = [
+    {'id': 'POI_1', 'name': 'A', 'coordinates': (43.6580, -79.3350), 'threshold': 0.2},
+    {'id': 'POI_2', 'name': 'B', 'coordinates': (43.6655, -79.3115), 'threshold': 0.3},
+]
+
+
+def geodesic_closest(coords, poi):
+    """Closest vertex by geopy.geodesic, one vertex at a time"""
+    distances = [geodesic(tuple(vertex), poi).km for vertex in coords]
+    return min(distances), int(np.argmin(distances))
+
+
+@pytest.mark.parametrize('method', ['haversine', 'geodesic'])
+def test_closest_approach_matches_geodesic(method):
+    coords = [decode_coords(route) for route in ROUTES]
+    flat, offsets = stack_coords(coords)
+    for poi in POIS:
+        distances, indices = closest_approach(flat, offsets, poi['coordinates'], method=method)
+        for route, (distance, index) in enumerate(zip(distances, indices)):
+            expected, expected_index = geodesic_closest(coords[route], poi['coordinates'])
+            if method == 'geodesic':
+                assert distance == pytest.approx(expected, rel=1e-12)
+                assert index == expected_index
+            else:
+                # Haversine is within half a percent of the ellipsoid at this latitude
+                assert distance == pytest.approx(expected, rel=5e-3)
+                assert geodesic(tuple(coords[route][index]), poi['coordinates']).km == \
+                    pytest.approx(expected, rel=5e-3)
+
+
+def test_closest_approach_gives_empty_routes_no_vertex():
+    coords = [decode_coords(ROUTES[0]), np.empty((0, 2)), decode_coords(ROUTES[1])]
+    flat, offsets = stack_coords(coords)
+    distances, indices = closest_approach(flat, offsets, POIS[0]['coordinates'])
+
+    assert distances[1] == np.inf and indices[1] == -1
+    assert np.isfinite(distances[[0, 2]]).all() and (indices[[0, 2]] >= 0).all()
+
+    # Nothing at all to measure
+    distances, indices = closest_approach(*stack_coords([np.empty((0, 2))]), POIS[0]['coordinates'])
+    assert distances.tolist() == [np.inf] and indices.tolist() == [-1]
+
+
+def test_passes_through_at_the_threshold_boundary():
+    coords = decode_coords(ROUTES[0])
+    distance, _ = geodesic_closest(coords, POIS[0]['coordinates'])
+    poi = dict(POIS[0], threshold=None)
+
+    at_threshold = passes_through(ROUTES[0], [dict(poi, threshold=distance)], method='geodesic')
+    assert at_threshold['passes']
+    assert at_threshold['intersected_pois'][0]['actual_distance'] == pytest.approx(distance, rel=1e-12)
+    # One metre short of the closest approach misses it
+    assert not passes_through(ROUTES[0], [dict(poi, threshold=distance - 0.001)], method='geodesic')['passes']
+
+
+def test_passes_through_empty_route():
+    result = passes_through("", POIS)
+    assert result == {'passes': False, 'num_pois_intersected': 0, 'intersected_pois': []}
+
+
+def test_passes_through_lists_pois_in_route_order():
+    for route in ROUTES:
+        coords = decode_coords(route)
+        expected = []
+        for poi in POIS:
+            distance, index = geodesic_closest(coords, poi['coordinates'])
+            if distance <= poi['threshold']:
+                expected.append((index, poi['name']))
+
+        result = passes_through(route, POIS, method='geodesic')
+        assert [poi['name'] for poi in result['intersected_pois']] == [name for _, name in sorted(expected)]
+    assert [poi['name'] for poi in passes_through(ROUTES[0], POIS)['intersected_pois']] == ['B', 'A']
+
+
+def test_match_matrix_agrees_with_passes_through():
+    coords = [decode_coords(route) for route in ROUTES] + [np.empty((0, 2))]
+    flat, offsets = stack_coords(coords)
+    columns = [closest_approach(flat, offsets, poi['coordinates']) for poi in POIS]
+    distances = np.column_stack([d for d, _ in columns])
+    indices = np.column_stack([i for _, i in columns])
+
+    matched, first_poi = match_matrix(distances, indices, [poi['threshold'] for poi in POIS])
+
+    assert matched.tolist() == [[True, True], [False, True], [False, False], [False, False]]
+    assert first_poi.tolist() == [1, 1, -1, -1]
+    names = [poi['name'] for poi in POIS]
+    for route, route_coords in enumerate(coords[:-1]):
+        result = passes_through(None, POIS, coords=route_coords)
+        assert [names[j] for j in np.flatnonzero(matched[route])] == \
+            sorted((poi['name'] for poi in result['intersected_pois']), key=names.index)
+        expected_first = names.index(result['intersected_pois'][0]['name']) if result['passes'] else -1
+        assert first_poi[route] == expected_first
+
+    # A threshold exactly at a route's closest approach still matches, and
+    # the next float below it doesn't
+    thresholds = [POIS[0]['threshold'], distances[1, 1]]
+    assert match_matrix(distances, indices, thresholds)[0][1, 1]
+    thresholds[1] = np.nextafter(distances[1, 1], 0)
+    assert not match_matrix(distances, indices, thresholds)[0][1, 1]
+
+
+def assert_store_routes(store, expected):
+    """The store holds exactly the {key: coords} routes of expected, in that order"""
+    assert store.keys == list(expected)
+    for i, (key, coords) in enumerate(expected.items()):
+        assert store.index(key) == i
+        np.testing.assert_array_equal(store.route(i), coords)
+
+
+def test_store_round_trips_memory_mapped(tmp_path):
+    routes = {f"route-{i}": decode_coords(route) for i, route in enumerate(ROUTES)}
+    routes['empty'] = np.empty((0, 2))
+    store = RouteGeometryStore.from_coords(list(routes), list(routes.values()))
+
+    saved = store.save(tmp_path / 'store')
+
+    assert isinstance(saved.coords, np.memmap)
+    assert_store_routes(saved, routes)
+    assert saved.index('missing') == -1
+    loaded = RouteGeometryStore.load(tmp_path / 'store', mmap=False)
+    assert not isinstance(loaded.coords, np.memmap)
+    assert_store_routes(loaded, routes)
+
+    # Saving the same routes again reuses the files already there
+    before = (tmp_path / 'store' / 'coords.npy').stat().st_ino
+    assert_store_routes(store.save(tmp_path / 'store'), routes)
+    assert (tmp_path / 'store' / 'coords.npy').stat().st_ino == before
+
+
+def test_store_extends_with_appended_routes(tmp_path):
+    first = {'route-0': decode_coords(ROUTES[0])}
+    appended = {'route-1': decode_coords(ROUTES[1]), 'route-2': decode_coords(ROUTES[2])}
+    saved = RouteGeometryStore.from_coords(list(first), list(first.values())).save(tmp_path / 'store')
+
+    extended = saved.extend(list(appended), list(appended.values()))
+    assert_store_routes(extended, {**first, **appended})
+    assert_store_routes(saved, first)
+
+    resaved = extended.save(tmp_path / 'store')
+    assert isinstance(resaved.coords, np.memmap)
+    assert_store_routes(resaved, {**first, **appended})
+    # A session still holding the old store keeps reading it
+    assert_store_routes(saved, first)
+
+
+def test_store_replaces_an_incomplete_saved_store(tmp_path):
+    routes = {f"route-{i}": decode_coords(route) for i, route in enumerate(ROUTES)}
+    keys = list(routes)
+    # An interrupted run saved just the first and a route this run doesn't plan
+    other = np.array([[43.70, -79.40], [43.71, -79.41]])
+    RouteGeometryStore.from_coords([keys[0], 'other'], [routes[keys[0]], other]).save(tmp_path / 'store')
+
+    store = RouteGeometryStore.from_coords(keys, list(routes.values()))
+    saved = store.save(tmp_path / 'store')
+
+    # This run's routes come first, and the saved store's extra route is kept
+    assert_store_routes(saved, {**routes, 'other': other})
+    assert_store_routes(RouteGeometryStore.load(tmp_path / 'store'), {**routes, 'other': other})
+    assert [p.name for p in tmp_path.iterdir()] == ['store']
@@ -0,0 +1,82 @@
+from pathlib import Path
+
+import pandas as pd
+
+from route_cache import make_route_key
+from route_plan import plan_site_routes
+
+ROOT = Path(__file__).resolve().parent.parent
+ZONES = pd.read_csv(ROOT / '2022Zones.csv')
+SITE = (43.6600, -79.3200)
+
+
+def od_table(rows):
+    """An od_totals_by_period-style table from (orig, dest, AM, PM) rows"""
+    od = pd.DataFrame(rows, columns=['orig', 'dest', 'AM', 'PM'])
+    od.insert(2, 'total', od['AM'] + od['PM'])
+    return od
+
+
+def loop_plan(od, site_zones):
+    """The per-site-zone row loop the planner replaced, as (origin, dest, type, total, site zone, key) rows"""
+    lookup = ZONES.set_index('TTS2022')[['Latitude', 'Longitude']].to_dict('index')
+    rows = []
+    for site_zone in site_zones:
+        if site_zone not in lookup:
+            continue
+        for _, row in od.iterrows():
+            origin, dest = row['orig'], row['dest']
+            if site_zone not in (origin, dest):
+                continue
+            if origin not in lookup or dest not in lookup:
+                rows.append((origin, dest, 'invalid_zone', row['total'], site_zone, None))
+                continue
+            if dest == site_zone:
+                key = make_route_key(lookup[origin]['Latitude'], lookup[origin]['Longitude'], *SITE)
+                rows.append((origin, dest, 'origin_to_site', row['total'], site_zone, key))
+            if origin == site_zone:
+                key = make_route_key(*SITE, lookup[dest]['Latitude'], lookup[dest]['Longitude'])
+                rows.append((origin, dest, 'site_to_destination', row['total'], site_zone, key))
+    return pd.DataFrame(rows, columns=['origin_id', 'dest_id', 'route_type', 'total', 'site_zone', 'key'])
+
+
+def test_plan_matches_the_row_loop():
+    od = od_table([
+        (1002, 1001, 5, 1),    # to the first site
+        (1001, 1003, 0, 7),    # from it
+        (1001, 1001, 2, 2),    # within it
+        (99999, 1001, 3, 0),   # from a zone with no centroid
+        (1003, 1004, 9, 9),    # not touching a site
+        (1001, 1005, 4, 0),    # between the two sites
+        (1006, 1005, 1, 1),    # to the second site
+    ])
+    site_zones = [1001, 1005, 99998]
+
+    plan, requests = plan_site_routes(od, ZONES, 'TTS2022', site_zones, *SITE)
+    expected = loop_plan(od, site_zones)
+
+    pd.testing.assert_frame_equal(plan[expected.columns].astype(object), expected.astype(object))
+    assert plan[['AM', 'PM']].sum(axis=1).tolist() == plan['total'].tolist()
+    assert requests['key'].tolist() == expected['key'].dropna().drop_duplicates().tolist()
+    assert not requests[['origin_lat', 'origin_lon', 'dest_lat', 'dest_lon']].isna().any().any()
+
+    # Per-OD totals as the loop gave them
+    by_od = ['origin_id', 'dest_id', 'route_type']
+    pd.testing.assert_series_equal(plan.groupby(by_od)['total'].sum(), expected.groupby(by_od)['total'].sum())
+
+
+def test_plan_for_a_site_with_trips_in_one_direction():
+    od = od_table([
+        (1002, 1001, 5, 1),
+        (1003, 1001, 2, 0),
+        (99999, 1001, 3, 0),
+    ])
+
+    plan, requests = plan_site_routes(od, ZONES, 'TTS2022', [1001], *SITE)
+
+    # No site_to_destination rows at all, rather than one NaN row per trip
+    assert plan['route_type'].tolist() == ['origin_to_site', 'origin_to_site', 'invalid_zone']
+    assert plan['key'].isna().tolist() == [False, False, True]
+    assert len(requests) == 2 and not requests.isna().any().any()
+    pd.testing.assert_frame_equal(plan[loop_plan(od, [1001]).columns].astype(object),
+                                  loop_plan(od, [1001]).astype(object))
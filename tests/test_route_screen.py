@@ -0,0 +1,87 @@
+import threading
+
+import numpy as np
+import polyline
+
+from route_geometry import (
+    SCREEN_MIN_SHARE, closest_approach, estimate_screened_share, haversine_km, screen_routes, stack_coords
+)
+from routing import RoutingBackend
+
+SITE = (43.70, -79.40)
+
+
+class CountingBackend(RoutingBackend):
+    """Router over bent two-leg routes that counts the requests it answers"""
+
+    name = "counting"
+    summaries = True
+
+    def __init__(self):
+        super().__init__()
+        self.full_requests = 0
+        self.summary_requests = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def line(origin_lat, origin_lon, dest_lat, dest_lon):
+        # Out to a point off the straight line and back in, like a road detour
+        mid = np.array([(origin_lat + dest_lat) / 2 + 0.01, (origin_lon + dest_lon) / 2 + 0.01])
+        steps = np.linspace(0, 1, 20)[:, None]
+        return np.vstack([
+            np.array([origin_lat, origin_lon]) + steps * (mid - [origin_lat, origin_lon]),
+            mid + steps[1:] * (np.array([dest_lat, dest_lon]) - mid),
+        ])
+
+    def request_route(self, origin_lat, origin_lon, dest_lat, dest_lon, limiter=None):
+        with self._lock:
+            self.full_requests += 1
+        coords = self.line(origin_lat, origin_lon, dest_lat, dest_lon)
+        return polyline.encode([tuple(c) for c in coords], 5), {'attempts': 1, 'status': 200}
+
+    def request_summary(self, origin_lat, origin_lon, dest_lat, dest_lon, limiter=None):
+        with self._lock:
+            self.summary_requests += 1
+        coords = self.line(origin_lat, origin_lon, dest_lat, dest_lon)
+        length_km = np.diag(haversine_km(coords[:-1], coords[1:])).sum()
+        return {'distance': length_km * 1000,
+                'waypoints': [[origin_lat, origin_lon], [dest_lat, dest_lon]]}, {'attempts': 1, 'status': 200}
+
+
+def regional_requests(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    origins = np.column_stack([SITE[0] + rng.uniform(-0.3, 0.3, n), SITE[1] + rng.uniform(-0.4, 0.4, n)])
+    return [{'key': str(i), 'origin_lat': lat, 'origin_lon': lon, 'dest_lat': SITE[0], 'dest_lon': SITE[1]}
+            for i, (lat, lon) in enumerate(origins)]
+
+
+def test_screen_reduces_full_geometry_fetches_without_missing_matches():
+    requests = regional_requests()
+    poi, threshold = [SITE[0] + 0.05, SITE[1] + 0.12], 0.3
+    backend = CountingBackend()
+
+    summaries, _ = backend.fetch_summaries(requests)
+    origins = np.array([summaries[r['key']]['waypoints'][0] for r in requests])
+    dests = np.array([summaries[r['key']]['waypoints'][1] for r in requests])
+    lengths_km = np.array([summaries[r['key']]['distance'] / 1000 for r in requests])
+    candidates = screen_routes(origins, dests, lengths_km, [poi], [threshold])
+    backend.fetch_routes([r for r, keep in zip(requests, candidates) if keep])
+
+    assert backend.full_requests == candidates.sum() < len(requests) / 2
+    # Every route that really passes the POI was among those fetched
+    flat, offsets = stack_coords([CountingBackend.line(r['origin_lat'], r['origin_lon'],
+                                                       r['dest_lat'], r['dest_lon']) for r in requests])
+    distances, _ = closest_approach(flat, offsets, poi)
+    assert (distances <= threshold).any()
+    assert candidates[distances <= threshold].all()
+
+
+def test_screen_estimate_skips_layouts_it_cannot_pay_for():
+    requests = regional_requests()
+    origins = [[r['origin_lat'], r['origin_lon']] for r in requests]
+    dests = [[r['dest_lat'], r['dest_lon']] for r in requests]
+
+    # A small POI off to one side rules most routes out
+    assert estimate_screened_share(origins, dests, [[SITE[0] + 0.05, SITE[1] + 0.12]], [0.3]) >= SCREEN_MIN_SHARE
+    # A POI next to the site, which every route ends at, rules nothing out
+    assert estimate_screened_share(origins, dests, [[SITE[0] + 0.005, SITE[1]]], [1.0]) < SCREEN_MIN_SHARE
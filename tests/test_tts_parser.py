@@ -0,0 +1,109 @@
+import io
+from pathlib import Path
+
+import pandas as pd
+
+from tts_parser import od_totals_by_period, parse_tts_export
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def export(rows, start_time="600-900", run_time=True):
+    """One period's portal export, laid out like samplefiles/AM.txt"""
+    lines = []
+    if run_time:
+        lines.append("Mon Nov 25 2024 08:18:20 GMT-0500 (Eastern Standard Time) - Run Time: 2583ms")
+        lines.append("")
+    lines += [
+        "Cross Tabulation Query Form - Trip - 2016",
+        "",
+        "Row: 2006 GTA zone of origin - gta06_orig",
+        "Column: 2006 GTA zone of destination - gta06_dest",
+        "",
+        "Filters:",
+        "(2006 GTA zone of origin - gta06_orig In 5241",
+        "or",
+        "2006 GTA zone of destination - gta06_dest In 5241)",
+    ]
+    if start_time:
+        lines += ["and", f"Start time of trip - start_time In {start_time}"]
+    lines += ["", "undefined", "ROW : gta06_orig", "COLUMN : gta06_dest",
+              "  gta06_orig  gta06_dest      total"]
+    lines += [f"{orig:>12}{dest:>12}{total:>11}" for orig, dest, total in rows]
+    return "\n".join(lines) + "\n"
+
+
+def rows(od):
+    return list(zip(od['period'].astype(str), od['orig'], od['dest'], od['total']))
+
+
+def test_concatenated_periods_are_tagged_by_their_filters():
+    content = (export([(4056, 5241, 39), (5241, 3631, 29)], "600-900")
+               + export([(4056, 5241, 11), (5241, 4024, 8)], "1530-1830"))
+
+    od = parse_tts_export(content)
+
+    assert list(od['period'].cat.categories) == ["600-900", "1530-1830"]
+    assert od['period'].cat.ordered
+    assert rows(od) == [("600-900", 4056, 5241, 39), ("600-900", 5241, 3631, 29),
+                        ("1530-1830", 4056, 5241, 11), ("1530-1830", 5241, 4024, 8)]
+
+    totals = od_totals_by_period(od)
+    assert list(totals.columns) == ['orig', 'dest', 'total', "600-900", "1530-1830"]
+    assert totals.values.tolist() == [[4056, 5241, 50, 39, 11],
+                                      [5241, 3631, 29, 29, 0],
+                                      [5241, 4024, 8, 0, 8]]
+
+
+def test_repeated_headers_and_empty_sections_add_no_periods():
+    content = (
+        export([(4056, 5241, 39)], "600-900")
+        # A download that failed after its header, then one without the run time line
+        + export([], "900-1200")
+        + export([(4078, 5241, 14)], "1530-1830", run_time=False)
+        # The same period fetched again, with the column header repeated mid-table
+        + export([(4056, 5241, 1)], "600-900") + "  gta06_orig  gta06_dest      total\n"
+        + "        4090        5241         74\n"
+        # No start_time filter at all: named by its section number, which
+        # the failed download doesn't count towards
+        + export([(5096, 5241, 82)], None)
+    )
+
+    od = parse_tts_export(content)
+
+    assert list(od['period'].cat.categories) == ["600-900", "1530-1830", "Section 4"]
+    assert rows(od) == [("600-900", 4056, 5241, 39), ("1530-1830", 4078, 5241, 14),
+                        ("600-900", 4056, 5241, 1), ("600-900", 4090, 5241, 74),
+                        ("Section 4", 5096, 5241, 82)]
+
+    totals = od_totals_by_period(od).set_index(['orig', 'dest'])
+    assert totals.loc[(4056, 5241)].tolist() == [40, 40, 0, 0]
+    assert totals['total'].sum() == od['total'].sum()
+
+
+def test_malformed_lines_are_skipped():
+    content = export([(4056, 5241, 39)]) + "\n".join([
+        "        5241        3631",
+        "        5241        3632         30          7",
+        "        5241        abcd         30",
+        "        5241       -4024         88",
+        "        5241        4042        8.5",
+        "\t5241\t4054\t55",
+        "",
+        "   ",
+        "undefined",
+    ]) + "\n"
+
+    assert rows(parse_tts_export(content)) == [("600-900", 4056, 5241, 39), ("600-900", 5241, 4054, 55)]
+
+
+def test_sample_exports_parse_the_same_from_text_bytes_and_files():
+    content = (ROOT / 'samplefiles' / 'AM.txt').read_text() + (ROOT / 'samplefiles' / 'PM.txt').read_text()
+
+    od = parse_tts_export(content)
+
+    assert list(od['period'].cat.categories) == ["600-900", "1530-1830"]
+    assert (od['total'] > 0).all() and len(od) > 100
+    for source in (content.encode(), io.StringIO(content), io.BytesIO(content.encode())):
+        pd.testing.assert_frame_equal(parse_tts_export(source), od)
+    assert od_totals_by_period(parse_tts_export("")).empty
@@ -0,0 +1,112 @@
+import io
+import re
+from array import array
+
+import numpy as np
+import pandas as pd
+
+# --- TTS portal export parser -----------------------------------------------
+#
+# The portal's Emme-format cross tabulation text is a header block (run time,
+# query form, row/column attributes), a Filters block, then a ROW/COLUMN
+# section of "origin destination total" rows. Fetching several time periods
+# concatenates one such export per period, so each section is tagged with the
+# start_time range from its own filters. Lines are read one at a time into
+# typed arrays, so large multi-period exports never need a list of regex
+# matches or a copy of the text.
+
+SECTION_START = re.compile(r"Run Time:|^Cross Tabulation Query Form")
+PERIOD_FILTER = re.compile(r"start_time\s+In\s+([\d\-, ]+)")
+
+
+def iter_lines(source):
+    """Yield lines from a string, bytes, or an open text/binary file"""
+    if isinstance(source, bytes):
+        source = source.decode(errors='ignore')
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    for line in source:
+        if isinstance(line, bytes):
+            line = line.decode(errors='ignore')
+        yield line
+
+
+def parse_tts_export(source):
+    """
+    Parse one or more concatenated TTS exports in a single pass.
+
+    Returns a DataFrame with an ordered categorical 'period' column (the
+    start_time filter of each section, or "Section N" when it has none) and
+    integer 'orig', 'dest' and 'total' columns, one row per data line.
+    """
+    periods = []
+    period_codes = array('h')
+    origins = array('q')
+    dests = array('q')
+    totals = array('q')
+
+    section = -1
+    section_period = None
+    section_has_rows = False
+
+    def section_code():
+        # Sections are only registered once they have data, so a header
+        # without rows (a failed download) doesn't leave an empty period
+        label = section_period or f"Section {section + 1}"
+        if label not in periods:
+            periods.append(label)
+        return periods.index(label)
+
+    code = None
+    for line in iter_lines(source):
+        if SECTION_START.search(line):
+            # The run time line and the query form title both open an
+            # export; only start a new section once rows have been seen
+            if section < 0 or section_has_rows:
+                section += 1
+                section_period = None
+                section_has_rows = False
+                code = None
+            continue
+
+        parts = line.split()
+        if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit() and parts[2].isdigit():
+            if section < 0:
+                section = 0
+            if code is None:
+                code = section_code()
+            section_has_rows = True
+            period_codes.append(code)
+            origins.append(int(parts[0]))
+            dests.append(int(parts[1]))
+            totals.append(int(parts[2]))
+            continue
+
+        match = PERIOD_FILTER.search(line)
+        if match and not section_has_rows:
+            section_period = match.group(1).strip()
+            code = None
+
+    return pd.DataFrame({
+        'period': pd.Categorical.from_codes(
+            np.frombuffer(period_codes, dtype=np.int16), categories=periods, ordered=True
+        ),
+        'orig': np.frombuffer(origins, dtype=np.int64),
+        'dest': np.frombuffer(dests, dtype=np.int64),
+        'total': np.frombuffer(totals, dtype=np.int64),
+    })
+
+
+def od_totals_by_period(od):
+    """
+    Collapse a parsed export to one row per unique OD pair, with the overall
+    'total' and one column of trips per period (in export order).
+    """
+    by_period = od.pivot_table(
+        index=['orig', 'dest'], columns='period', values='total',
+        aggfunc='sum', fill_value=0, observed=True, sort=False
+    )
+    by_period.columns = [str(period) for period in by_period.columns]
+    by_period = by_period.astype(np.int64)
+    by_period.insert(0, 'total', by_period.sum(axis=1))
+    return by_period.reset_index()
@@ -0,0 +1,118 @@
+import argparse
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+
+# --- Zone data loaders -------------------------------------------------------
+#
+# Zone centroids ship as CSV and zone polygons as GeoJSON. Parsing the GeoJSON
+# (and reprojecting it) dominates a cold start, so both can be converted once
+# to Parquet/GeoParquet next to the source files:
+#
+#   python zone_data.py
+#
+# which also writes a simplified polygon variant for map display. The loaders
+# below read the binary files when they exist and are newer than the source,
+# and fall back to the original CSV/GeoJSON otherwise. app.py and the pages
+# all load zone data through here.
+
+DATA_DIR = Path(__file__).resolve().parent
+
+ZONE_SYSTEMS = {
+    "2006 Zones": {
+        'centroids': "2006Zones.csv",
+        'polygons': "2006Polygons.geojson",
+        'zone_col': 'gta06',
+        'region_col': 'region',
+    },
+    "2022 Zones": {
+        'centroids': "2022Zones.csv",
+        'polygons': "2022Polygons.geojson",
+        'zone_col': 'TTS2022',
+        'region_col': 'Reg_name',
+    },
+}
+
+# ~10 m; invisible at the zoom levels zones are shown at
+DISPLAY_TOLERANCE_DEG = 0.0001
+
+
+def _binary_path(source, variant=None):
+    suffix = f".{variant}.parquet" if variant else ".parquet"
+    return source.with_name(source.stem + suffix)
+
+
+def _fresh(binary, source):
+    return binary.exists() and (not source.exists() or binary.stat().st_mtime >= source.stat().st_mtime)
+
+
+def load_zone_centroids(data_choice):
+    """Zone centroid table plus the polygon zone and region column names"""
+    system = ZONE_SYSTEMS[data_choice]
+    source = DATA_DIR / system['centroids']
+    binary = _binary_path(source)
+    zones_df = pd.read_parquet(binary) if _fresh(binary, source) else pd.read_csv(source)
+    return zones_df, system['zone_col'], system['region_col']
+
+
+def load_zone_polygons(data_choice):
+    """Zone polygons in EPSG:4326"""
+    source = DATA_DIR / ZONE_SYSTEMS[data_choice]['polygons']
+    binary = _binary_path(source)
+    if _fresh(binary, source):
+        return gpd.read_parquet(binary)
+
+    gdf = gpd.read_file(source)
+    if gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    return gdf
+
+
+def load_display_polygons(data_choice):
+    """
+    Simplified zone polygons for drawing on maps, in the same row order as
+    load_zone_polygons, or None if the display variant hasn't been built
+    """
+    source = DATA_DIR / ZONE_SYSTEMS[data_choice]['polygons']
+    simplified = _binary_path(source, 'display')
+    return gpd.read_parquet(simplified) if _fresh(simplified, source) else None
+
+
+def convert_zone_data(data_choice, tolerance=DISPLAY_TOLERANCE_DEG):
+    """Write the Parquet centroids, GeoParquet polygons and display variant for a zone system"""
+    system = ZONE_SYSTEMS[data_choice]
+    written = []
+
+    centroids = DATA_DIR / system['centroids']
+    if centroids.exists():
+        pd.read_csv(centroids).to_parquet(_binary_path(centroids), index=False)
+        written.append(_binary_path(centroids))
+
+    polygons = DATA_DIR / system['polygons']
+    if polygons.exists():
+        gdf = gpd.read_file(polygons)
+        if gdf.crs.to_epsg() != 4326:
+            gdf = gdf.to_crs(epsg=4326)
+        gdf.to_parquet(_binary_path(polygons), index=False)
+        written.append(_binary_path(polygons))
+
+        display = gdf.copy()
+        display['geometry'] = gdf.geometry.simplify(tolerance, preserve_topology=True)
+        display.to_parquet(_binary_path(polygons, 'display'), index=False)
+        written.append(_binary_path(polygons, 'display'))
+
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert zone CSV/GeoJSON files to Parquet for faster loading")
+    parser.add_argument("systems", nargs="*", default=list(ZONE_SYSTEMS),
+                        help="zone systems to convert (default: all)")
+    parser.add_argument("--tolerance", type=float, default=DISPLAY_TOLERANCE_DEG,
+                        help="simplification tolerance in degrees for the display polygons")
+    args = parser.parse_args()
+
+    for data_choice in args.systems:
+        for path in convert_zone_data(data_choice, tolerance=args.tolerance):
+            print(f"Wrote {path}")
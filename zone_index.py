@@ -0,0 +1,66 @@
+import numpy as np
+import shapely
+
+# --- Zone polygon index ------------------------------------------------------
+#
+# The TTS zone layers have thousands of polygons (~5,800 for 2022), so testing
+# a point against every one of them, or scanning the GeoDataFrame for a zone's
+# row, is slow enough to notice on every Streamlit rerun. A ZoneIndex is built
+# once per zone system: an STRtree over the prepared polygons answers
+# point-in-zone lookups (one point or a whole batch), and a zone id -> row
+# dictionary answers geometry and region fetches directly.
+
+
+class ZoneIndex:
+    """
+    Spatial index over a zone GeoDataFrame (EPSG:4326) keyed by zone_col.
+    display_gdf optionally gives simplified polygons, in the same row order,
+    for geometry(zone, display=True).
+    """
+
+    def __init__(self, gdf, zone_col, region_col=None, display_gdf=None):
+        self.zone_col = zone_col
+        self.zone_ids = gdf[zone_col].tolist()
+        self.regions = gdf[region_col].to_numpy() if region_col in gdf.columns else None
+        self.geometries = np.asarray(gdf.geometry.values, dtype=object)
+        self.display_geometries = (np.asarray(display_gdf.geometry.values, dtype=object)
+                                   if display_gdf is not None else self.geometries)
+        # Prepared polygons make repeated contains checks much cheaper
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+        # First row wins for duplicated ids, as with gdf[gdf[zone_col] == zone].iloc[0]
+        self._rows = {}
+        for i, zone in enumerate(self.zone_ids):
+            self._rows.setdefault(zone, i)
+
+    def __len__(self):
+        return len(self.zone_ids)
+
+    def zones_at(self, lats, lons):
+        """
+        Zone id containing each lat/lon point, or None where a point falls
+        outside every zone. Where polygons overlap, the first one in the
+        layer wins.
+        """
+        points = np.atleast_1d(shapely.points(np.asarray(lons, dtype=np.float64),
+                                              np.asarray(lats, dtype=np.float64)))
+        point_idx, zone_idx = self.tree.query(points, predicate='within')
+        rows = np.full(len(points), len(self.zone_ids), dtype=np.int64)
+        np.minimum.at(rows, point_idx, zone_idx)
+        return [self.zone_ids[row] if row < len(self.zone_ids) else None for row in rows]
+
+    def zone_at(self, lat, lon):
+        """Zone id containing one point, or None"""
+        return self.zones_at([lat], [lon])[0]
+
+    def geometry(self, zone, display=False):
+        """Polygon of a zone (simplified if display), or None for an unknown id"""
+        row = self._rows.get(zone)
+        if row is None:
+            return None
+        return self.display_geometries[row] if display else self.geometries[row]
+
+    def region(self, zone):
+        """Region name of a zone, or None when unknown or the layer has no regions"""
+        row = self._rows.get(zone)
+        return None if row is None or self.regions is None else self.regions[row]